@@ -0,0 +1,8 @@
+# Offline benchmarks of the fetch, parse, cache and draw stages.
+#
+#   python -m benchmarks.run                      run all stages for 1, 100 and 5000 tickers
+#   python -m benchmarks.run -o new.json --compare old.json
+#   python -m benchmarks.record AAPL              re-record the fixtures (needs network access)
+#
+# Requests are served from the recorded pages in benchmarks/fixtures by a
+# replay transport, so the benchmarks never touch the network.
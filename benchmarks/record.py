@@ -0,0 +1,45 @@
+import sys, argparse
+from . import replay, scenarios
+
+__all__ = [
+    'record', 'main',
+]
+
+#================================================================
+# Fixture recorder
+#================================================================
+# Fetches the pages of the given tickers from the real providers, through the
+# same fetch stage as the application, and saves every response as a fixture
+# for replay.ReplayTransport. This is the only part of the benchmarks that
+# needs network access.
+def record(tickers, providers=None, directory=replay.FIXTURES_PATH, log=None):
+    """ Record the pages of 'tickers' and return the paths of the saved fixtures """
+    log       = log or sys.stderr
+    transport = replay.RecordingTransport(tickers, store=replay.fixture_store(directory))
+
+    # The real providers are rate limited and retried as in the application
+    with scenarios.benchmark_env(transport, providers, replay=False) as env:
+        for provider in env.providers.values():
+            transport.add_templates( provider._uctx.templates() )
+        for provider_id, ticker_symbol, _ in env.pmng.process_all(tickers, list(env.providers.keys()), progress=False):
+            print("Recorded {} from {}".format(ticker_symbol, provider_id), file=log)
+
+    return transport.recorded
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.record", description="Record provider pages as benchmark fixtures")
+    parser.add_argument("ticker_symbols", nargs="+", type=str,
+        help="ticker symbols to record, the last page recorded for a URL is kept")
+    parser.add_argument("-p", "--providers", type=str, default="zacks",
+        help="comma separated list of provider ids (default: %(default)s)")
+    parser.add_argument("-d", "--directory", type=str, default=replay.FIXTURES_PATH,
+        help="fixtures directory (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    tickers  = [ticker.upper() for ticker in args.ticker_symbols]
+    recorded = record(tickers, args.providers.split(",") if args.providers else None, args.directory)
+    print("Saved {} fixtures".format(len(recorded)), file=sys.stderr)
+    return 0 if recorded else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
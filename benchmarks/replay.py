@@ -0,0 +1,171 @@
+import os, io, re, json, time, hashlib, threading, urllib3
+from fini import util
+
+__all__ = [
+    'fixture_store', 'ReplayTransport', 'RecordingTransport', 'FIXTURES_PATH',
+]
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+#================================================================
+# Fixtures
+#================================================================
+# A fixture is one recorded response, stored as a JSON file under
+# fixtures/<host>/. It is keyed by the URL template it was recorded for, i.e.
+# the URL with the ticker symbol replaced by '{ticker}', so that the same
+# page is served for any ticker symbol:
+#
+#   {
+#       "url": "https://www.zacks.com/stock/quote/{ticker}?q={ticker}",
+#       "ticker": "AAPL",
+#       "recorded": "Nov 13, 2020 12:45 PM CET",
+#       "status": 200,
+#       "headers": {"Content-Type": "text/html; charset=utf-8"},
+#       "body": "..."
+#   }
+def _template_regex(template):
+    # Regular expression matching the URLs of a template. The ticker symbol
+    # is captured by the first '{ticker}', and must be the same at the others.
+    parts = re.escape(template).split(re.escape("{ticker}"))
+    pattern = parts[0]
+    for idx, part in enumerate(parts[1:]):
+        pattern += ("(?P<ticker>[^/?&#]+)" if idx == 0 else "(?P=ticker)") + part
+    return re.compile("^" + pattern + "$")
+
+class fixture_store:
+    def __init__(self, directory=FIXTURES_PATH):
+        self._directory = directory
+        self._lock      = threading.Lock()
+        self._fixtures  = []
+        self.load()
+
+    def load(self):
+        self._fixtures = []
+        if not os.path.isdir(self._directory):
+            return
+        for host in sorted(os.listdir(self._directory)):
+            host_path = os.path.join(self._directory, host)
+            if not os.path.isdir(host_path):
+                continue
+            for file_name in sorted(os.listdir(host_path)):
+                if file_name.endswith(".json"):
+                    with open(os.path.join(host_path, file_name), 'r') as fp:
+                        self._add(json.load(fp))
+
+    def _add(self, fixture):
+        fixture["body"] = fixture["body"].encode("utf-8")
+        self._fixtures = [f for f in self._fixtures if f[1]["url"] != fixture["url"]]
+        self._fixtures.append( (_template_regex(fixture["url"]), fixture) )
+
+    def find(self, URL):
+        """ Return the fixture recorded for URL, or None """
+        for regex, fixture in self._fixtures:
+            if regex.match(URL):
+                return fixture
+        return None
+
+    def templates(self):
+        return [fixture["url"] for _, fixture in self._fixtures]
+
+    def save(self, template, ticker, status, headers, body):
+        fixture = {
+            "url": template,
+            "ticker": ticker,
+            "recorded": util.time.get_datetime_now_as_string(),
+            "status": status,
+            "headers": headers,
+            "body": body,
+        }
+        host_path = os.path.join(self._directory, util.web.get_URL_host(template))
+        abs_path  = os.path.join(host_path, hashlib.sha1(template.encode("utf-8")).hexdigest()[:16] + ".json")
+        with self._lock:
+            os.makedirs(host_path, mode=0o755, exist_ok=True)
+            with open(abs_path, 'w') as fp:
+                json.dump(fixture, fp, indent=4)
+            self._add(dict(fixture))
+        return abs_path
+
+
+def _response(status, headers, body):
+    # A response that streams 'body' like one read from a connection
+    return urllib3.HTTPResponse(
+        body=io.BytesIO(body),
+        headers=headers,
+        status=status,
+        preload_content=False,
+    )
+
+#================================================================
+# Transports
+#================================================================
+# Both transports stand in for a urllib3 PoolManager. They are installed for
+# all requests with util.web.set_transport().
+class ReplayTransport:
+    """ Serve recorded fixtures instead of making requests
+
+    URLs without a fixture are answered with a 404. 'latency' is an optional
+    delay in seconds added to every request, to simulate a network round trip.
+    """
+    def __init__(self, store=None, latency=0.0):
+        self._store   = store or fixture_store()
+        self._latency = latency
+        self._lock    = threading.Lock()
+        self.requests = 0
+        self.misses   = []
+
+    def request(self, method, URL, headers=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+        if self._latency:
+            time.sleep(self._latency)
+
+        fixture = self._store.find(URL)
+        if fixture is None:
+            with self._lock:
+                self.misses.append(URL)
+            return _response(404, {}, b"")
+        return _response(fixture["status"], fixture["headers"], fixture["body"])
+
+
+class RecordingTransport:
+    """ Make requests through a real pool manager and save every successful
+    response as a fixture
+
+    'templates' are the URL templates of the providers, e.g. 
+    "https://www.zacks.com/stock/quote/{ticker}?q={ticker}". A response is 
+    saved for the template its URL matches, and for the ticker symbol in 
+    the place of '{ticker}'. More templates can be added with add_templates.
+    Only the ticker symbols in 'tickers' are recorded as such.
+    """
+    def __init__(self, tickers, store=None, http_pool_manager=None, templates=None):
+        self._tickers   = set(tickers)
+        self._store     = store or fixture_store()
+        self._http      = http_pool_manager or util.web.create_pool_manager()
+        self._templates = []
+        self.recorded   = []
+        self.add_templates(templates or [])
+
+    def add_templates(self, templates):
+        for template in templates:
+            if template not in [t for t, _ in self._templates]:
+                self._templates.append( (template, _template_regex(template)) )
+
+    def _template(self, URL):
+        # A URL without a template (or ticker symbol) is saved as it is
+        for template, regex in self._templates:
+            m = regex.match(URL)
+            if m and m.group("ticker") in self._tickers:
+                return template, m.group("ticker")
+        return URL, None
+
+    def request(self, method, URL, headers=None, **kwargs):
+        res = self._http.request(method, URL, headers=headers, preload_content=True, decode_content=True)
+        if res.status == 200:
+            template, ticker = self._template(URL)
+            content_type = res.headers.get("Content-Type", "text/html")
+            self.recorded.append( self._store.save(
+                template, ticker, res.status, { "Content-Type": content_type }, res.data.decode("utf-8", errors="replace")
+            ))
+        # The body has been decoded already
+        headers = { k: v for k, v in res.headers.items() if k.lower() not in ("content-encoding", "content-length") }
+        return _response(res.status, headers, res.data)
@@ -0,0 +1,140 @@
+import os, sys, json, time, platform, argparse, subprocess, statistics
+from fini.version import __version__
+from . import replay, scenarios
+
+__all__ = [
+    'run_benchmarks', 'compare_results', 'main',
+]
+
+#================================================================
+# Benchmark runner
+#================================================================
+# Runs every stage for every number of tickers, each repetition in a fresh
+# environment, with all requests served by a replay.ReplayTransport. The
+# results are written as JSON, keyed by "<name>/<number of tickers>", so that
+# two result files (e.g. before and after a change) can be compared with
+# --compare.
+DEFAULT_SIZES  = [1, 100, 5000]
+DEFAULT_STAGES = list(scenarios.STAGES.keys())
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+def _summary(times, num_tickers):
+    return {
+        "tickers": num_tickers,
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "per_ticker": min(times) / num_tickers,
+    }
+
+def run_benchmarks(stages=None, sizes=None, repeat=3, providers=None, cache_backend=None, cache_format=None, latency=0.0, log=None):
+    """ Run the benchmarks and return the results as a JSON serialisable dictionary """
+    stages = stages or DEFAULT_STAGES
+    sizes  = sizes or DEFAULT_SIZES
+    log    = log or sys.stderr
+
+    # Load the fixtures once, so that reading them is never timed
+    transport = replay.ReplayTransport(latency=latency)
+
+    results = {}
+    for stage in stages:
+        if stage not in scenarios.STAGES:
+            raise Exception("Unknown stage '{}'. Available stages: {}".format(stage, ", ".join(scenarios.STAGES)))
+        for num_tickers in sizes:
+            times = {}
+            for _ in range(repeat):
+                for name, elapsed in scenarios.run_stage(stage, transport, num_tickers, providers, cache_backend, cache_format).items():
+                    times.setdefault(name, []).append(elapsed)
+
+            for name, elapsed in times.items():
+                key = "{}/{}".format(name, num_tickers)
+                results[key] = _summary(elapsed, num_tickers)
+                print("{:<28s} {:>10.4f} s  {:>10.1f} us/ticker".format(key, results[key]["min"], results[key]["per_ticker"] * 1e6), file=log)
+
+    if transport.misses:
+        print("{} requests had no fixture, e.g. {}".format(len(transport.misses), transport.misses[0]), file=log)
+
+    return {
+        "fini_version": __version__,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "providers": providers,
+            "cache_backend": cache_backend,
+            "cache_format": cache_format,
+            "repeat": repeat,
+            "latency": latency,
+        },
+        "results": results,
+    }
+
+def compare_results(baseline, current, out=None):
+    """ Print the best time of every result in both 'baseline' and 'current',
+    with the ratio current / baseline """
+    out = out or sys.stderr
+    print("{:<28s} {:>12s} {:>12s} {:>8s}".format("benchmark", "baseline", "current", "ratio"), file=out)
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key, None)
+        if base is None:
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else float("inf")
+        print("{:<28s} {:>10.4f} s {:>10.4f} s {:>7.2f}x".format(key, base["min"], result["min"], ratio), file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Run the offline fini benchmarks")
+    parser.add_argument("-s", "--stages", type=str, default=",".join(DEFAULT_STAGES),
+        help="comma separated list of stages to run (default: %(default)s)")
+    parser.add_argument("-n", "--sizes", type=str, default=",".join(str(n) for n in DEFAULT_SIZES),
+        help="comma separated list of numbers of tickers (default: %(default)s)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+        help="number of repetitions of every benchmark; the best time is reported (default: %(default)s)")
+    parser.add_argument("-p", "--providers", type=str, default="zacks",
+        help="comma separated list of provider ids (default: %(default)s)")
+    parser.add_argument("-c", "--cache-backend", type=str, default=None,
+        help="cache backend to use: json, log or sqlite (default: the default setting)")
+    parser.add_argument("-f", "--cache-format", type=str, default=None,
+        help="cache file format to use: json or binary (default: the default setting)")
+    parser.add_argument("-l", "--latency", type=float, default=0.0,
+        help="simulated network latency per request in seconds (default: %(default)s)")
+    parser.add_argument("-o", "--output", type=str, default=None,
+        help="write the results to this file instead of stdout")
+    parser.add_argument("--compare", type=str, default=None,
+        help="results file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        stages=args.stages.split(","),
+        sizes=[int(n) for n in args.sizes.split(",")],
+        repeat=max(1, args.repeat),
+        providers=args.providers.split(",") if args.providers else None,
+        cache_backend=args.cache_backend,
+        cache_format=args.cache_format,
+        latency=args.latency,
+    )
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=4)
+    else:
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare, 'r') as fp:
+            compare_results(json.load(fp), results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import os, io, time, shutil, tempfile, contextlib
+from fini import managers, util
+from fini.managers import provider as provider_module
+
+__all__ = [
+    'STAGES', 'benchmark_env', 'make_tickers', 'run_stage',
+]
+
+#================================================================
+# Environment
+#================================================================
+class benchmark_env:
+    """ Settings, cache and provider managers in a temporary config directory
+
+    Requests go through 'transport' (e.g. a replay.ReplayTransport) while the
+    environment is open. With 'replay' set they are neither rate limited nor
+    retried, otherwise the default fetch settings are kept. The user's own 
+    config directory and the base config of the package are never touched.
+    """
+    def __init__(self, transport, providers=None, cache_backend=None, cache_format=None, replay=True):
+        self._transport     = transport
+        self._replay        = replay
+        self._provider_ids  = providers
+        self._cache_backend = cache_backend
+        self._cache_format  = cache_format
+        self.config_path    = None
+        self.smng           = None
+        self.cmng           = None
+        self.pmng           = None
+        self.providers      = {}
+
+    def __enter__(self):
+        self.config_path = tempfile.mkdtemp(prefix="fini-bench-")
+        self._previous   = util.web.set_transport(self._transport)
+
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                # The same steps as SettingsManager.initial_setup, without the base config
+                self.smng = managers.SettingsManager()
+                managers.SettingsManager.check_directories_and_files(self.config_path, 0o755)
+                self.smng._initialised = True
+                self.smng._interactive = False
+                self.smng.load_settings( os.path.join(self.config_path, "settings.json") )
+                self.smng.add_missing_default_settings()
+                self.smng.generate_settings_parent_keys()
+                if self._cache_backend:
+                    self.smng.set_setting("global.cache.backend", self._cache_backend)
+                if self._cache_format:
+                    self.smng.set_setting("global.cache.format", self._cache_format)
+
+                # Requests to the replay transport are neither rate limited
+                # nor retried
+                if self._replay:
+                    self.smng.set_setting("global.fetch.rate_per_host", 0.0)
+                    self.smng.set_setting("global.fetch.retries", 0)
+
+                self.cmng = managers.create_cache_manager(self.smng)
+                self.pmng = managers.ProviderManager(self.smng, cache_manager=self.cmng)
+            self.providers = self.pmng._select_providers(self._provider_ids)
+        except:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        # The settings only live as long as the temporary config directory
+        if self.cmng is not None:
+            self.cmng.close()
+        if self.smng is not None:
+            self.smng._dirty = False
+        util.web.set_transport(self._previous)
+        shutil.rmtree(self.config_path, ignore_errors=True)
+        return False
+
+
+def make_tickers(num_tickers):
+    # Synthetic ticker symbols. The replayed pages are the same for all of them.
+    return ["T{:05d}".format(idx) for idx in range(num_tickers)]
+
+def _timed(callback):
+    t0 = time.perf_counter()
+    callback()
+    return time.perf_counter() - t0
+
+#================================================================
+# Stages
+#================================================================
+# Every stage sets up what it needs in 'env', times the stage itself and
+# returns a dictionary of name: elapsed seconds. A stage may time several
+# related steps, e.g. saving and then loading the cache.
+def _fetch_jobs(env, tickers):
+    return [
+        util.web.fetch_job(URL, key=(ticker_symbol, parser, options), group=provider_id)
+        for provider_id, provider in env.providers.items()
+        for ticker_symbol in tickers
+        for URL, parser, options in provider._uctx(ticker_symbol)
+    ]
+
+def _fetch_stage(env, tickers):
+    # Bodies are downloaded through the same fetch stage as 'process_all',
+    # but not parsed
+    jobs    = _fetch_jobs(env, tickers)
+    fetcher = provider_module._create_fetcher(env.smng, env.providers)
+
+    def fetch():
+        for job, website_data, error in fetcher.fetch(jobs):
+            if error is not None:
+                raise error
+    return { "fetch": _timed(fetch) }
+
+def _parse_all(env, tickers, pages):
+    # Parse the pages of every ticker into a new data context, as
+    # '_consume_fetch_result' does. Returns { provider_id: { ticker: data_ctx } }.
+    parsed = {}
+    for provider_id, provider in env.providers.items():
+        parsed[provider_id] = {}
+        for ticker_symbol in tickers:
+            data_ctx = provider_module.provider_data_ctx()
+            data_ctx.load_data( provider._data.data_copy() )
+            res = None
+            for URL, parser, options in provider._uctx(ticker_symbol):
+                job = util.web.fetch_job(URL, group=provider_id)
+                res = provider._parse(job, pages[options['template']], parser, options['extractor'], data_ctx)
+            if res is not None:
+                data_ctx.new_record()
+            parsed[provider_id][ticker_symbol] = data_ctx
+    return parsed
+
+def _load_pages(env, tickers):
+    # The replayed body of every URL template, so that parsing is timed alone
+    pages = {}
+    for job in _fetch_jobs(env, tickers[:1]):
+        _, _, options = job.key
+        pages[options['template']] = util.web.get_URL_data(job.URL)
+    return pages
+
+def _parse_stage(env, tickers):
+    pages = _load_pages(env, tickers)
+    return { "parse": _timed(lambda: _parse_all(env, tickers, pages)) }
+
+def _cache_stage(env, tickers):
+    parsed = _parse_all(env, tickers, _load_pages(env, tickers))
+    for provider_id, provider in env.providers.items():
+        provider._ticker_data.resize(0)
+        for ticker_symbol, data_ctx in parsed[provider_id].items():
+            provider._ticker_data[ticker_symbol] = data_ctx
+
+    def save():
+        for provider in env.providers.values():
+            env.cmng.save_stock_data_many(provider, tickers)
+
+    def load():
+        for provider in env.providers.values():
+            env.cmng.load_stock_data_many(provider, tickers)
+
+    timings = { "cache_save": _timed(save) }
+    if hasattr(env.cmng, "flush"):
+        # With the write-behind cache 'save' only queues the data
+        timings["cache_flush"] = _timed(env.cmng.flush)
+    timings["cache_load"] = _timed(load)
+    return timings
+
+def _draw_stage(env, tickers):
+    # Every ticker is drawn in full, and then drawn again unchanged, which
+    # only diffs the frame against the previous one
+    parsed = _parse_all(env, tickers, _load_pages(env, tickers))
+    for provider_id, provider in env.providers.items():
+        provider._ticker_data.resize(0)
+        for ticker_symbol, data_ctx in parsed[provider_id].items():
+            provider._ticker_data[ticker_symbol] = data_ctx
+
+    timings = { "draw": 0.0, "redraw_unchanged": 0.0 }
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        for provider in env.providers.values():
+            for ticker_symbol in tickers:
+                timings["draw"] += _timed(lambda: provider.draw_view(pos_x=1, pos_y=1, ticker=ticker_symbol, redraw=True))
+                timings["redraw_unchanged"] += _timed(lambda: provider.draw_view(pos_x=1, pos_y=1, ticker=ticker_symbol))
+                out.seek(0)
+                out.truncate()
+    return timings
+
+def _process_stage(env, tickers):
+    # The whole pipeline: cache load, fetch, parse and cache save
+    def process():
+        for _ in env.pmng.process_all(tickers, list(env.providers.keys()), progress=False):
+            pass
+    return { "process_all": _timed(process) }
+
+STAGES = {
+    "fetch": _fetch_stage,
+    "parse": _parse_stage,
+    "cache": _cache_stage,
+    "draw": _draw_stage,
+    "process_all": _process_stage,
+}
+
+def run_stage(stage, transport, num_tickers, providers=None, cache_backend=None, cache_format=None):
+    """ Run one stage for 'num_tickers' tickers in a fresh environment and
+    return a dictionary of name: elapsed seconds """
+    tickers = make_tickers(num_tickers)
+    with benchmark_env(transport, providers, cache_backend, cache_format) as env:
+        return STAGES[stage](env, tickers)
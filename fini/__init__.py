@@ -1,4 +1,5 @@
 from . fini import FiniApp
+from . import batch
 
 def version():
     from . version import __str_version__
@@ -43,6 +44,6 @@ def test_managers(debug=True):
     import fini
     smng = fini.managers.SettingsManager(debug=debug)
     smng.initial_setup()
-    cmng = fini.managers.CacheManager(settings_manager=smng, debug=debug)
+    cmng = fini.managers.create_cache_manager(smng, debug=debug)
     wmng = fini.managers.WebviewManager(settings_manager=smng, debug=debug)
     return smng, cmng, wmng
@@ -0,0 +1,185 @@
+import sys, csv, json, time, contextlib
+from . import managers
+from . import util
+
+__all__ = [
+    'read_tickers', 'flatten_data', 'run_batch', 'run_watch', 'main',
+]
+
+#================================================================
+# Headless batch mode
+#================================================================
+# Ticker symbols are processed by all (or the selected) providers in one
+# shared fetch stage, and a record is written for every (provider, ticker)
+# pair as soon as it is complete. Records are written to stdout as JSON Lines
+# or CSV. Anything else the application prints (setup messages, errors) goes
+# to stderr, so that stdout can be piped straight into other tools.
+OUTPUT_FORMATS = ("jsonl", "csv")
+
+def read_tickers(ticker_symbols=None, stdin=None):
+    """ Return the list of ticker symbols to process
+
+    Symbols are taken from 'ticker_symbols', where '-' stands for the symbols
+    read from stdin. Without any symbols they are read from stdin. Symbols
+    may be separated by whitespace or commas. Duplicates are dropped and the
+    symbols are upper-cased.
+    """
+    stdin   = stdin or sys.stdin
+    symbols = list(ticker_symbols or ["-"])
+
+    tickers = []
+    for symbol in symbols:
+        if symbol == "-":
+            tickers.extend( stdin.read().replace(",", " ").split() )
+        else:
+            tickers.extend( symbol.replace(",", " ").split() )
+
+    return list(dict.fromkeys( ticker.upper() for ticker in tickers ))
+
+def flatten_data(data, parent=None, record=-1):
+    """ Return a flat dictionary of dotted path: value of data
+
+    Fields that hold one value per record give their value at index 'record',
+    by default the last one, i.e. the value fetched most recently. Not every
+    list starts out empty, so the last value is not always at the index of
+    the active record.
+    """
+    flat = {}
+    for key, value in data.items():
+        path = parent + "." + key if parent else key
+        if type(value) is dict:
+            flat.update( flatten_data(value, path, record) )
+        elif type(value) is list:
+            flat[path] = value[record] if value else None
+        elif path not in ("active_record", "num_records"):
+            flat[path] = value
+    return flat
+
+
+class _jsonl_writer:
+    # One JSON object per (provider, ticker)
+    def __init__(self, out):
+        self._out = out
+
+    def write(self, provider_id, ticker, fields):
+        record = { 'provider': provider_id, 'ticker': ticker }
+        record.update(fields)
+        self._out.write( json.dumps(record, default=str) + "\n" )
+
+
+class _csv_writer:
+    # Providers have different fields, so the CSV output is in long format:
+    # one row per (provider, ticker, field)
+    def __init__(self, out):
+        self._writer = csv.writer(out)
+        self._writer.writerow( ["provider", "ticker", "field", "value"] )
+
+    def write(self, provider_id, ticker, fields):
+        self._writer.writerows( [provider_id, ticker, path, value] for path, value in fields.items() )
+
+
+def _create_writer(output_format, out):
+    if output_format not in OUTPUT_FORMATS:
+        raise Exception("Unknown output format '{}'. Available formats: {}".format(output_format, ", ".join(OUTPUT_FORMATS)))
+    return _jsonl_writer(out) if output_format == "jsonl" else _csv_writer(out)
+
+@contextlib.contextmanager
+def _headless_managers(debug=False, startup_time=False):
+    # Set up the settings, cache and provider managers without any
+    # interaction, with everything they print sent to stderr. With 
+    # 'startup_time' set the time taken by each startup phase is printed 
+    # once the managers are ready.
+    with contextlib.redirect_stdout(sys.stderr):
+        smng = managers.SettingsManager(debug=debug)
+        smng.initial_setup(interactive=False)
+        util.time.startup.mark("settings")
+        cmng = managers.create_cache_manager(smng, debug=debug)
+        try:
+            pmng = managers.ProviderManager(smng, cache_manager=cmng, debug=debug)
+            util.time.startup.mark("managers")
+            if startup_time:
+                print(util.time.startup.report())
+            yield smng, pmng
+        finally:
+            cmng.close()
+            # Providers add their settings on first use. These are saved here
+            # rather than on exit, when the interpreter may be shutting down.
+            if smng._dirty:
+                smng.save_settings()
+
+def run_batch(tickers, providers=None, output_format="jsonl", out=None, chunk_size=500, debug=False, startup_time=False):
+    """ Process tickers without any interaction and write the results to 'out'
+
+    'providers' is an optional list of provider ids. The tickers are processed
+    'chunk_size' at a time, which bounds the number of ticker data contexts
+    held in memory. With 'startup_time' set the time taken by each startup
+    phase is printed to stderr. Returns the number of records written.
+    """
+    out    = out or sys.stdout
+    writer = _create_writer(output_format, out)
+
+    num_records = 0
+    with _headless_managers(debug, startup_time) as (smng, pmng):
+        for idx in range(0, len(tickers), chunk_size):
+            results = pmng.process_all(tickers[idx:idx+chunk_size], providers, progress=False)
+            for provider_id, ticker, data_ctx in results:
+                writer.write( provider_id, ticker, flatten_data(data_ctx.data_ref()) )
+                out.flush()
+                num_records += 1
+
+    return num_records
+
+def run_watch(tickers=None, providers=None, output_format="jsonl", out=None, debug=False, startup_time=False):
+    """ Keep the watchlist refreshed and write every refreshed record to 'out'
+
+    'tickers' are added to the persisted watchlist first. Refreshes are
+    scheduled by a managers.RefreshScheduler until the process is interrupted.
+    """
+    out    = out or sys.stdout
+    writer = _create_writer(output_format, out)
+
+    def write(provider_id, ticker, data_ctx):
+        writer.write( provider_id, ticker, flatten_data(data_ctx.data_ref()) )
+        out.flush()
+
+    with _headless_managers(debug, startup_time) as (smng, pmng):
+        scheduler = managers.RefreshScheduler(smng, pmng, on_refresh=write, debug=debug)
+        if tickers:
+            scheduler.add(tickers, providers)
+        if not scheduler.watchlist():
+            print("The watchlist is empty", file=sys.stderr)
+            return
+
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.stop()
+
+def main(args):
+    """ Entry point of the 'fini' script in batch mode
+
+    'args' are the parsed command line arguments: 'ticker_symbols',
+    'format', 'providers', 'watch', 'stats', 'startup_time' and 'verbose'.
+    """
+    providers = args.providers.split(",") if args.providers else None
+    try:
+        if args.watch:
+            # The watchlist is refreshed with the given tickers added, if any
+            tickers = read_tickers(args.ticker_symbols) if args.ticker_symbols else []
+            run_watch(tickers, providers, output_format=args.format, debug=args.verbose, startup_time=args.startup_time)
+            return 0
+
+        tickers = read_tickers(args.ticker_symbols)
+        if not tickers:
+            print("No ticker symbols given", file=sys.stderr)
+            return 1
+
+        run_batch(tickers, providers, output_format=args.format, debug=args.verbose, startup_time=args.startup_time)
+        return 0
+    finally:
+        if args.stats:
+            util.stats.collector.export(args.stats)
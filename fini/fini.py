@@ -13,6 +13,7 @@ class FiniApp():
 
         # Clear screen
         util.screen.clear_screen()
+        util.time.startup.mark("screen")
 
         # Initialise cmd parser
         self._init_cmd_parser()
@@ -20,6 +21,7 @@ class FiniApp():
         # Create and initialise a SettingsManager object
         self._smng = managers.SettingsManager()
         self._smng.initial_setup()
+        util.time.startup.mark("settings")
 
         # # Create and initialise a ProvidersManager object
         # self._pmng = managers.ProvidersManager()
@@ -30,8 +32,11 @@ class FiniApp():
             history=util.prompt.FileHistory( self._smng.get_cmd_history_file() )
             )
 
+        util.time.startup.mark("prompt")
+
         #Display the app's welcome message
         util.screen.app_welcome_message()
+        util.time.startup.mark("welcome")
 
     def __del__(self):
 
@@ -57,6 +62,8 @@ class FiniApp():
             help="display the application's settings or set particular settings")
         self._cmd_parser.add_argument("-t", "--term", nargs='*', metavar=('list', 'TERM'),
             help="use '-t list' to display available terms;\nuse '-t TERM' to display the term's definition and other details")
+        self._cmd_parser.add_argument("--stats", nargs='*', metavar=('export', 'FILE'),
+            help="display the timings of the processing stages;\nuse '--stats export FILE' to write them to FILE as JSON and '--stats reset' to clear them")
         self._cmd_parser.add_argument("-c", "--cls", action="store_true", default=False, 
             help='clear screen')
         self._cmd_parser.add_argument("-q", "--quit", action="store_true", default=False,
@@ -115,6 +122,17 @@ class FiniApp():
                         for term in terms:
                             glossary.info(term)
 
+                #======================================
+                # Statistics
+                #======================================
+                if args.stats is not None:
+                    if not args.stats:
+                        print(util.stats.collector.report())
+                    elif args.stats[0] == "export" and len(args.stats) == 2:
+                        print("Statistics written to '{}'".format(util.stats.collector.export(args.stats[1])))
+                    elif args.stats[0] == "reset":
+                        util.stats.collector.reset()
+
                 #======================================
                 # Help
                 #======================================
@@ -3,3 +3,4 @@ from . cache import *
 from . import pprinter
 from . provider import *
 from . wview import *
+from . scheduler import *
\ No newline at end of file
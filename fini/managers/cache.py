@@ -1,14 +1,56 @@
-import os, json
+import os, sys, time, struct, atexit, threading
+from .. import util
 
 __all__ = [
-    'CacheManager'    
+    'CacheManager',
+    'LogCacheManager',
+    'SQLiteCacheManager',
+    'WriteBehindCacheManager',
+    'create_cache_manager',
 ]
 
+def create_cache_manager(settings_manager, debug=False):
+    # Create the cache manager selected by the 'global.cache.backend' setting.
+    # With 'global.cache.write_behind' set, it is wrapped in a 
+    # WriteBehindCacheManager.
+    backend = settings_manager.get_setting("global.cache.backend") or "json"
+    if backend == "json":
+        cmng = CacheManager(settings_manager, debug=debug)
+    elif backend == "log":
+        cmng = LogCacheManager(settings_manager, debug=debug)
+    elif backend == "sqlite":
+        cmng = SQLiteCacheManager(settings_manager, debug=debug)
+    else:
+        raise Exception("Unknown cache backend '{}'".format(backend))
+
+    if settings_manager.get_setting("global.cache.write_behind"):
+        cmng = WriteBehindCacheManager(cmng, settings_manager, debug=debug)
+    return cmng
+
+def _write_atomic(abs_path, write, mode='w'):
+    # Write to a temporary file first and move it in place, so that a crash
+    # never leaves a partially written file behind. 'write' is called with 
+    # the open temporary file.
+    tmp_path = "{}.{}.tmp".format(abs_path, threading.get_ident())
+    try:
+        with open(tmp_path, mode) as fp:
+            write(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, abs_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 class CacheManager:
     def __init__(self, settings_manager, debug=False):
         self._smng = settings_manager
         self._debug = debug
         self._cache = {}
+        # With 'global.cache.format' set to "binary" the cache files are .fbin
+        # files (see util.serial) instead of .json files
+        self._binary = settings_manager.get_setting("global.cache.format") == "binary"
 
     def load_stock_data(self, provider, ticker_symbol):
         # Check to see if the stock data for this ticker symbol and provider is available.
@@ -18,31 +60,68 @@ class CacheManager:
 
         if os.path.exists(abs_path):
             return self._load_stock_data(abs_path)
-        else:
-            self._create_stock_data_file(provider, dir_path, abs_path)
-            return self._load_stock_data(abs_path)
 
-    def save_stock_data(self, provider, ticker_symbol):
-        dir_path, abs_path = self._get_stock_data_paths(provider, ticker_symbol)
+        # A cache file in the other format is converted the first time the 
+        # ticker is loaded
+        old_path = self._find_other_format_file(abs_path)
+        if old_path is not None:
+            data = self._load_stock_data(old_path)
+            self._save_stock_data(abs_path, data)
+            _remove_file(old_path)
+            return data
 
-        if os.path.exists(abs_path):
-            self._save_stock_data(abs_path, provider.stock_data_ref() )
-        else:
-            self._create_stock_data_file(provider, dir_path, abs_path)
-            self._save_stock_data(abs_path, provider.stock_data_ref() )
+        self._create_stock_data_file(provider, dir_path, abs_path)
+        return self._load_stock_data(abs_path)
+
+    def load_stock_data_many(self, provider, ticker_symbols):
+        # Returns a dictionary of ticker_symbol: data
+        return { ticker_symbol: self.load_stock_data(provider, ticker_symbol) for ticker_symbol in ticker_symbols }
+
+    def save_stock_data(self, provider, ticker_symbol):
+        self._save_ticker_data(provider, ticker_symbol, provider.stock_data_ref())
     
     def save_stock_data_dict(self, provider, ticker_symbol):
         for ticker_symbol in provider._ticker_data.keys():
-            dir_path, abs_path = self._get_stock_data_paths(provider, ticker_symbol)
+            self._save_ticker_data(provider, ticker_symbol, provider.stock_data_dict_ref(ticker_symbol))
 
-            if os.path.exists(abs_path):
-                self._save_stock_data(abs_path, provider.stock_data_dict_ref(ticker_symbol) )
-            else:
+    def save_stock_data_many(self, provider, ticker_symbols):
+        # Save the data of several tickers of a provider, e.g. a whole 'process' batch
+        for ticker_symbol in ticker_symbols:
+            self._save_ticker_data(provider, ticker_symbol, provider.stock_data_dict_ref(ticker_symbol))
+
+    def save_stock_data_items(self, provider, ticker_data):
+        # Save a list of (ticker_symbol, data) of a provider
+        for ticker_symbol, data in ticker_data:
+            self._save_ticker_data(provider, ticker_symbol, data)
+
+    def close(self):
+        pass
+
+    def _save_ticker_data(self, provider, ticker_symbol, data):
+        dir_path, abs_path = self._get_stock_data_paths(provider, ticker_symbol)
+
+        old_path = None
+        if not os.path.exists(abs_path):
+            old_path = self._find_other_format_file(abs_path)
+            if old_path is None:
                 self._create_stock_data_file(provider, dir_path, abs_path)
-                self._save_stock_data(abs_path, provider.stock_data_dict_ref(ticker_symbol) )
+        self._save_stock_data(abs_path, data)
+
+        # The saved data replaces the cache file in the other format
+        if old_path is not None:
+            _remove_file(old_path)
 
     def _format_ticker_file(self, provider_id, ticker_symbol):
-        return provider_id + "_" + ticker_symbol.upper() + ".json"
+        return provider_id + "_" + ticker_symbol.upper() + (".fbin" if self._binary else ".json")
+
+    def _find_other_format_file(self, abs_path):
+        # The .json or .fbin cache file of the same ticker, if there is one
+        base_path = os.path.splitext(abs_path)[0]
+        for ext in (".fbin", ".json"):
+            path = base_path + ext
+            if path != abs_path and os.path.exists(path):
+                return path
+        return None
 
     def _create_stock_data_absolute_path(self, provider_id, ticker_symbol=None):
         stocks_dir = self._smng.get_stocks_path()
@@ -58,11 +137,12 @@ class CacheManager:
         return dir_path, abs_path
 
     def _create_stock_data_file(self, provider, dir_path, abs_path):
-        # Check if directory exists. If not create it.
+        # Check if directory exists. If not create it. The write-behind thread
+        # may be creating it at the same time.
         access_rights = 0o755
         if not os.path.exists(dir_path):
             try:
-                os.mkdir(dir_path, access_rights)
+                os.makedirs(dir_path, access_rights, exist_ok=True)
             except OSError:
                 raise Exception ("Creation of {} failed".format(dir_path))
                 
@@ -73,9 +153,7 @@ class CacheManager:
         # Check if file exists. If not create it.
         if not os.path.exists(abs_path):
             try:
-                empty_data = provider.stock_data_copy()
-                with open(abs_path, 'w') as json_file:
-                    json.dump(empty_data, json_file)
+                self._save_stock_data(abs_path, provider.stock_data_copy())
 
             except:
                 raise Exception ("Creation of {} failed".format(abs_path))
@@ -86,10 +164,563 @@ class CacheManager:
 
 
     def _load_stock_data(self, abs_path):
-        with open(abs_path, 'r') as json_file:
-            return json.load(json_file)
+        # Either format is read, whatever the extension
+        with open(abs_path, 'rb') as fp:
+            payload = fp.read()
+        if payload.startswith(util.serial.FBIN_MAGIC):
+            return util.serial.loads_fbin(payload)
+        return util.serial.loads(payload)
     
     def _save_stock_data(self, abs_path, data):
-        with open(abs_path, 'w') as json_file:
-            json.dump(data, json_file)
+        if abs_path.endswith(".fbin"):
+            payload = util.serial.dumps_fbin(data)
+        else:
+            payload = util.serial.dumps(data)
+        _write_atomic(abs_path, lambda fp: fp.write(payload), 'wb')
+
+def _remove_file(abs_path):
+    # Another thread may have removed the file already
+    try:
+        os.remove(abs_path)
+    except FileNotFoundError:
+        pass
+
+
+#================================================================
+# Change records
+#================================================================
+# The log and SQLite backends store a ticker's data as a sequence of records,
+# each an object of one of two kinds:
+#
+#   {"base": {...}}                       the complete data dictionary
+#   {"append": {path: [...]}, "set": {path: value}}
+#                                         the changes since the previous record
+#
+# Saving a refresh therefore only writes the values that were appended to the
+# time-varying lists and the scalars that changed. Records are encoded with
+# util.serial.pack when 'global.cache.format' is "binary" and as JSON 
+# otherwise; util.serial.unpack reads both, so a cache may hold a mix of them.
+
+def _create_snapshot(data):
+    # What has been written to the cache for each leaf path. Only the length
+    # of list values is kept, since lists only ever grow by appending.
+    snapshot = {}
+    for path in util.misc.DictUtil.get_leaf_paths(data):
+        value = util.misc.DictUtil.get_by_path(data, path)
+        if type(value) is list:
+            snapshot[path] = (list, len(value))
+        else:
+            snapshot[path] = (None, util.serial.dumps(value))
+    return snapshot
+
+def _create_change_record(snapshot, data):
+    # Returns None if nothing has changed since the snapshot was taken
+    if snapshot is None:
+        return {"base": data}
+
+    paths = util.misc.DictUtil.get_leaf_paths(data)
+    if len(paths) != len(snapshot):
+        return {"base": data}
+
+    append = {}
+    changed = {}
+    for path in paths:
+        if path not in snapshot:
+            return {"base": data}
+
+        value = util.misc.DictUtil.get_by_path(data, path)
+        kind, saved = snapshot[path]
+        if type(value) is list and kind is list:
+            if len(value) < saved:
+                return {"base": data}
+            elif len(value) > saved:
+                append[path] = value[saved:]
+        elif type(value) is list or kind is list:
+            return {"base": data}
+        elif util.serial.dumps(value) != saved:
+            changed[path] = value
+
+    if not append and not changed:
+        return None
+    
+    return {"append": append, "set": changed}
+
+def _replay_records(records):
+    # Rebuild the data dictionary from a sequence of change records. Returns
+    # the data and the number of change records since the last base record.
+    data = {}
+    num_changes = 0
+    for record in records:
+        if "base" in record:
+            data = record["base"]
+            num_changes = 0
+            continue
+
+        for path, values in record.get("append", {}).items():
+            value = util.misc.DictUtil.get_by_path(data, path)
+            if type(value) is list:
+                value.extend(values)
+            else:
+                util.misc.DictUtil.add_by_path(data, path, list(values))
+        for path, value in record.get("set", {}).items():
+            util.misc.DictUtil.add_by_path(data, path, value)
+        num_changes += 1
+
+    return data, num_changes
+
+
+#================================================================
+# Append-only log cache
+#================================================================
+# Each <provider>_<TICKER>.log file is a sequence of change records, each one
+# prefixed by its length as a 4-byte big-endian unsigned integer. The data 
+# dictionary is rebuilt by replaying the log the first time a ticker is loaded,
+# and the log is compacted back into a single base record by a background 
+# thread once it holds 'global.cache.compact_after' change records.
+_LOG_HEADER = struct.Struct(">I")
+
+class LogCacheManager(CacheManager):
+    def __init__(self, settings_manager, debug=False):
+        super().__init__(settings_manager, debug=debug)
+        self._lock = threading.Lock()
+        self._file_locks = {}
+        self._state = {}
+        self._compactions = {}
+
+    def load_stock_data(self, provider, ticker_symbol):
+        dir_path, abs_path = self._get_stock_data_paths(provider, ticker_symbol)
+        with self._get_file_lock(abs_path):
+            if not os.path.exists(abs_path):
+                self._create_stock_data_log(provider, dir_path, abs_path)
+
+            data, num_changes = self._replay_log(abs_path)
+            self._state[abs_path] = (_create_snapshot(data), num_changes)
+            return data
+
+    def close(self):
+        # Wait for any running compaction to finish
+        for thread in list(self._compactions.values()):
+            thread.join()
+
+    def _format_ticker_file(self, provider_id, ticker_symbol):
+        return provider_id + "_" + ticker_symbol.upper() + ".log"
+
+    def _get_file_lock(self, abs_path):
+        with self._lock:
+            if abs_path not in self._file_locks:
+                self._file_locks[abs_path] = threading.Lock()
+            return self._file_locks[abs_path]
+
+    def _create_stock_data_log(self, provider, dir_path, abs_path):
+        # Start the log from an existing JSON cache file if there is one, 
+        # otherwise from the empty provider data.
+        file_path = self._find_other_format_file(abs_path)
+        if file_path is not None:
+            data = super()._load_stock_data(file_path)
+        else:
+            data = provider.stock_data_copy()
+
+        if not os.path.exists(dir_path):
+            try:
+                os.makedirs(dir_path, 0o755)
+            except OSError:
+                raise Exception ("Creation of {} failed".format(dir_path))
+
+        self._write_log(abs_path, [ {"base": data} ])
+
+        if self._debug:
+            print ("Successfully created {}".format(abs_path))
+
+    def _save_ticker_data(self, provider, ticker_symbol, data):
+        dir_path, abs_path = self._get_stock_data_paths(provider, ticker_symbol)
+        with self._get_file_lock(abs_path):
+            if not os.path.exists(abs_path):
+                self._create_stock_data_log(provider, dir_path, abs_path)
+                self._state.pop(abs_path, None)
+
+            if abs_path not in self._state:
+                _, num_changes = self._replay_log(abs_path)
+                self._state[abs_path] = (None, num_changes)
+
+            snapshot, num_changes = self._state[abs_path]
+            record = _create_change_record(snapshot, data)
+            if record is None:
+                return
+
+            with open(abs_path, 'ab') as log_file:
+                log_file.write(self._encode_record(record))
+
+            num_changes = 0 if "base" in record else num_changes + 1
+            self._state[abs_path] = (_create_snapshot(data), num_changes)
+
+        compact_after = self._smng.get_setting("global.cache.compact_after") or 0
+        if compact_after and num_changes >= compact_after:
+            self._compact_in_background(abs_path)
+
+    def _encode_record(self, record):
+        payload = util.serial.pack(record) if self._binary else util.serial.dumps(record)
+        return _LOG_HEADER.pack(len(payload)) + payload
 
+    def _read_records(self, abs_path):
+        # Returns the decoded records and the offset of the end of the last 
+        # complete one. A record cut short by a crash is ignored.
+        records = []
+        with open(abs_path, 'rb') as log_file:
+            buffer = log_file.read()
+
+        offset = 0
+        while offset + _LOG_HEADER.size <= len(buffer):
+            length, = _LOG_HEADER.unpack_from(buffer, offset)
+            start = offset + _LOG_HEADER.size
+            if start + length > len(buffer):
+                break
+            try:
+                records.append(util.serial.unpack(buffer[start:start + length]))
+            except ValueError:
+                break
+            offset = start + length
+
+        return records, offset, len(buffer)
+
+    def _replay_log(self, abs_path):
+        records, offset, size = self._read_records(abs_path)
+        if offset != size:
+            # Drop the incomplete tail, so that new records follow a complete one
+            with open(abs_path, 'r+b') as log_file:
+                log_file.truncate(offset)
+
+        return _replay_records(records)
+
+    def _write_log(self, abs_path, records):
+        _write_atomic(abs_path, lambda log_file: log_file.write(b"".join(self._encode_record(record) for record in records)), 'wb')
+
+    def _compact_in_background(self, abs_path):
+        with self._lock:
+            thread = self._compactions.get(abs_path, None)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._compact, args=(abs_path,), daemon=True)
+            self._compactions[abs_path] = thread
+        thread.start()
+
+    def _compact(self, abs_path):
+        with self._get_file_lock(abs_path):
+            data, _ = self._replay_log(abs_path)
+            self._write_log(abs_path, [ {"base": data} ])
+            snapshot, _ = self._state.get(abs_path, (None, 0))
+            self._state[abs_path] = (snapshot, 0)
+
+        if self._debug:
+            print ("Compacted {}".format(abs_path))
+
+
+#================================================================
+# SQLite cache
+#================================================================
+# All stock data is kept in a single 'stocks.db' database in the cache 
+# directory. Every save adds a row with a change record for each ticker, 
+# indexed by (ticker, provider, recorded_at), so that a whole batch of tickers
+# is loaded with one query and saved in one transaction. The database is in 
+# WAL mode so that readers do not block the writer, and every thread uses its
+# own connection.
+_SQLITE_MAX_VARIABLES = 500
+
+class SQLiteCacheManager(CacheManager):
+    def __init__(self, settings_manager, debug=False):
+        super().__init__(settings_manager, debug=debug)
+        self._db_path = os.path.join(settings_manager.get_cache_path(), "stocks.db")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._state = {}
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "ticker TEXT NOT NULL, "
+            "provider TEXT NOT NULL, "
+            "recorded_at REAL NOT NULL, "
+            "record TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS records_ticker_provider_recorded_at ON records (ticker, provider, recorded_at)")
+
+    def load_stock_data(self, provider, ticker_symbol):
+        return self.load_stock_data_many(provider, [ticker_symbol])[ticker_symbol]
+
+    def load_stock_data_many(self, provider, ticker_symbols):
+        provider_id = provider.provider_id()
+        symbols = { ticker_symbol.upper(): ticker_symbol for ticker_symbol in ticker_symbols }
+
+        records = { ticker: [] for ticker in symbols }
+        conn = self._connect()
+        tickers = list(symbols)
+        for idx in range(0, len(tickers), _SQLITE_MAX_VARIABLES):
+            chunk = tickers[idx:idx + _SQLITE_MAX_VARIABLES]
+            rows = conn.execute(
+                "SELECT ticker, record FROM records WHERE provider = ? AND ticker IN ({}) "
+                "ORDER BY ticker, recorded_at, id".format(",".join("?" * len(chunk))),
+                [provider_id] + chunk
+            )
+            for ticker, record in rows:
+                records[ticker].append(util.serial.unpack(record))
+
+        # Tickers that are not in the database yet start from their .json or
+        # .fbin cache file if there is one, otherwise from the empty provider
+        # data.
+        new_data = {}
+        for ticker, ticker_records in records.items():
+            if not ticker_records:
+                _, abs_path = self._get_stock_data_paths(provider, ticker)
+                file_path = abs_path if os.path.exists(abs_path) else self._find_other_format_file(abs_path)
+                if file_path is not None:
+                    new_data[ticker] = self._load_stock_data(file_path)
+                else:
+                    new_data[ticker] = provider.stock_data_copy()
+                records[ticker] = [ {"base": new_data[ticker]} ]
+
+        with self._lock:
+            if new_data:
+                self._write_records(provider_id, { ticker: {"base": data} for ticker, data in new_data.items() }, replace=new_data.keys())
+
+            stock_data = {}
+            for ticker, ticker_records in records.items():
+                data, num_changes = _replay_records(ticker_records)
+                self._state[(provider_id, ticker)] = (_create_snapshot(data), num_changes)
+                stock_data[symbols[ticker]] = data
+
+        return stock_data
+
+    def save_stock_data_dict(self, provider, ticker_symbol):
+        self.save_stock_data_many(provider, list(provider._ticker_data.keys()))
+
+    def save_stock_data_many(self, provider, ticker_symbols):
+        self._save_many(provider, [ (t, provider.stock_data_dict_ref(t)) for t in ticker_symbols ])
+
+    def save_stock_data_items(self, provider, ticker_data):
+        self._save_many(provider, ticker_data)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _save_ticker_data(self, provider, ticker_symbol, data):
+        self._save_many(provider, [ (ticker_symbol, data) ])
+
+    def _encode_record(self, record):
+        # Binary records are stored as BLOBs and JSON records as TEXT
+        if self._binary:
+            return util.serial.pack(record)
+        return util.serial.dumps(record).decode("utf-8")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # sqlite3 is only imported when this backend is used
+            import sqlite3
+            conn = sqlite3.connect(self._db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _save_many(self, provider, ticker_data):
+        provider_id = provider.provider_id()
+        compact_after = self._smng.get_setting("global.cache.compact_after") or 0
+
+        with self._lock:
+            records = {}
+            replace = []
+            state = {}
+            for ticker_symbol, data in ticker_data:
+                ticker = ticker_symbol.upper()
+                snapshot, num_changes = self._state.get((provider_id, ticker), (None, 0))
+
+                # Once a ticker holds 'compact_after' change records they are 
+                # replaced by a single base record.
+                if compact_after and num_changes + 1 >= compact_after:
+                    snapshot = None
+
+                record = _create_change_record(snapshot, data)
+                if record is None:
+                    continue
+
+                records[ticker] = record
+                if "base" in record:
+                    replace.append(ticker)
+                    state[ticker] = (_create_snapshot(data), 0)
+                else:
+                    state[ticker] = (_create_snapshot(data), num_changes + 1)
+
+            if records:
+                self._write_records(provider_id, records, replace=replace)
+                for ticker, ticker_state in state.items():
+                    self._state[(provider_id, ticker)] = ticker_state
+
+    def _write_records(self, provider_id, records, replace=()):
+        # Add a record per ticker in one transaction. The rows of the tickers 
+        # in 'replace' are removed first, since their record is a base record.
+        conn = self._connect()
+        recorded_at = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for ticker in replace:
+                conn.execute("DELETE FROM records WHERE ticker = ? AND provider = ?", (ticker, provider_id))
+            conn.executemany(
+                "INSERT INTO records (ticker, provider, recorded_at, record) VALUES (?, ?, ?, ?)",
+                [ (ticker, provider_id, recorded_at, self._encode_record(record)) for ticker, record in records.items() ]
+            )
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+
+#================================================================
+# Write-behind cache
+#================================================================
+# Saves are queued instead of written straight away, so that processing never
+# waits for the disk. A background thread writes the queued data through the
+# wrapped cache manager once 'global.cache.flush_interval_sec' has passed since
+# the first save of a batch, all tickers of a provider at once. A ticker that
+# is saved again before it was written is only written once, with its latest
+# data. Loads see the queued data.
+#
+# The queued data is a copy-on-write copy of the ticker's data (see
+# provider_data_ctx.data_copy), so queueing a save costs nothing and the data
+# can be written while the ticker is processed again.
+class WriteBehindCacheManager:
+    def __init__(self, cache_manager, settings_manager, debug=False):
+        self._cmng       = cache_manager
+        self._smng       = settings_manager
+        self._debug      = debug
+        self._cond       = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._pending    = {}
+        self._flushing   = {}
+        self._thread     = None
+        self._running    = False
+
+    def cache_manager(self):
+        # The wrapped cache manager
+        return self._cmng
+
+    def load_stock_data(self, provider, ticker_symbol):
+        return self.load_stock_data_many(provider, [ticker_symbol])[ticker_symbol]
+
+    def load_stock_data_many(self, provider, ticker_symbols):
+        provider_id = provider.provider_id()
+        stock_data  = {}
+        with self._cond:
+            for ticker_symbol in ticker_symbols:
+                key   = (provider_id, ticker_symbol.upper())
+                entry = self._pending.get(key, None) or self._flushing.get(key, None)
+                if entry is not None:
+                    stock_data[ticker_symbol] = entry[1]
+
+        to_load = [t for t in ticker_symbols if t not in stock_data]
+        if to_load:
+            stock_data.update( self._cmng.load_stock_data_many(provider, to_load) )
+        return stock_data
+
+    def save_stock_data(self, provider, ticker_symbol):
+        self._queue(provider, [ (ticker_symbol, provider.stock_data_copy()) ])
+
+    def save_stock_data_dict(self, provider, ticker_symbol):
+        self.save_stock_data_many(provider, list(provider._ticker_data.keys()))
+
+    def save_stock_data_many(self, provider, ticker_symbols):
+        self._queue(provider, [ (t, provider.stock_data_dict_copy(t)) for t in ticker_symbols ])
+
+    def save_stock_data_items(self, provider, ticker_data):
+        # The data must not be modified after it has been queued
+        self._queue(provider, ticker_data)
+
+    def pending(self):
+        # Number of (provider, ticker) entries waiting to be written
+        with self._cond:
+            return len(self._pending) + len(self._flushing)
+
+    def flush(self):
+        """ Write all queued data now """
+        self._flush_pending()
+
+    def close(self):
+        # Write whatever is still queued and stop the writer thread
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._running = False
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+            atexit.unregister(self.close)
+        self._flush_pending()
+        self._cmng.close()
+
+    def _queue(self, provider, ticker_data):
+        provider_id = provider.provider_id()
+        with self._cond:
+            was_empty = not self._pending
+            for ticker_symbol, data in ticker_data:
+                self._pending[(provider_id, ticker_symbol.upper())] = (provider, data, ticker_symbol)
+            self._start()
+            if was_empty:
+                self._cond.notify_all()
+
+    def _start(self):
+        # Must be called with the condition held
+        if self._running:
+            return
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # Queued data is written if the application exits without closing
+        atexit.register(self.close)
+
+    def _flush_interval(self):
+        interval = self._smng.get_setting("global.cache.flush_interval_sec")
+        return 1.0 if interval is None else interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                # Let the rest of the batch, and repeated saves, arrive
+                self._cond.wait(self._flush_interval())
+
+            self._flush_pending()
+
+        # e.g. the SQLite connection of this thread
+        self._cmng.close()
+
+    def _flush_pending(self):
+        # The write lock is taken before the queue, so that batches are 
+        # written in the order they were taken off the queue
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._flushing = {}
+
+    def _write(self, batch):
+        providers = {}
+        for (provider_id, _), (provider, data, ticker_symbol) in batch.items():
+            providers.setdefault(provider_id, (provider, []))[1].append( (ticker_symbol, data) )
+
+        for provider_id, (provider, ticker_data) in providers.items():
+            try:
+                with util.stats.collector.timer("cache_flush", provider_id):
+                    self._cmng.save_stock_data_items(provider, ticker_data)
+            except Exception as e:
+                print("Could not save the cache data of {} ticker(s) of '{}': {}".format(len(ticker_data), provider_id, e), file=sys.stderr)
+            else:
+                util.stats.collector.count("cache_writes", len(ticker_data), provider_id)
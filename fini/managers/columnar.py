@@ -0,0 +1,236 @@
+import math
+
+# NumPy is optional and only imported once the columnar layout is used
+numpy = None
+
+__all__ = [
+    'columnar_available',
+    'record_table',
+    'to_columnar',
+    'to_dict',
+]
+
+#================================================================
+# Columnar record storage
+#================================================================
+# The time-varying fields of a provider data dictionary are lists that grow
+# by one value per record. A 'record_table' keeps each of these lists as a
+# typed NumPy array instead, plus a timestamp per record, so that the history
+# of a field takes a few bytes per record and can be processed with vectorised
+# NumPy operations. Arrays grow by doubling their capacity.
+#
+# Integer and float fields are stored as int64 and float64 arrays, strings in
+# a unicode array that is widened when a longer string arrives. A column falls
+# back to an object array if it receives values of mixed types. Missing (None)
+# values are tracked by a boolean mask.
+_INITIAL_CAPACITY = 16
+
+def _import_numpy():
+    global numpy
+    if numpy is None:
+        import numpy as _numpy
+        numpy = _numpy
+    return numpy
+
+def columnar_available():
+    try:
+        _import_numpy()
+    except ImportError:
+        return False
+    return True
+
+_KINDS = {
+    int: "int",
+    float: "float",
+    str: "str",
+}
+
+class record_column:
+    def __init__(self, table, values=None):
+        self._table  = table
+        self._size   = 0
+        self._values = None
+        self._mask   = numpy.zeros(_INITIAL_CAPACITY, dtype=bool)
+        self._kind   = None
+
+        for value in values or []:
+            self.append(value)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, idx):
+        if type(idx) is slice:
+            return [self[i] for i in range(*idx.indices(self._size))]
+
+        if idx < 0:
+            idx += self._size
+        if idx < 0 or idx >= self._size:
+            raise IndexError("record_column index out of range")
+
+        if self._mask[idx]:
+            return None
+        if self._kind == "object":
+            return self._values[idx]
+        return self._values[idx].item()
+
+    def __iter__(self):
+        for idx in range(self._size):
+            yield self[idx]
+
+    def append(self, value):
+        self._reserve(self._size + 1)
+        if value is None:
+            self._mask[self._size] = True
+        else:
+            self._store(self._size, value)
+        self._size += 1
+
+    def pop(self):
+        """ Remove the last value and return it """
+        value = self[-1]
+        self._size -= 1
+        self._mask[self._size] = False
+        return value
+
+    def values(self):
+        """ Return a NumPy view of the values in this column """
+        if self._values is None:
+            return numpy.empty(0)
+        return self._values[:self._size]
+
+    def missing(self):
+        """ Return a NumPy view of the mask of missing values """
+        return self._mask[:self._size]
+
+    def tolist(self):
+        return list(self)
+
+    def nbytes(self):
+        return (self._values.nbytes if self._values is not None else 0) + self._mask.nbytes
+
+    def _reserve(self, size):
+        capacity = len(self._mask)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+
+        self._mask = numpy.resize(self._mask, capacity)
+        self._mask[self._size:] = False
+        if self._values is not None:
+            values = numpy.empty(capacity, dtype=self._values.dtype)
+            values[:self._size] = self._values[:self._size]
+            self._values = values
+
+    def _store(self, idx, value):
+        kind = _KINDS.get(type(value), "object")
+        if self._values is None:
+            self._kind   = kind
+            self._values = self._create_array(kind, value, len(self._mask))
+        elif kind != self._kind:
+            # Integers and floats share a float64 column, anything else
+            # falls back to an object column.
+            if {kind, self._kind} == {"int", "float"}:
+                self._promote("float", numpy.float64)
+            elif self._kind != "object":
+                self._promote("object", object)
+        elif kind == "str" and len(value) > self._values.dtype.itemsize // 4:
+            self._values = self._values.astype("U{}".format(2 * len(value)))
+
+        self._values[idx] = value
+
+    def _promote(self, kind, dtype):
+        values = numpy.empty(len(self._values), dtype=dtype)
+        if dtype is object:
+            values[:self._size] = [self[i] for i in range(self._size)]
+        else:
+            values[:self._size] = self._values[:self._size]
+        self._kind   = kind
+        self._values = values
+
+    @staticmethod
+    def _create_array(kind, value, capacity):
+        if kind == "int":
+            return numpy.zeros(capacity, dtype=numpy.int64)
+        elif kind == "float":
+            return numpy.full(capacity, math.nan, dtype=numpy.float64)
+        elif kind == "str":
+            return numpy.zeros(capacity, dtype="U{}".format(max(len(value), 1)))
+        else:
+            return numpy.empty(capacity, dtype=object)
+
+
+class record_table:
+    def __init__(self):
+        _import_numpy()
+        self._columns    = {}
+        self._size       = 0
+        self._timestamps = numpy.full(_INITIAL_CAPACITY, math.nan, dtype=numpy.float64)
+
+    def add_column(self, path, values=None):
+        self._columns[path] = record_column(self, values)
+        return self._columns[path]
+
+    def column(self, path):
+        return self._columns[path]
+
+    def columns(self):
+        return self._columns
+
+    def add_record(self, timestamp=math.nan):
+        """ Record the time at which a new record was added """
+        if self._size == len(self._timestamps):
+            timestamps = numpy.full(2 * len(self._timestamps), math.nan, dtype=numpy.float64)
+            timestamps[:self._size] = self._timestamps
+            self._timestamps = timestamps
+        self._timestamps[self._size] = timestamp
+        self._size += 1
+
+    def num_records(self):
+        return self._size
+
+    def timestamps(self):
+        """ Return a NumPy view of the record timestamps. Records loaded from
+        the dictionary layout have no timestamp (NaN). """
+        return self._timestamps[:self._size]
+
+    def nbytes(self):
+        return self._timestamps.nbytes + sum(column.nbytes() for column in self._columns.values())
+
+
+def to_columnar(data):
+    """ Convert a provider data dictionary to the columnar layout
+
+    Returns a copy of data in which every list value is replaced by a column
+    of a new record_table, and the record_table.
+    """
+    table = record_table()
+    for _ in range(data.get("num_records", 0)):
+        table.add_record()
+    return _to_columnar(data, table, None), table
+
+def _to_columnar(data, table, parent):
+    columnar_data = {}
+    for key, value in data.items():
+        path = parent + "." + key if parent else key
+        if type(value) is dict:
+            columnar_data[key] = _to_columnar(value, table, path)
+        elif type(value) is list:
+            columnar_data[key] = table.add_column(path, value)
+        else:
+            columnar_data[key] = value
+    return columnar_data
+
+def to_dict(columnar_data):
+    """ Convert a dictionary in the columnar layout back to plain lists """
+    data = {}
+    for key, value in columnar_data.items():
+        if type(value) is dict:
+            data[key] = to_dict(value)
+        elif type(value) is record_column:
+            data[key] = value.tolist()
+        else:
+            data[key] = value
+    return data
@@ -2,10 +2,11 @@ import re, operator, ast
 from colorama import Fore, Back, Style, Cursor
 from functools import reduce  # forward compatibility for Python 3
 from .. import util
+from . import columnar
 
 
 __all__ = [
-    "pos", "Fore", "Back", "Style", "Cursor"
+    "pos", "Fore", "Back", "Style", "Cursor", "draw_plan", "screen_frame"
 ]
 
 # Common
@@ -144,30 +145,127 @@ def _convert_value_str_to_type(value):
         return value
     return value
 
-def _get_var(data, var_name):
-    var = util.misc.DictUtil.get_by_path(data, var_name)
-    if type(var) is list:
-        if var:
-            return var[data["active_record"]]
+def _create_accessor(var_name):
+    # Resolve the path of a variable once. List values (and columns) give the
+    # value of the active record, or 0.0 if the record has no value for it.
+    keys = var_name.split(".")
+    def accessor(data):
+        try:
+            var = data
+            for key in keys:
+                var = var[key]
+        except (KeyError, TypeError):
+            return None
+
+        if type(var) is list or type(var) is columnar.record_column:
+            try:
+                value = var[data["active_record"]]
+            except IndexError:
+                return 0.0
+            return value if value is not None else 0.0
         else:
-            return 0.0
-    else:
-        return var
-
-def _create_draw_lambda(rel_x, rel_y, fmt_color, fmt_str, line_data, var_name):
-    if not var_name and not line_data:
-        return lambda x, y, data: print( pos(x+rel_x, y+rel_y) + Style.RESET_ALL + fmt_color( None ) + fmt_str)
-    elif line_data and not var_name:
-        return lambda x, y, data: print( pos(x+rel_x, y+rel_y) + Style.RESET_ALL + fmt_color( None ) + fmt_str.format( var=line_data ) )
-    elif var_name and not line_data:
-        return lambda x, y, data: print( pos(x+rel_x, y+rel_y) + Style.RESET_ALL + fmt_color( _get_var(data, var_name) ) + fmt_str.format( var=_get_var(data, var_name) ) )
-        # if var_name[-2:] == "[]":
-        #     return lambda x, y, data: print( pos(x+rel_x, y+rel_y) + Style.RESET_ALL + fmt_color( util.misc.DictUtil.get_by_path(data, var_name[:-2])[data["active_record"]] ) + fmt_str.format( var=util.misc.DictUtil.get_by_path(data, var_name[:-2])[data["active_record"]] ) )
-        # else:
-        #     return lambda x, y, data: print( pos(x+rel_x, y+rel_y) + Style.RESET_ALL + fmt_color( util.misc.DictUtil.get_by_path(data, var_name)) ) + fmt_str.format( var=util.misc.DictUtil.get_by_path(data, var_name) ) )
-    else:
-        raise Exception("Unknown string format!")
+            return var
+    return accessor
+
+class draw_plan:
+    """ Compiled draw commands of a panel
+
+    Every subline of the panel is a segment at a fixed offset from the panel
+    position. Variable paths are resolved to accessors and constant colours
+    are evaluated when the plan is compiled, and segments without variables
+    are formatted once. 'render' appends the output of the panel to
+    a list of strings, so that a whole view can be written at once.
+    """
+    def __init__(self):
+        self._segments = []
+
+    def __len__(self):
+        return len(self._segments)
+
+    def add_segment(self, rel_x, rel_y, color, fmt_str, line_data=None, var_name=None):
+        # 'color' is either a string or a callable that returns the colour for
+        # the value of the variable
+        if var_name and line_data:
+            raise Exception("Unknown string format!")
+
+        if not var_name:
+            text = fmt_str.format( var=line_data ) if line_data else fmt_str
+            if type(color) is str:
+                self._segments.append( (rel_x, rel_y, Style.RESET_ALL + color, None, text, None) )
+            else:
+                self._segments.append( (rel_x, rel_y, None, color, text, None) )
+        else:
+            self._segments.append( (rel_x, rel_y, None, color, fmt_str, _create_accessor(var_name)) )
+
+    def render(self, x, y, data, out):
+        for px, py, style, text in self.segments(x, y, data):
+            out.append( pos(px, py) + style + text )
+
+    def segments(self, x, y, data):
+        """ Yield the (x, y, style, text) of every segment drawn at x, y """
+        for rel_x, rel_y, style, color, fmt_str, accessor in self._segments:
+            if style is not None:
+                yield x+rel_x, y+rel_y, style, fmt_str
+            elif accessor is None:
+                yield x+rel_x, y+rel_y, Style.RESET_ALL + color( None ), fmt_str
+            else:
+                value = accessor(data)
+                if type(color) is not str:
+                    color = color( value )
+                yield x+rel_x, y+rel_y, Style.RESET_ALL + color, fmt_str.format( var=value )
+
+
+class screen_frame:
+    """ The segments last drawn on the screen by a view
+
+    'draw' compares the new segments of the view with those of the previous
+    frame and only appends output for what changed. Within a segment whose 
+    style is unchanged only the span between the common prefix and suffix of
+    the old and new text is written. Text that became shorter is padded with
+    spaces, and segments that are no longer drawn are blanked. The frame is 
+    only valid as long as nothing else has drawn over the view.
+    """
+    def __init__(self):
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def draw(self, segments, out):
+        cells = {}
+        for x, y, style, text in segments:
+            cells[(x, y)] = (style, text)
+            prev = self._cells.get((x, y))
+            if prev is None or prev[0] != style:
+                if prev is not None and len(prev[1]) > len(text):
+                    text += " " * (len(prev[1]) - len(text))
+                out.append( pos(x, y) + style + text )
+                continue
+
+            prev_text = prev[1]
+            if prev_text == text:
+                continue
+            if len(prev_text) > len(text):
+                text += " " * (len(prev_text) - len(text))
+                prev_text = prev_text[:len(text)]
+            else:
+                prev_text = prev_text.ljust(len(text))
+            if prev_text == text:
+                continue
+
+            start = 0
+            while text[start] == prev_text[start]:
+                start += 1
+            end = len(text)
+            while text[end-1] == prev_text[end-1]:
+                end -= 1
+            out.append( pos(x + start, y) + style + text[start:end] )
+
+        for (x, y), (style, text) in self._cells.items():
+            if (x, y) not in cells:
+                out.append( pos(x, y) + Style.RESET_ALL + " " * len(text) )
 
+        self._cells = cells
 
 def validate_panel(panel_name, panel, debug=False):
     regex_sline_pattern = "(?:@(.*)@)([.]*[^{]*)(\{.*\})?(.[^}]*)?"
@@ -281,6 +379,13 @@ def validate_view(view_name, view, debug=False):
     view["width"]  = x_right  - x_left
     view["height"] = y_bottom - y_top 
 
+def _resolve_color(fmt, color_fmt):
+    # Colours without a condition do not depend on the value, so they are
+    # evaluated once
+    if color_fmt in fmt._condition:
+        return fmt._settings[color_fmt]
+    return fmt._settings[color_fmt]( None )
+
 def generate_draw_commands(provider_id, panel, fmt, debug=False):
     regex_sline_pattern = "(?:@(.*)@)([.]*[^{]*)(\{.*\})?(.[^}]*)?"
     regex_variable_pattern = "\{(.*):([<>\^]?)(\d+(?:\.\d+)?)?(.*)\}"
@@ -300,7 +405,7 @@ def generate_draw_commands(provider_id, panel, fmt, debug=False):
     if not num_lines:
         raise Exception("Panel num_lines is not set! Cannot continiue. Make sure you run 'validate_panel' first.")
 
-    draw_commands = []
+    draw_commands = draw_plan()
     rel_y = 0
     for line in lines.values():
         line_fmt  = line['str_fmt']
@@ -366,10 +471,7 @@ def generate_draw_commands(provider_id, panel, fmt, debug=False):
             # Create draw command and add to list of draw commands
             if debug:
                 print("DEBUG: rel_x:{:<3} rel_y:{:<3}, fmt:{}".format(rel_x, rel_y, fmt_str))
-            cmd = _create_draw_lambda(rel_x, rel_y, fmt._settings[color_fmt], fmt_str, line_data[sidx], var_name)
-
-            # Append draw command to the list
-            draw_commands.append(cmd)
+            draw_commands.add_segment(rel_x, rel_y, _resolve_color(fmt, color_fmt), fmt_str, line_data[sidx], var_name)
 
             # Update relative x position for next subline
             var_w  = _convert_value_str_to_type( var_width.split(".")[0] if var_width else "0" )
@@ -383,8 +485,7 @@ def generate_draw_commands(provider_id, panel, fmt, debug=False):
         if rel_x < width:
             space_to_add = width - rel_x
             trailing_str = " "*space_to_add
-            cmd = _create_draw_lambda(rel_x, rel_y, fmt._settings[prev_color_fmt], trailing_str, None, None)
-            draw_commands.append(cmd)
+            draw_commands.add_segment(rel_x, rel_y, _resolve_color(fmt, prev_color_fmt), trailing_str)
         
         # Update relative y position for next subline
         rel_y += 1
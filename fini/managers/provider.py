@@ -1,10 +1,13 @@
-import os, operator, json, copy
+import os, sys, operator, json, copy, time, shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from abc import ABC, abstractmethod
 from functools import reduce  # forward compatibility for Python 3
 from tqdm import tqdm
 from . import pprinter
 from . import settings
 from . import wview
+from . import columnar
 from .. import util
 
 __all__ = ['ProviderManager']
@@ -18,20 +21,31 @@ class url_ctx:
         self._count    = 0
         self._ticker   = ""
 
-    def add_url(self, url, parser_callback):
+    def add_url(self, url, parser_callback, end_marker=None, max_bytes=None, extractor=None):
+        # 'end_marker' and 'max_bytes' let a parser declare that it only needs
+        # the first part of a page. The download stops as soon as the marker 
+        # text has arrived or max_bytes bytes have been read.
+        # 'extractor' is an optional util.extract.FieldExtractor. The fields it
+        # finds are stored in the data context before the parser is called.
+        # The parser returns None if it has not set any field, and anything 
+        # else otherwise, which adds a new record to the ticker's data.
         exists = False
         for eurl in self._url:
             if url == eurl[0]:
                 exists = True
         
         if not exists:
-            self._url.append( (url, parser_callback) )
+            self._url.append( (url, parser_callback, {'end_marker': end_marker, 'max_bytes': max_bytes, 'extractor': extractor, 'template': url}) )
             self._num_urls += 1
 
     def __call__(self, ticker):
         self._ticker = ticker
         return self
 
+    def templates(self):
+        # The URL formats, with '{ticker}' in place of the ticker symbol
+        return [options['template'] for _, _, options in self._url]
+
     def __iter__(self):
         return self 
 
@@ -43,22 +57,50 @@ class url_ctx:
             self._count = 0
             raise StopIteration
         
-        url    = self._url[self._count][0].format(ticker=self._ticker)
-        parser = self._url[self._count][1]
+        url     = self._url[self._count][0].format(ticker=self._ticker)
+        parser  = self._url[self._count][1]
+        options = self._url[self._count][2]
         self._count += 1
 
-        return url, parser
+        return url, parser, options
+
+def _list_paths(data, parent=None):
+    paths = []
+    for key, value in data.items():
+        path = parent + "." + key if parent else key
+        if type(value) is dict:
+            paths.extend( _list_paths(value, path) )
+        elif type(value) is list:
+            paths.append(path)
+    return paths
 
 class provider_data_ctx:
-    def __init__(self, debug=False):
+    # The data is copy-on-write: a context may share its dictionaries and lists
+    # with other contexts (e.g. the provider's empty data, or the data it was
+    # loaded from). A container is only copied the first time it is modified,
+    # so loading and copying data costs nothing until a field changes, and then
+    # only the containers on the path to that field are copied.
+    def __init__(self, debug=False, columnar_layout=False):
+        # With 'columnar_layout' set (and NumPy installed), the list values of 
+        # loaded data are kept as typed columns of a columnar.record_table.
         self._debug    = debug
+        self._columnar = columnar_layout and columnar.columnar_available()
+        self._table    = None
+        self._owned    = {}
+        self._appended = []
+        self._lists    = None
         self._data     = {
             "num_records": 0,
             "active_record": 0,
         }
+        self._own(self._data)
 
     def add_entry(self, path, value):
+        if self._table is not None and type(value) is list:
+            value = self._table.add_column(path, value)
+        self._materialise( util.misc.DictUtil._parse_items(path)[:-1] )
         util.misc.DictUtil.add_by_path(self._data, path, value)
+        self._lists = None
     
     def get_data(self, path):
         return util.misc.DictUtil.get_by_path(self._data, path)
@@ -66,24 +108,190 @@ class provider_data_ctx:
     def set_data(self, path, new_value):
         dict_value = util.misc.DictUtil.get_by_path(self._data, path)
         if dict_value is not None:
-            if type(dict_value) is list:
-                dict_value.append(new_value)
+            if type(dict_value) is list or type(dict_value) is columnar.record_column:
+                self._materialise( util.misc.DictUtil._parse_items(path) ).append(new_value)
+                self._appended.append(path)
             elif type(dict_value) is dict:
                 raise Exception("Cannot deal with dictionary values yet!")
             else:
+                self._materialise( util.misc.DictUtil._parse_items(path)[:-1] )
                 util.misc.DictUtil.set_by_path(self._data, path, new_value)
         else:
             raise Exception("Key '{}' does not exist!". format(path))
 
+    def new_record(self, timestamp=None):
+        # Mark the values appended since the previous record as a new record.
+        # A list value that was not found on any page of the record gets None,
+        # so that all lists stay aligned with the records.
+        appended = set(self._appended)
+        for path in self._list_paths():
+            if path not in appended:
+                self._materialise( util.misc.DictUtil._parse_items(path) ).append(None)
+        self._materialise([])
+        self._data["num_records"] += 1
+        self._data["active_record"] = self._data["num_records"] - 1
+        if self._table is not None:
+            self._table.add_record(timestamp if timestamp is not None else time.time())
+        self._appended = []
+
+    def discard_record(self):
+        # Remove the values appended since the previous record, e.g. when some 
+        # of the pages of a record could not be fetched, so that the list 
+        # values stay aligned with the records
+        for path in reversed(self._appended):
+            self._materialise( util.misc.DictUtil._parse_items(path) ).pop()
+        self._appended = []
+
+    def appended_paths(self):
+        # The paths of the list values appended to since the previous record,
+        # once for every appended value
+        return list(self._appended)
+
     def data_ref(self):
+        # In the columnar layout this is a copy of the data with plain lists
+        if self._table is not None:
+            return columnar.to_dict(self._data)
         return self._data
     
     def data_copy(self):
-        return json.loads( json.dumps(self._data) )
+        # The copy shares all its containers with this context, which will copy 
+        # them before modifying them from now on. The copy must not be modified 
+        # in place; load it into another provider_data_ctx to modify it.
+        if self._table is not None:
+            return columnar.to_dict(self._data)
+        self._owned = {}
+        return self._data
+
+    def record_table(self):
+        # The columnar.record_table of this data, or None if not in the columnar layout
+        return self._table
 
     def load_data(self, data):
-        # Thread safe alternative to copy.deepcopy
-        self._data = json.loads( json.dumps(data) )
+        # 'data' is shared, not copied. It is not modified by this context.
+        if self._columnar:
+            self._data, self._table = columnar.to_columnar(data)
+        else:
+            self._data  = data
+            self._owned = {}
+        self._appended = []
+        self._lists    = None
+
+    def _list_paths(self):
+        # The paths of all list values (or columns), found once per data layout
+        if self._lists is None:
+            if self._table is not None:
+                self._lists = list(self._table.columns())
+            else:
+                self._lists = _list_paths(self._data)
+        return self._lists
+
+    def _own(self, container):
+        self._owned[id(container)] = container
+
+    def _is_owned(self, container):
+        return self._owned.get(id(container), None) is container
+
+    def _materialise(self, items):
+        # Copy the shared containers along the path 'items', so that they can be
+        # modified in place. Returns the last container on the path.
+        if self._table is not None:
+            return util.misc.DictUtil.get_by_path(self._data, items) if items else self._data
+
+        if not self._is_owned(self._data):
+            self._data = dict(self._data)
+            self._own(self._data)
+
+        node = self._data
+        for key in items:
+            child = node.get(key, None)
+            if type(child) is not dict and type(child) is not list:
+                break
+            if not self._is_owned(child):
+                child = dict(child) if type(child) is dict else list(child)
+                node[key] = child
+                self._own(child)
+            node = child
+        return node
+
+
+class ticker_data_store:
+    # The provider_data_ctx of each ticker symbol, in least recently used order.
+    # Once there are more than 'max_entries' tickers (0 means no limit), the 
+    # least recently used ones are evicted. 'on_evict' is called with the 
+    # ticker symbol before it is removed, so that its data can be saved. Pinned
+    # tickers, e.g. those of the batch being processed, are never evicted.
+    def __init__(self, max_entries=0, on_evict=None):
+        self._max_entries = max_entries
+        self._on_evict    = on_evict
+        self._entries     = OrderedDict()
+        self._pinned      = set()
+        self._hits        = 0
+        self._misses      = 0
+        self._evictions   = 0
+
+    def __contains__(self, ticker_symbol):
+        return ticker_symbol in self._entries
+
+    def __getitem__(self, ticker_symbol):
+        self._entries.move_to_end(ticker_symbol)
+        return self._entries[ticker_symbol]
+
+    def __setitem__(self, ticker_symbol, data_ctx):
+        self._entries[ticker_symbol] = data_ctx
+        self._entries.move_to_end(ticker_symbol)
+        self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def items(self):
+        return self._entries.items()
+
+    def lookup(self, ticker_symbol):
+        # Same as 'in', but counted as a cache hit or miss
+        if ticker_symbol in self._entries:
+            self._hits += 1
+            self._entries.move_to_end(ticker_symbol)
+            return True
+        self._misses += 1
+        return False
+
+    def resize(self, max_entries):
+        self._max_entries = max_entries
+        self._evict()
+
+    def pin(self, ticker_symbols):
+        self._pinned.update(ticker_symbols)
+
+    def unpin_all(self):
+        self._pinned.clear()
+        self._evict()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+        }
+
+    def _evict(self):
+        if not self._max_entries:
+            return
+
+        for ticker_symbol in list(self._entries.keys()):
+            if len(self._entries) <= self._max_entries:
+                break
+            if ticker_symbol in self._pinned:
+                continue
+            if self._on_evict:
+                self._on_evict(ticker_symbol)
+            del self._entries[ticker_symbol]
+            self._evictions += 1
 
 
 class ProviderBase(ABC):
@@ -95,8 +303,17 @@ class ProviderBase(ABC):
 
         # Internal variables
         self._provider_id = self.provider_id()
-        self._ticker_data = {}
+        self._ticker_data = ticker_data_store(on_evict=self._evict_ticker)
+        # ticker_symbol: { URL: (validator, appended paths, parser result) } of
+        # the pages parsed for a committed record. The pages of a ticker are
+        # forgotten when its data is evicted.
+        self._parsed_pages = {}
+        self._fetch_errors = []
+        self._unsaved_tickers = []
+        self._http = None
+        self._http_config = None
         self._cmd = {}
+        self._frames = {}
         self._pos_x = 0
         self._pos_y = 1
         self._debug = debug
@@ -112,6 +329,7 @@ class ProviderBase(ABC):
         self.generate_URL_ctx(self._uctx, self)
         self.generate_data(self._data)
         self.generate_settings(self._opts)
+        self._generate_base_settings(self._opts)
         self.generate_draw_ctx(self._dctx)
         self.generate_webview_ctx(self._wctx)
         
@@ -121,8 +339,14 @@ class ProviderBase(ABC):
         # Validate views
         self._validate_views()
 
-        # Create webviews for this provider
-        self._create_webviews()
+        # The webviews of this provider are created on first use, see
+        # '_create_webviews'
+        self._webviews_created = False
+
+    def _generate_base_settings(self, opts):
+        # Settings common to all providers
+        opts.add_setting("fetch.max_in_flight", 8)
+        opts.add_setting("fetch.pool_maxsize", 4)
 
     def _validate_panels(self):
         for panel_name, panel in self._dctx._panels.items():
@@ -140,8 +364,12 @@ class ProviderBase(ABC):
         return new_value
 
     def _create_webviews(self):
-        for webview_data in self._wctx("create"):
-            self._wmng.process(webview_data)
+        # Creating a webview starts the webview process, so this is deferred
+        # until the webviews of this provider are first updated
+        if self._webviews_created or self._wmng is None or not self._wctx._webviews:
+            return
+        self._wmng.submit_many( list(self._wctx("create")) )
+        self._webviews_created = True
 
     def debug(self, debug=True):
         self._debug       = debug
@@ -206,14 +434,29 @@ class ProviderBase(ABC):
         return util.misc.DictUtil.set_by_path(self._dctx._views, item, value)
 
     def get_terminal_size(self):
-        x, y = os.get_terminal_size()
+        x, y = shutil.get_terminal_size()
         return x, y
 
     def reset_pos(self):
         self._pos_x = 0
         self._pos_y = 0
-
-    def draw_view(self, view_name=None, pos_x=None, pos_y=None):
+        self.invalidate_frames()
+
+    def invalidate_frames(self):
+        """ Forget the frames drawn so far, so that the next draw of every view
+        is a full redraw. Call this after the screen was cleared or drawn over. """
+        self._frames = {}
+
+    def _draw_data(self, ticker=None):
+        # Data to draw: that of 'ticker' if given, otherwise the provider's data
+        if ticker is not None:
+            return self._ticker_data[ticker]._data
+        return self._data._data
+
+    def draw_view(self, view_name=None, pos_x=None, pos_y=None, ticker=None, redraw=False):
+        # The last frame of each (view, ticker) is kept. When the view is drawn
+        # again at the same position only the changed segments are written,
+        # unless 'redraw' is set.
         # Get first view in dictionary if no view_name is provided
         if not view_name:
             view_name = next( iter( self._dctx._views.keys() ) )
@@ -223,7 +466,7 @@ class ProviderBase(ABC):
             raise Exception("View {} does not exist!".format(view_name))
         
         # Get terminal size
-        term_x, term_y = os.get_terminal_size()
+        term_x, term_y = self.get_terminal_size()
 
         # Get view
         view = self._dctx._views[view_name]
@@ -238,14 +481,37 @@ class ProviderBase(ABC):
             util.screen.move_cursor( term_y - 4 )
             print(util.screen.Style.RESET_ALL + util.screen.pos(0, 0))
             cpos_y = 1
-
-        # Draw each panel in the view
-        for panel_name, panel in view["panels"].items():
-            width  = panel["width"]
-            height = panel["height"]
-            ppos_x  = panel["pos_x"]
-            ppos_y  = panel["pos_y"]
-            self.draw_panel(panel_name, width, height, cpos_x + ppos_x, cpos_y + ppos_y)
+            self.invalidate_frames()
+
+        # A frame is only reused at the same position and terminal size. The 
+        # frames of other views drawn over the same rows are no longer valid.
+        key    = (view_name, ticker)
+        origin = (cpos_x, cpos_y, term_x, term_y)
+        frame_origin, frame = self._frames.get(key, (None, None))
+        if redraw or frame_origin != origin + (view["height"],):
+            frame = pprinter.screen_frame()
+        rows = range(cpos_y, cpos_y + view["height"])
+        self._frames = { k: v for k, v in self._frames.items() if not _rows_overlap(v[0], rows) }
+        self._frames[key] = (origin + (view["height"],), frame)
+
+        # Diff the segments of every panel in the view against the last frame
+        # and write the changes at once
+        with util.stats.collector.timer("draw", self._provider_id, view_name):
+            data = self._draw_data(ticker)
+            segments = []
+            for panel_name, panel in view["panels"].items():
+                if not self._dctx._panels.get(panel_name, None):
+                    raise Exception("Panel {} does not exist!".format(panel_name))
+                ppos_x  = panel["pos_x"]
+                ppos_y  = panel["pos_y"]
+                segments.extend( self._cmd[panel_name].segments(cpos_x + ppos_x, cpos_y + ppos_y, data) )
+
+            # The cursor always ends on the line after the view, as after a 
+            # full draw, even when only a few segments (or none) have changed
+            out = []
+            frame.draw(segments, out)
+            out.append( util.screen.pos(0, cpos_y + view["height"]) )
+            _write(out, end="")
 
         cpos_x = 0
         cpos_y += view["height"]
@@ -255,17 +521,23 @@ class ProviderBase(ABC):
 
         return cpos_x, cpos_y
     
-    def draw_panel(self, panel_name, width, height, pos_x, pos_y):
+    def draw_panel(self, panel_name, width, height, pos_x, pos_y, data=None, out=None, ticker=None):
+        # The panel is appended to 'out' if given, otherwise it is written 
+        # straight away.
         # Check to see if panel exists
         if not self._dctx._panels.get(panel_name, None):
             raise Exception("Panel {} does not exist!".format(panel_name))
 
-        # Get drawing commands for this panel
-        draw_cmds = self._cmd[panel_name]
+        if data is None:
+            data = self._draw_data(ticker)
 
-        # Draw panel
-        for cmd in draw_cmds:
-            cmd(pos_x, pos_y, self._data._data)
+        if out is None:
+            self.invalidate_frames()
+            buffer = []
+            self._cmd[panel_name].render(pos_x, pos_y, data, buffer)
+            _write(buffer)
+        else:
+            self._cmd[panel_name].render(pos_x, pos_y, data, out)
 
     def _webview_process_impl(self, wctx, ticker_list):
         pass
@@ -286,96 +558,386 @@ class ProviderBase(ABC):
         # Update the html data dictionary as necessary
         self._webview_process_impl(self._wctx, ticker_list)
 
-        # Update webviews for this provider
-        for webview_data in self._wctx(command, data=return_data):
-            self._wmng.process(webview_data)
+        # Update webviews for this provider. The commands are sent in one 
+        # message, and the futures of their results are returned.
+        if self._wmng is None:
+            return []
+        self._create_webviews()
+        return self._wmng.submit_many( list(self._wctx(command, data=return_data)) )
+
+    def fetch_limit(self):
+        # Maximum number of requests this provider can have in flight when 
+        # it shares a fetch stage with other providers.
+        return self._smng.get_setting(".".join([self._provider_id, "fetch", "max_in_flight"])) or 8
+
+    def http_pool_manager(self):
+        # Each provider keeps its own connection pool, sized by its 
+        # 'fetch.pool_maxsize' setting. The pool is re-created if the 
+        # relevant settings change.
+        config = (
+            self._smng.get_setting(".".join([self._provider_id, "fetch", "pool_maxsize"])) or 4,
+            self._smng.get_setting("global.fetch.connect_timeout") or 5.0,
+            self._smng.get_setting("global.fetch.read_timeout") or 20.0,
+        )
+        if self._http is None or config != self._http_config:
+            self._http = util.web.create_pool_manager(*config)
+            self._http_config = config
+        return self._http
+
+    def _update_webviews(self, ticker_list):
+        # Update the html data dictionary as necessary
+        self._webview_process_impl(self._wctx, ticker_list)
 
-    def process(self, ticker):
-        # This method processes a list of ticker symbols in one go. We keep all 
-        # the extracted data in an internal dictionary, which is cleared next
-        # time this method is processed.
+        # # Update webviews for this provider. The webview process handles
+        # the commands in order, so there is no need to wait for the results.
+        if self._wmng is None:
+            return []
+        self._create_webviews()
+        return self._wmng.submit_many( list(self._wctx("load_html")) )
+
+    def _create_fetch_jobs(self, ticker_list):
+        # Load cached data for every ticker symbol and create the list of
+        # URL requests that need to be made for this batch. The returned
+        # 'pending' dictionary keeps track of the URLs that still need to be
+        # parsed for each ticker symbol.
+        jobs = []
+        pending = {}
+
+        # Fields are extracted while downloading, unless the extraction is 
+        # done by the parse worker processes
+        stream_fields = not _get_parse_pool(self._smng)
+
+        # Load stock data for this provider for all the ticker symbols that are
+        # not loaded yet in one go. Every ticker gets its own data context, since 
+        # several tickers are being parsed within the same batch.
+        self._ticker_data.resize(self._smng.get_setting("global.ticker_cache.max_entries") or 0)
+        self._ticker_data.pin(ticker_list)
+        to_load = [t for t in ticker_list if not self._ticker_data.lookup(t)]
+        with util.stats.collector.timer("cache_load", self._provider_id):
+            loaded = self._cmng.load_stock_data_many(self, to_load) if to_load else {}
+        for ticker_symbol, cached_data in loaded.items():
+            self._ticker_data[ticker_symbol] = provider_data_ctx(
+                debug=self._debug, 
+                columnar_layout=self._smng.get_setting("global.data.columnar") or False
+            )
+            self._ticker_data[ticker_symbol].load_data(cached_data)
+
+        for ticker_symbol in ticker_list:
+            if ticker_symbol in pending:
+                continue
+
+            pending[ticker_symbol] = { 'remaining': 0, 'res': [], 'failed': False, 'parsed': {} }
+            for URL, parser, options in self._uctx(ticker_symbol):
+                jobs.append( 
+                    util.web.fetch_job(
+                        URL, 
+                        key=(ticker_symbol, parser, pending[ticker_symbol]['remaining'], options['extractor']), 
+                        group=self._provider_id,
+                        end_marker=options['end_marker'],
+                        max_bytes=options['max_bytes'],
+                        consumer=options['extractor'].stream() if options['extractor'] and stream_fields else None,
+                        template=options['template'],
+                    ) 
+                )
+                pending[ticker_symbol]['remaining'] += 1
+                pending[ticker_symbol]['res'].append(None)
+
+        return jobs, pending
+
+    def _consume_fetch_result(self, job, website_data, pending, error=None, fields=None):
+        # Parse the website data of a finished job. Returns the ticker symbol
+        # once all URLs for that ticker have been parsed, otherwise None.
+        # A failed request is recorded and does not stop the rest of the batch.
+        # 'fields' holds the fields of the URL's extractor if these have been 
+        # extracted by a parse worker process.
+        ticker_symbol, parser, url_idx, extractor = job.key
+
+        # A page that has not changed since it was last parsed in this session
+        # does not need to be parsed again. Its list values are the same as 
+        # in the previous record, so these are appended again to keep the 
+        # lists aligned with the records.
+        response = job.response
+        parsed = self._parsed_pages.get(ticker_symbol, {}).get(job.URL, None)
+        data_ctx = self._ticker_data[ticker_symbol]
+        if error is not None:
+            self._fetch_errors.append( (job.URL, error) )
+            pending[ticker_symbol]['res'][url_idx] = None
+            pending[ticker_symbol]['failed'] = True
+        elif response is not None and response.not_modified and response.validator is not None \
+            and parsed is not None and parsed[0] == response.validator:
+            for path in parsed[1]:
+                data_ctx.set_data(path, data_ctx.get_data(path)[-1])
+            pending[ticker_symbol]['res'][url_idx] = parsed[2]
+        else:
+            num_appended = len(data_ctx.appended_paths())
+            res = self._parse(job, website_data, parser, extractor, data_ctx, fields)
+            pending[ticker_symbol]['res'][url_idx] = res
+            if response is not None and response.validator is not None:
+                pending[ticker_symbol]['parsed'][job.URL] = (response.validator, data_ctx.appended_paths()[num_appended:], res)
+
+        pending[ticker_symbol]['remaining'] -= 1
+        if pending[ticker_symbol]['remaining']:
+            return None
         
-        ticker_list = []
-
-        if type(ticker) is str:
-            ticker_list.append(ticker)
-        elif type(ticker) is list:
-            ticker_list = ticker
+        # A new record is added once any of the URL parsers has returned a 
+        # result, i.e. has set fields of the ticker's data. If any URL failed, 
+        # no record is added for this batch.
+        results = [res for res in pending[ticker_symbol]['res'] if res is not None]
+        if pending[ticker_symbol]['failed']:
+            results = []
+        elif results:
+            # Only pages whose values are part of a record can be skipped later
+            self._parsed_pages.setdefault(ticker_symbol, {}).update(pending[ticker_symbol]['parsed'])
+        self._finish_ticker(ticker_symbol, results[0] if results else None)
+        return ticker_symbol
+
+    def _parse(self, job, website_data, parser, extractor, data_ctx, fields=None):
+        # The fields of an extractor have been extracted while the page was 
+        # downloaded. In that case the download may have stopped as soon as 
+        # all of them were found, so 'website_data' can be incomplete.
+        template = job.template or job.URL
+        if fields is None:
+            if job.consumer is not None:
+                fields = job.consumer.close()
+            elif extractor is not None:
+                with util.stats.collector.timer("extract", self._provider_id, template):
+                    fields = extractor.extract(website_data)
+            else:
+                fields = []
+
+        with util.stats.collector.timer("parse", self._provider_id, template):
+            for path, value in fields:
+                data_ctx.set_data(path, value)
+            return parser(job.URL, website_data, data_ctx)
+
+    def _finish_ticker(self, ticker_symbol, res):
+        # Increase number of records and active record entries in data. 
+        # Without a result the values appended by some of the ticker's URLs
+        # are dropped again.
+        if res is not None:
+            self._ticker_data[ticker_symbol].new_record()
         else:
-            raise Exception("'ticker' input must be either of type 'str' or 'list'. Type {} was given".format(type(ticker))) 
+            self._ticker_data[ticker_symbol].discard_record()
+
+        # The new extracted data is saved for the whole batch by '_save_tickers'
+        if ticker_symbol not in self._unsaved_tickers:
+            self._unsaved_tickers.append(ticker_symbol)
+
+    def _finish_batch(self):
+        # Save the data of all tickers finished since the last save at once.
+        # The tickers of the batch can then be evicted again.
+        if self._unsaved_tickers:
+            with util.stats.collector.timer("cache_save", self._provider_id):
+                self._cmng.save_stock_data_many(self, self._unsaved_tickers)
+            util.stats.collector.count("tickers", len(self._unsaved_tickers), self._provider_id)
+            self._unsaved_tickers = []
+        self._ticker_data.unpin_all()
+
+    def _evict_ticker(self, ticker_symbol):
+        # Save the data of a ticker that is about to be evicted, if needed.
+        # Its pages have to be parsed again once it is loaded back.
+        self._parsed_pages.pop(ticker_symbol, None)
+        if ticker_symbol in self._unsaved_tickers:
+            self._cmng.save_stock_data_many(self, [ticker_symbol])
+            self._unsaved_tickers.remove(ticker_symbol)
+
+    def ticker_cache_stats(self):
+        return self._ticker_data.stats()
+
+    def process(self, ticker):
+        # This method processes a list of ticker symbols in one go. We keep the
+        # extracted data of the most recently used tickers in an internal store,
+        # bounded by the 'global.ticker_cache.max_entries' setting.
+        ticker_list = _create_ticker_list(ticker)
 
-        # # Check to see if internal cache is large. If that is the case, 
-        # # clear it before continuing.
-            # if get_size(self._ticker_data) > self._smng._get_setting("global.cache_max_size"):
-            #     self._ticker_data.clear()
-
-        uptick_symbol       = self._smng.get_setting("global.progressbar.uptick_symbol")
-        ascii_              = self._smng.get_setting("global.progressbar.ascii")
-        dynamic_ncols       = self._smng.get_setting("global.progressbar.dynamic_ncols")
-        bar_style           = pprinter.Style.RESET_ALL + self._smng.get_setting("global.progressbar.style.bar")
-        desc_style          = pprinter.Style.RESET_ALL + self._smng.get_setting("global.progressbar.style.desc")
-        uptick_symbol_style = pprinter.Style.RESET_ALL + self._smng.get_setting("global.progressbar.style.uptick") 
-        ticker_style        = pprinter.Style.RESET_ALL + self._smng.get_setting("global.progressbar.style.ticker")
-        
-        if len(uptick_symbol) > 1 :
-            uptick_symbol = uptick_symbol[0]
-        
         #================================================================
         # Deal with webviews
         #================================================================
-        # Update the html data dictionary as necessary
-        self._webview_process_impl(self._wctx, ticker_list)
+        self._update_webviews(ticker_list)
 
-        # # Update webviews for this provider
-        for webview_data in self._wctx("load_html"):
-            self._wmng.process(webview_data)
+        jobs, pending = self._create_fetch_jobs(ticker_list)
+        fetcher = _create_fetcher(self._smng, { self._provider_id: self })
 
         # Deal with CLI views
-        util.screen.hide_cursor()
-        for ticker_symbol in tqdm(
-            ticker_list, 
-            # desc=tick_symbol_style + "\u2713 " + desc_style + "Downloaded data from '{}' provider".format(self._provider_id) + bar_style,
-            desc=uptick_symbol_style + uptick_symbol + " " + desc_style + "Downloaded data from '{}' provider".format(self._provider_id) + bar_style,
-            ascii=ascii_,
-            dynamic_ncols=dynamic_ncols,
-            ):
-            if ticker_symbol not in self._ticker_data:
-                # Load stock data for this provider and ticker_symbol
-                cached_data = self._cmng.load_stock_data( self, ticker_symbol)
-
-                # Copy cached data to internal data dictionary
-                # self._ticker_data[ticker_symbol] = copy.deepcopy(self._data)
-                self._ticker_data[ticker_symbol] = self._data
-                self._ticker_data[ticker_symbol].load_data(cached_data)
-
-            # Get website data, parse it and store it in internal data dictionary
-            print("\r" + desc_style + "Downloading" + ticker_style + "{:^7s}".format(ticker_symbol) + desc_style, end="")
-            res = None
-            for URL, parser in self._uctx(ticker_symbol):
-                website_data = util.web.get_URL_data(URL)
-                res = parser(URL, website_data, self._ticker_data[ticker_symbol])
-
-            # Increase number of records and active record entries in data
-            if res is not None:
-                self._ticker_data[ticker_symbol]._data["num_records"] += 1
-                self._ticker_data[ticker_symbol]._data["active_record"] = self._ticker_data[ticker_symbol]._data["num_records"] - 1
-
-            # Save new extracted data
-            self._cmng.save_stock_data_dict( self, ticker_symbol)
-        
-        print(pprinter.Style.RESET_ALL, end="")
-        util.screen.show_cursor()
+        pbar, desc_style, ticker_style = _create_progress_bar(
+            self._smng, 
+            len(pending), 
+            "Downloaded data from '{}' provider".format(self._provider_id)
+        )
+        try:
+            # Tickers with no URLs to fetch are done already
+            for ticker_symbol in [t for t, p in pending.items() if not p['remaining']]:
+                self._finish_ticker(ticker_symbol, None)
+                pbar.update(1)
+
+            # Get website data as it arrives, parse it and store it in the 
+            # internal data dictionary of the corresponding ticker.
+            results = _parse_stage(fetcher.fetch(jobs), _get_parse_pool(self._smng))
+            for job, website_data, error, fields in results:
+                print("\r" + desc_style + "Downloaded " + ticker_style + "{:^7s}".format(job.key[0]) + desc_style, end="")
+                if self._consume_fetch_result(job, website_data, pending, error, fields):
+                    pbar.update(1)
+        finally:
+            _close_progress_bar(pbar)
+            self._finish_batch()
+            _report_fetch_errors( [self] )
+
+
+def _rows_overlap(origin, rows):
+    # 'origin' is (x, y, term_x, term_y, height) of a drawn frame
+    return origin[1] < rows.stop and rows.start < origin[1] + origin[4]
+
+def _write(out, end="\n"):
+    # Write a rendered buffer with a single write. By default the cursor is 
+    # left on the line after the output, as print() did for every draw 
+    # command before.
+    sys.stdout.write( "".join(out) + end )
+    sys.stdout.flush()
+
+def _create_ticker_list(ticker):
+    if type(ticker) is str:
+        return [ticker]
+    elif type(ticker) is list:
+        return ticker
+    else:
+        raise Exception("'ticker' input must be either of type 'str' or 'list'. Type {} was given".format(type(ticker))) 
+
+# Shared by all fetch stages, so that request rates are respected across batches
+_rate_limiter = util.web.HostRateLimiter()
+
+def _create_fetcher(smng, providers):
+    # 'providers' is a dictionary of provider_id: provider that take part in
+    # the fetch stage.
+    http_cache = None
+    if smng.get_setting("global.fetch.http_cache"):
+        http_cache = util.web.HTTPCache( 
+            os.path.join(smng.get_cache_path(), "http"),
+            max_bytes=int( (smng.get_setting("global.fetch.http_cache_max_mb") or 0) * 1024 * 1024 ),
+            max_age=smng.get_setting("global.fetch.http_cache_max_age_sec") or 0,
+        )
+
+    _rate_limiter.configure(
+        smng.get_setting("global.fetch.rate_per_host") or 0.0,
+        smng.get_setting("global.fetch.burst_per_host") or 1,
+    )
+
+    retry_policy = util.web.RetryPolicy(
+        retries=smng.get_setting("global.fetch.retries") or 0,
+        backoff_factor=smng.get_setting("global.fetch.backoff_factor") or 0.5,
+        backoff_max=smng.get_setting("global.fetch.backoff_max") or 30.0,
+    )
+
+    return util.web.URLFetcher(
+        max_workers=smng.get_setting("global.fetch.max_workers") or 16,
+        max_per_host=smng.get_setting("global.fetch.max_per_host") or 4,
+        group_limits={ provider_id: provider.fetch_limit() for provider_id, provider in providers.items() },
+        group_pools={ provider_id: provider.http_pool_manager() for provider_id, provider in providers.items() },
+        http_cache=http_cache,
+        rate_limiter=_rate_limiter,
+        retry_policy=retry_policy,
+    )
+
+# Worker processes for the parse stage, shared by all providers
+_parse_pool = None
+_parse_pool_size = 0
+
+def _get_parse_pool(smng):
+    # Returns None unless 'global.parse.processes' is set
+    global _parse_pool, _parse_pool_size
+    processes = smng.get_setting("global.parse.processes") or 0
+    if processes != _parse_pool_size:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False)
+        _parse_pool = ProcessPoolExecutor(max_workers=processes) if processes else None
+        _parse_pool_size = processes
+    return _parse_pool
+
+def _parse_stage(results, executor):
+    # Ship the pages of URLs with an extractor to the worker processes and 
+    # yield (job, website_data, error, fields) tuples as they become ready.
+    # Only the extracted (path, value) tuples come back from the workers; the
+    # parser callbacks still run here. 'fields' is None for pages that were 
+    # not extracted by a worker, including pages whose worker failed, which 
+    # are then extracted as usual.
+    if executor is None:
+        for job, website_data, error in results:
+            yield job, website_data, error, None
+        return
+
+    running = {}
+    for job, website_data, error in results:
+        extractor = job.key[3]
+        if error is None and extractor is not None and job.consumer is None \
+            and not (job.response is not None and job.response.not_modified):
+            running[executor.submit(extractor.extract, website_data)] = (job, website_data)
+        else:
+            yield job, website_data, error, None
+
+        for future in [f for f in running if f.done()]:
+            yield _parse_result(future, *running.pop(future))
+
+    for future in as_completed(running):
+        yield _parse_result(future, *running[future])
+
+def _parse_result(future, job, website_data):
+    try:
+        return job, website_data, None, future.result()
+    except Exception:
+        return job, website_data, None, None
+
+def _report_fetch_errors(providers, file=None):
+    # Errors are printed in colour, or as plain lines if a file is given
+    for provider in providers:
+        for URL, error in provider._fetch_errors:
+            if file is None:
+                print(pprinter.Fore.RED + "Could not get data from '{}': {}".format(URL, error) + pprinter.Style.RESET_ALL)
+            else:
+                print("Could not get data from '{}': {}".format(URL, error), file=file)
+        provider._fetch_errors.clear()
+
+def _create_progress_bar(smng, total, description):
+    uptick_symbol       = smng.get_setting("global.progressbar.uptick_symbol")
+    ascii_              = smng.get_setting("global.progressbar.ascii")
+    dynamic_ncols       = smng.get_setting("global.progressbar.dynamic_ncols")
+    bar_style           = pprinter.Style.RESET_ALL + smng.get_setting("global.progressbar.style.bar")
+    desc_style          = pprinter.Style.RESET_ALL + smng.get_setting("global.progressbar.style.desc")
+    uptick_symbol_style = pprinter.Style.RESET_ALL + smng.get_setting("global.progressbar.style.uptick") 
+    ticker_style        = pprinter.Style.RESET_ALL + smng.get_setting("global.progressbar.style.ticker")
+    
+    if len(uptick_symbol) > 1 :
+        uptick_symbol = uptick_symbol[0]
+
+    util.screen.hide_cursor()
+    pbar = tqdm(
+        total=total,
+        # desc=tick_symbol_style + "\u2713 " + desc_style + description + bar_style,
+        desc=uptick_symbol_style + uptick_symbol + " " + desc_style + description + bar_style,
+        ascii=ascii_,
+        dynamic_ncols=dynamic_ncols,
+        )
+    return pbar, desc_style, ticker_style
+
+def _close_progress_bar(pbar):
+    pbar.close()
+    print(pprinter.Style.RESET_ALL, end="")
+    util.screen.show_cursor()
 
 
 class ProviderManager:
-    def __init__(self, settings_manager, debug=False):
+    def __init__(self, settings_manager, cache_manager=None, webview_manager=None, debug=False):
         self._smng  = settings_manager
+        self._cmng  = cache_manager
+        self._wmng  = webview_manager
         self._providers = {}
         self._debug = debug
         
         # Check external providers directory
         self._check_external_providers()
 
+        # Timings of the processing stages are collected unless disabled
+        util.stats.collector.enabled = self._smng.get_setting("global.stats.enabled") is not False
+        self._smng.add_set_listener_for_setting("global.stats.enabled", self._update_stats_enabled)
+
         # Add available providers to internal dictionary
         self.instantiate_all_providers()
 
@@ -386,7 +948,12 @@ class ProviderManager:
             if not self._providers.get(provider_name):
                 if self._debug:
                     print("Registering provider {}".format(provider_name))
-                self._providers[provider_name] = provider[1]( settings_manager=self._smng )
+                self._providers[provider_name] = provider[1]( 
+                    settings_manager=self._smng, 
+                    cache_manager=self._cmng, 
+                    webview_manager=self._wmng, 
+                    debug=self._debug
+                )
                 self.register_with_all_style_settings( self._providers[provider_name] )
 
     def register_with_all_style_settings(self, provider):
@@ -414,7 +981,7 @@ class ProviderManager:
         access_rights = 0o755
         try:
             if not os.path.exists(directory):
-                res = create_directory(directory, access_rights)
+                res = settings.create_directory(directory, access_rights)
         except:
             print("There was an error while creating '{}'".format(directory))
             directory = None
@@ -438,7 +1005,7 @@ class ProviderManager:
         directory = new_value
         try:
             if not os.path.exists(directory):
-                res = create_directory(directory, access_rights)
+                res = settings.create_directory(directory, access_rights)
         except:
             raise Exception("There was an error while creating '{}'".format(directory))
 
@@ -454,90 +1021,87 @@ class ProviderManager:
         except:
             raise Exception("There was an error while copying from '{}' to '{}'".format(old_value, directory))
 
+    @staticmethod
+    def _update_stats_enabled(smng, setting_path, old_value, new_value, user_data):
+        util.stats.collector.enabled = new_value
+        return new_value
+
+    def process_all(self, tickers, providers=None, progress=True):
+        """ Process a list of ticker symbols across several providers at once.
+
+        All (provider, ticker, URL) requests share a single fetch stage, bounded 
+        by 'global.fetch.max_workers' overall and by each provider's 
+        'fetch.max_in_flight' setting. This is a generator that yields a 
+        (provider_id, ticker_symbol, data_ctx) tuple as soon as all URLs of 
+        a ticker have been parsed for a provider.
+
+        'providers' is an optional list of provider ids. All providers are 
+        used when it is not given. With 'progress' set to False nothing is 
+        written to stdout, and fetch errors are reported on stderr.
+        """
+        ticker_list = _create_ticker_list(tickers)
+        selected    = self._select_providers(providers)
+
+        jobs    = []
+        pending = {}
+        for provider_id, provider in selected.items():
+            provider._update_webviews(ticker_list)
+            provider_jobs, pending[provider_id] = provider._create_fetch_jobs(ticker_list)
+            jobs.extend(provider_jobs)
+
+        fetcher = _create_fetcher(self._smng, selected)
+
+        pbar = None
+        if progress:
+            total = sum( len(p) for p in pending.values() )
+            pbar, desc_style, ticker_style = _create_progress_bar(
+                self._smng, 
+                total, 
+                "Downloaded data from {} provider(s)".format(len(selected))
+            )
+        try:
+            # Tickers with no URLs to fetch are done already
+            for provider_id, provider in selected.items():
+                for ticker_symbol in [t for t, p in pending[provider_id].items() if not p['remaining']]:
+                    provider._finish_ticker(ticker_symbol, None)
+                    if pbar:
+                        pbar.update(1)
+                    yield provider_id, ticker_symbol, provider._ticker_data[ticker_symbol]
+
+            results = _parse_stage(fetcher.fetch(jobs), _get_parse_pool(self._smng))
+            for job, website_data, error, fields in results:
+                provider = selected[job.group]
+                if pbar:
+                    print("\r" + desc_style + "Downloaded " + ticker_style + "{:^7s}".format(job.key[0]) + desc_style, end="")
+                ticker_symbol = provider._consume_fetch_result(job, website_data, pending[job.group], error, fields)
+                if ticker_symbol:
+                    if pbar:
+                        pbar.update(1)
+                    yield job.group, ticker_symbol, provider._ticker_data[ticker_symbol]
+        finally:
+            if pbar:
+                _close_progress_bar(pbar)
+            for provider in selected.values():
+                provider._finish_batch()
+            _report_fetch_errors( selected.values(), file=None if progress else sys.stderr )
+
+    def _select_providers(self, providers=None):
+        if providers is None:
+            return dict(self._providers)
+
+        if type(providers) is str:
+            providers = [providers]
+
+        selected = {}
+        for provider_id in providers:
+            if provider_id not in self._providers:
+                raise Exception("Provider '{}' does not exist!".format(provider_id))
+            selected[provider_id] = self._providers[provider_id]
+        return selected
+
     def display_providers(self):
         print("=================================================================")
         print("Number of available providers: {}\n".format(len(self._providers)))
         for idx, provider in enumerate(self._providers.values()):
             print("\tProvider {:<3}: {}".format(idx+1, provider[0]) )
         print("\n=================================================================\n")
-
-
-def data_parser(args):
-    import ipdb; ipdb.set_trace()
-    #=========================================
-    # Get list of data providers
-    #=========================================
-    # At this stage the user has requested to get information for, potentally,
-    # several companies and from several data providers.
-
-    # First of all, we need to get a list of all the data providers that the user 
-    # has requested.
-    data_providers = get_list_of_data_providers(args)
-
-    #=========================================
-    # For each ticker symbol
-    #=========================================
-    # Then ,for each ticker symbol we need to do the following:
-    cur_i = 0
-    cur_y = 1
-    for tik in args.ticker_symbols:
-        
-        #=========================================
-        # For each data provider
-        #=========================================
-        for provider in data_providers:
-            # First check if the information requested by a particular provider is in the cache. 
-            #
-            # 1.) If the information is in the cache, then do the following:
-            #     * check to see if the cache report is outdated:
-            #       - If the cached report is outdated, retrieve a new report from the provider
-            #       - If the cached report is not outdated, then show that to the user.
-            # If the information requested is not in the cache, retrieve a new report from the provider.
-
-            #=========================================
-            # Check if report is in cache
-            #=========================================
-            
-
-            #=========================================
-            # Retrieve report
-            #=========================================
-            # Get URL of ticker
-            # URL = zacks.create_URL_stock(tik)
-            URL = provider.create_URL_stock(tik)
-
-            # Get data from URL
-            web_data = util.web.get_URL_data(URL)
-
-            # Parse website data
-            # parsed_data = zacks.website_parser_stock(web_data)
-            stock_data = provider.website_parser_stock(web_data)
-
-            #=========================================
-            # Save report into cache
-            #=========================================
-
-            #=========================================
-            # Print report to screen
-            #=========================================
-            # Once a report has been generated (either by retrieving it from the provider or the cache)
-            # we need to print it on screen.
-
-            # Print main title using ticker symbol
-            start_x  = util.font.find_starting_pos_for_ticker_title(tik.upper())
-            _, cur_y = util.font.print_using_font(tik.upper(), start_x, cur_y, data_formatter.format_tik_font)
-
-            # Print data and get height of row
-            # row_y = zacks.format_stock(parsed_data, zacks.logo, 0, cur_y)
-            row_y = provider.format_stock(stock_data, provider.logo, 0, cur_y)
-            cur_y += row_y
-
-            #=========================================
-            # Update screen to make room if necessary
-            #=========================================
-            # Check to see if next row exceeds the terminals height. If that is the case, 
-            # we make sure to make some room before printing the next row
-            if (cur_y + row_y) > term_y:
-                util.screen.move_cursor(term_y)
-                print(util.screen.pos(0, 0) + util.screen.Style.RESET_ALL)
-                cur_y = 1
@@ -0,0 +1,231 @@
+import sys, json, time, heapq, threading
+
+__all__ = [
+    'RefreshScheduler',
+]
+
+#================================================================
+# Background refresh scheduler
+#================================================================
+# The scheduler keeps a watchlist of ticker symbols, each with the providers
+# it should be refreshed from (all providers by default), and refreshes every
+# (ticker, provider) pair once per 'stock.stock_update_period_sec'.
+#
+# The refreshes are spread evenly over the period instead of all coming due
+# at once: with N pairs, consecutive pairs are period / N seconds apart. Pairs
+# that come due within 'global.scheduler.coalesce_window_sec' of each other
+# are refreshed together, so that they share one fetch stage. The refreshes
+# run on a background thread, and 'on_refresh' is called with the
+# (provider_id, ticker_symbol, data_ctx) of every refreshed pair.
+class RefreshScheduler:
+    def __init__(self, settings_manager, provider_manager, on_refresh=None, debug=False):
+        self._smng       = settings_manager
+        self._pmng       = provider_manager
+        self._on_refresh = on_refresh
+        self._debug      = debug
+        self._watchlist  = {}
+        self._last       = {}
+        self._queue      = []
+        self._cond       = threading.Condition()
+        self._thread     = None
+        self._running    = False
+
+        # Held while the scheduler processes a batch. Hold it to use the same
+        # providers from another thread.
+        self.lock = threading.RLock()
+
+        self.load_watchlist()
+        self._smng.add_set_listener_for_setting("stock.stock_update_period_sec", self._period_changed)
+
+    def period(self):
+        return self._smng.get_setting("stock.stock_update_period_sec") or 300
+
+    def coalesce_window(self):
+        window = self._smng.get_setting("global.scheduler.coalesce_window_sec")
+        return 5.0 if window is None else window
+
+    #================================================================
+    # Watchlist
+    #================================================================
+    def watchlist(self):
+        """ Return a dictionary of ticker symbol: list of provider ids (None for all providers) """
+        with self._cond:
+            return { ticker: (list(providers) if providers else None) for ticker, providers in self._watchlist.items() }
+
+    def add(self, tickers, providers=None):
+        """ Add ticker symbols to the watchlist and save it """
+        if type(tickers) is str:
+            tickers = [tickers]
+        if type(providers) is str:
+            providers = [providers]
+
+        with self._cond:
+            for ticker in tickers:
+                self._watchlist[ticker.upper()] = list(providers) if providers else None
+            self._reschedule()
+        self.save_watchlist()
+
+    def remove(self, tickers):
+        """ Remove ticker symbols from the watchlist and save it """
+        if type(tickers) is str:
+            tickers = [tickers]
+
+        with self._cond:
+            for ticker in tickers:
+                self._watchlist.pop(ticker.upper(), None)
+            self._reschedule()
+        self.save_watchlist()
+
+    def load_watchlist(self):
+        watchlist_file = self._smng.get_watchlist_file()
+        try:
+            with open(watchlist_file, 'r') as fp:
+                watchlist = json.load(fp)
+        except FileNotFoundError:
+            watchlist = {}
+        except Exception as e:
+            print("Could not load the watchlist from '{}': {}".format(watchlist_file, e), file=sys.stderr)
+            watchlist = {}
+
+        with self._cond:
+            self._watchlist = watchlist
+            self._reschedule()
+
+    def save_watchlist(self):
+        watchlist_file = self._smng.get_watchlist_file()
+        try:
+            with open(watchlist_file, 'w') as fp:
+                json.dump(self.watchlist(), fp, sort_keys=True, indent=4)
+        except Exception:
+            raise Exception("There was an error when saving the watchlist to {}".format(watchlist_file))
+
+    def pairs(self):
+        """ Return the sorted list of (ticker, provider_id) pairs of the watchlist """
+        all_providers = list(self._pmng._providers.keys())
+        return sorted(
+            (ticker, provider_id)
+            for ticker, providers in self._watchlist.items()
+            for provider_id in (providers or all_providers)
+            if provider_id in self._pmng._providers
+        )
+
+    def schedule(self):
+        """ Return the pending refreshes as a sorted list of (due time, ticker, provider_id) """
+        with self._cond:
+            return sorted(self._queue)
+
+    #================================================================
+    # Scheduling
+    #================================================================
+    def _reschedule(self, period=None):
+        # Spread the pairs evenly over one period from now. A pair that was
+        # refreshed recently is not due before a full period has passed.
+        # Must be called with the condition held.
+        now    = time.time()
+        period = period or self.period()
+        pairs  = self.pairs()
+
+        self._queue = []
+        for idx, pair in enumerate(pairs):
+            due  = now + period * idx / len(pairs)
+            last = self._last.get(pair)
+            if last is not None:
+                due = max(due, last + period)
+            self._queue.append( (due, pair[0], pair[1]) )
+        heapq.heapify(self._queue)
+        self._cond.notify()
+
+    def _period_changed(self, smng, setting_path, old_value, new_value, user_data):
+        # Set listeners are called before the new value is stored
+        with self._cond:
+            self._reschedule(new_value)
+        return new_value
+
+    def _pop_due(self, limit):
+        # Must be called with the condition held. The pairs count as refreshed
+        # from now on, so that a reschedule does not queue them again early.
+        now   = time.time()
+        pairs = []
+        while self._queue and self._queue[0][0] <= limit:
+            _, ticker, provider_id = heapq.heappop(self._queue)
+            pairs.append( (ticker, provider_id) )
+            self._last[(ticker, provider_id)] = now
+        return pairs
+
+    def _refresh(self, pairs):
+        # Tickers that are due for the same set of providers are processed in
+        # one call, so all their requests share one fetch stage
+        providers = {}
+        for ticker, provider_id in pairs:
+            providers.setdefault(ticker, set()).add(provider_id)
+
+        groups = {}
+        for ticker, provider_ids in providers.items():
+            groups.setdefault( tuple(sorted(provider_ids)), [] ).append(ticker)
+
+        with self.lock:
+            for provider_ids, tickers in groups.items():
+                try:
+                    for provider_id, ticker, data_ctx in self._pmng.process_all(tickers, list(provider_ids), progress=False):
+                        if self._on_refresh:
+                            self._on_refresh(provider_id, ticker, data_ctx)
+                except Exception as e:
+                    print("Could not refresh {} from {}: {}".format(", ".join(tickers), ", ".join(provider_ids), e), file=sys.stderr)
+
+        # Schedule the next refresh of every pair that is still watched
+        now    = time.time()
+        period = self.period()
+        with self._cond:
+            watched = set(self.pairs())
+            queued  = set( (ticker, provider_id) for _, ticker, provider_id in self._queue )
+            for pair in pairs:
+                if pair in watched and pair not in queued:
+                    heapq.heappush( self._queue, (self._last.get(pair, now) + period, pair[0], pair[1]) )
+
+    def refresh_due(self):
+        """ Refresh the pairs that are due now, or within the coalesce window.
+        Returns the refreshed pairs. """
+        with self._cond:
+            pairs = self._pop_due( time.time() + self.coalesce_window() )
+        if pairs:
+            self._refresh(pairs)
+        return pairs
+
+    #================================================================
+    # Background thread
+    #================================================================
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    def running(self):
+        return self._running
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    delay = self._queue[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+
+                if not self._running:
+                    return
+
+            self.refresh_due()
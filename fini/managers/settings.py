@@ -30,7 +30,10 @@ def ask_user_to_create_directory(directory, access_rights):
 
 def create_directory(directory, access_rights):
     try:
-        os.mkdir(directory, access_rights)
+        os.makedirs(directory, access_rights)
+    except FileExistsError:
+        # path already exists, so we are good to go
+        return directory
     except OSError:
         print ("Creation of {} failed".format(directory))
         return None
@@ -53,6 +56,9 @@ def convert_value_str_to_type(value):
         return value
     return value
 
+def _num_args(listener):
+    return len(inspect.signature(listener).parameters)
+
 class settings_ctx:
     def __init__(self, provider):
         self._provider    = provider
@@ -213,12 +219,17 @@ class SettingsManager:
         self._app_name   = app_name
         self._app_author = app_author
         self._settings = {}
+        self._index = {}
         self._set_listeners = {}
         self._get_listeners = {}
+        self._evaluated = {}
+        self._dependents = {}
+        self._compiled = {}
         self._initialised = False
         self._dirty = False
         self._base_config_module = base_config_module
         self._parent_settings_keys = []
+        self._interactive = True
         self._debug = debug
 
         if config_path:
@@ -226,7 +237,7 @@ class SettingsManager:
     
     def __del__(self):
         if self._dirty:
-            if self.get_setting("global.auto_save_on_exit"):
+            if self.get_setting("global.auto_save_on_exit") or not self._interactive:
                 print("SettingsManager INFO: settings have been modified. Auto saving on exit.")
                 self.save_settings()
             else:
@@ -263,8 +274,12 @@ class SettingsManager:
         return base_config, base_config_abs_path
     
 
-    def initial_setup(self, config_path=None, base_config_module="fini.managers"):
+    def initial_setup(self, config_path=None, base_config_module="fini.managers", interactive=True):
+        # With 'interactive' set to False the user is never asked anything:
+        # directories are created at their default location, and modified 
+        # settings are saved on exit.
         access_rights = 0o755
+        self._interactive = interactive
 
         # Get base config dictionry and its absolute path
         base_config, base_config_abs_path = SettingsManager.get_base_config(base_config_module)
@@ -285,7 +300,10 @@ class SettingsManager:
             print("")
 
             # Ask user to create directory
-            config_path = ask_user_to_create_directory(config_path, access_rights)
+            if interactive:
+                config_path = ask_user_to_create_directory(config_path, access_rights)
+            else:
+                config_path = create_directory(config_path, access_rights)
             if not config_path:
                 raise Exception("There was an error while creating the base config directory. Cannot proceed.")
 
@@ -311,7 +329,10 @@ class SettingsManager:
                 print(" The base configuration exists but the path is not set for some reason.")
                 print(" Fini needs a place on your system to store files and relevant data.")
                 print(" You can either use the default suggested location or enter a new path.")
-                config_path = ask_user_to_create_directory(config_path, access_rights)
+                if interactive:
+                    config_path = ask_user_to_create_directory(config_path, access_rights)
+                else:
+                    config_path = create_directory(config_path, access_rights)
                 if not config_path:
                     raise Exception("There was an error while creating the base config directory. Cannot proceed.")
         
@@ -338,10 +359,27 @@ class SettingsManager:
         # accordingly.
         self.add_set_listener_for_setting("global.config_path", self._update_base_config)
 
+        # Settings files created by older versions of the application might be
+        # missing some of the newer settings. Add them with their default values
+        # and save the new settings state.
+        if self.add_missing_default_settings():
+            self.save_settings()
+
         # Generate settings parent keys
         self.generate_settings_parent_keys()
 
 
+    def add_missing_default_settings(self):
+        defaults = SettingsManager.get_default_settings(self.get_config_path())
+        added = []
+        for setting_path in util.misc.DictUtil.get_leaf_paths(defaults):
+            if not self.setting_exists(setting_path):
+                self.add_setting(setting_path, util.misc.DictUtil.get_by_path(defaults, setting_path))
+                added.append(setting_path)
+                if self._debug:
+                    print("Added missing setting '{}'".format(setting_path))
+        return added
+
     # Used in providers when generating settings
     def generate_settings_parent_keys(self):
         for key in self._settings.keys():
@@ -460,7 +498,7 @@ class SettingsManager:
             print("You need to call 'initial_setup' before adding any listeners.")
             return None
 
-        listener_num_args = len(inspect.signature(listener).parameters)
+        listener_num_args = _num_args(listener)
         if listener_num_args !=5:
             print("The supplied listener's funtion signature is wrong.")
             print("A function/method with five input arguments is required.")
@@ -482,7 +520,7 @@ class SettingsManager:
         
         # Finally append the listener to the appropriate setting entry in the
         # listener's dictionary
-        self._set_listeners[setting_path].append( {'callback': listener, 'user_data':user_data} )
+        self._set_listeners[setting_path].append( {'callback': listener, 'user_data':user_data, 'num_args': listener_num_args} )
     
 
     def add_get_listener_for_setting(self, setting_path, listener, user_data=None):
@@ -491,8 +529,8 @@ class SettingsManager:
             print("You need to call 'initial_setup' before adding any listeners.")
             return None
 
-        listener_num_args = len(inspect.signature(listener).parameters)
-        if listener_num_args !=4 or listener_num_args !=5:
+        listener_num_args = _num_args(listener)
+        if listener_num_args not in (4, 5):
             print("The supplied listener's funtion signature is wrong.")
             print("A function/method with four or five input arguments is required.")
             print("A listener function/method will be called as follows:")
@@ -516,7 +554,7 @@ class SettingsManager:
         
         # Finally append the listener to the appropriate setting entry in the
         # listener's dictionary
-        self._get_listeners[setting_path].append( {'callback': listener, 'user_data':user_data} )
+        self._get_listeners[setting_path].append( {'callback': listener, 'user_data':user_data, 'num_args': listener_num_args} )
 
 
     def load_settings(self, settings_file=None):
@@ -530,8 +568,10 @@ class SettingsManager:
 
         if settings_file:
             try:
-                with open(settings_file , 'r') as fp:
-                    self._settings = json.load(fp)
+                with open(settings_file , 'rb') as fp:
+                    self._settings = util.serial.loads(fp.read())
+                self._build_index()
+                self._clear_evaluated()
                 self._dirty = False
                 return settings_file
             except:
@@ -548,8 +588,10 @@ class SettingsManager:
 
         settings_file = self.get_settings_file()
         try:
-            with open(settings_file, 'w') as fp:
-                json.dump(self._settings, fp, sort_keys=False, indent=4)
+            # Indented by 4 spaces, so that the file stays easy to edit by hand
+            data = util.serial.dumps(self._settings, indent=4)
+            with open(settings_file, 'wb') as fp:
+                fp.write(data)
         except:
             raise Exception("The was an error when saving settings to {}".format(settings_file))
 
@@ -573,7 +615,7 @@ class SettingsManager:
     def display_settings(self, root_path=None, style_title=None, style_key=None, style_val=None):
         
         if root_path:
-            root_dict = util.misc.DictUtil.get_by_path(self._settings, root_path)
+            root_dict = self._index.get(root_path)
         else:
             root_dict = self._settings      
         
@@ -636,7 +678,9 @@ class SettingsManager:
     #================================================
     # Settings getters and setters
     #================================================
-    def _reformat_value(self, value):
+    def _reformat_value(self, value, references=None):
+        # The paths of the settings that are referenced, directly or through
+        # other references, are appended to 'references' if given
         ff = re.split("[!\{\}]", value)
         if len(ff) == 2:
             val = ff[1]
@@ -648,55 +692,132 @@ class SettingsManager:
             raise Exception("_reformat_value failed with value: {}".format(value))
 
         if setting_reference:
+            if references is not None:
+                references.append(setting_reference)
             extra_value = self.get_raw_setting(setting_reference)
             if type(extra_value) is str:
                 if extra_value[0] == "!":
-                    extra_value = self._reformat_value(extra_value)
+                    extra_value = self._reformat_value(extra_value, references)
             if not extra_value:
                 raise Exception("Setting '{}' does not exist!".format(setting_reference))
             value = "!" + val + extra_value[1:] if extra_value[0] == "!" else extra_value 
     
         return value
 
-    def _evaluate_setting(self, value):
+    def _evaluate_setting(self, value, references=None):
         if type(value) is str and value:
             if value[0] == "!":
-                value = self._reformat_value(value)
-                return (eval(value[1:]), True)
+                value = self._reformat_value(value, references)
+                return (eval(self._compile_expression(value[1:])), True)
             else:
                 return (value, False)
         else:
             return (value, False)
 
+    def _compile_expression(self, expression):
+        code = self._compiled.get(expression)
+        if code is None:
+            code = compile(expression, "<setting>", "eval")
+            self._compiled[expression] = code
+        return code
+
+    #================================================
+    # Settings path index
+    #================================================
+    # '_index' maps the dotted path of every setting, and of every dictionary
+    # of settings, to its value in the nested '_settings' dictionary, so that
+    # a setting is found with a single lookup. Dictionaries are indexed by 
+    # reference, so the nested dictionary (which is what is saved and 
+    # displayed) and the index always agree as long as settings are only 
+    # added and set through the methods below.
+    def _build_index(self):
+        self._index = {}
+        for key, value in self._settings.items():
+            self._index_setting(key, value)
+
+    def _index_setting(self, setting_path, value):
+        if type(self._index.get(setting_path)) is dict:
+            prefix = setting_path + "."
+            for path in [path for path in self._index if path.startswith(prefix)]:
+                del self._index[path]
+                self._invalidate_setting(path)
+
+        self._index[setting_path] = value
+        if type(value) is dict:
+            for key, sub_value in value.items():
+                self._index_setting(setting_path + "." + key, sub_value)
+
+    def _index_parents(self, setting_path):
+        # Index the dictionaries that add_by_path may have created on the way
+        node = self._settings
+        keys = setting_path.split(".")
+        for idx, key in enumerate(keys[:-1]):
+            node = node[key]
+            self._index[".".join(keys[:idx+1])] = node
+
+    def _set_value(self, setting_path, value):
+        parent_path, _, key = setting_path.rpartition(".")
+        parent = self._index[parent_path] if parent_path else self._settings
+        parent[key] = value
+        self._index_setting(setting_path, value)
+
+    #================================================
+    # Evaluated settings cache
+    #================================================
+    # The evaluated value of a setting is cached the first time it is read,
+    # together with the settings its value references. '_dependents' maps a
+    # setting to the settings that reference it, so that when a setting 
+    # changes, the cached values of all settings that depend on it (directly
+    # or through other references) are dropped as well.
+    def _get_evaluated(self, setting_path):
+        evaluated = self._evaluated.get(setting_path)
+        if evaluated is None:
+            references = []
+            value      = self._index[setting_path]
+            evaluated  = self._evaluate_setting(value, references)
+            self._evaluated[setting_path] = evaluated
+            for reference in references:
+                self._dependents.setdefault(reference, set()).add(setting_path)
+        return evaluated
+
+    def _invalidate_setting(self, setting_path):
+        self._evaluated.pop(setting_path, None)
+        for dependent in self._dependents.pop(setting_path, ()):
+            self._invalidate_setting(dependent)
+
+    def _clear_evaluated(self):
+        self._evaluated  = {}
+        self._dependents = {}
+
     def setting_exists(self, setting_path):
-        return util.misc.DictUtil.path_exists(self._settings, setting_path)
-        # value = util.misc.DictUtil.get_by_path(self._settings, setting_path)
-        # if value is None:
-        #     return False
-        # else:
-        #     return True
+        return self._index.get(setting_path) is not None
 
     def get_setting(self, setting_path, eval_out=False, call_listener=True):
+        # Settings without get listeners are read from the evaluated cache
+        evaluated = self._evaluated.get(setting_path)
+        if evaluated is not None and not (call_listener and setting_path in self._get_listeners):
+            return evaluated if eval_out else evaluated[0]
+
         if not self.setting_exists(setting_path):
             if self._debug:
                 print("Setting '{}' does not exist".format(setting_path) )
             return None
 
-        current_value = util.misc.DictUtil.get_by_path(self._settings, setting_path)
+        if not (self._get_listeners.get(setting_path) and call_listener):
+            evaluated = self._get_evaluated(setting_path)
+            return evaluated if eval_out else evaluated[0]
+
+        current_value = self._index[setting_path]
 
         # Notify all get listeners. Call each listener with this object,
         # the setting's path, and the current value
-        if self._get_listeners.get(setting_path) and call_listener:
-            for listener in self._get_listeners[setting_path]:
-                listener_num_args = len(inspect.signature(listener['callback']).parameters)
-                if listener_num_args == 5:
-                    processed_value = listener['callback'](self, setting_path, current_value, None, listener['user_data'])
-                elif listener_num_args == 4:
-                    processed_value = listener['callback'](self, setting_path, current_value, listener['user_data'])
-                else:
-                    raise Exception("Don't know how to call listener")
-        else:
-            processed_value = None
+        for listener in self._get_listeners[setting_path]:
+            if listener['num_args'] == 5:
+                processed_value = listener['callback'](self, setting_path, current_value, None, listener['user_data'])
+            elif listener['num_args'] == 4:
+                processed_value = listener['callback'](self, setting_path, current_value, listener['user_data'])
+            else:
+                raise Exception("Don't know how to call listener")
 
         # The get listener callback might have processed the current value, 
         # so we need to update it here.
@@ -711,7 +832,7 @@ class SettingsManager:
 
     def get_raw_setting(self, setting_path):
         if self.setting_exists(setting_path):
-            return util.misc.DictUtil.get_by_path(self._settings, setting_path)
+            return self._index[setting_path]
         else:
             if self._debug:
                 print("Setting '{}' does not exist".format(setting_path) )
@@ -763,15 +884,15 @@ class SettingsManager:
             err_listener = []
 
             for listener in self._set_listeners[setting_path]:
-                if len(inspect.signature(listener['callback']).parameters) == 5:
+                if listener['num_args'] == 5:
                     processed_value = listener['callback'](self, setting_path, old_value, value, listener['user_data'])
                     if processed_value is None:
                         err_listener.append(listener)
-                elif len(inspect.signature(listener).parameters) == 4:
+                elif listener['num_args'] == 4:
                     processed_value = listener['callback'](self, setting_path, old_value, value)
                     if processed_value is None:
                         err_listener.append(listener)
-                elif len(inspect.signature(listener).parameters) == 0:
+                elif listener['num_args'] == 0:
                     processed_value = listener['callback']()
                     if processed_value is None:
                         err_listener.append(listener)
@@ -787,7 +908,8 @@ class SettingsManager:
                 value = processed_value
 
         # Finally set the new value
-        util.misc.DictUtil.set_by_path(self._settings, setting_path, value)
+        self._set_value(setting_path, value)
+        self._invalidate_setting(setting_path)
 
         # Mark settings as dirty. Will need to ask user to save on exit.
         # We get the current value again here, because a listener
@@ -812,6 +934,9 @@ class SettingsManager:
         # Add a setting only if it does not already exist.
         if not self.setting_exists(setting_path):
             util.misc.DictUtil.add_by_path(self._settings, setting_path, value)
+            self._index_parents(setting_path)
+            self._index_setting(setting_path, value)
+            self._invalidate_setting(setting_path)
             
             # Mark settings as dirty
             self._dirty = True
@@ -855,6 +980,9 @@ class SettingsManager:
 
     def get_cmd_history_file(self):
         return os.path.join(self.get_config_path(), "fini_prompt_history")
+
+    def get_watchlist_file(self):
+        return os.path.join(self.get_config_path(), "watchlist.json")
     
     @staticmethod
     def get_default_settings(base_config=None):
@@ -885,6 +1013,45 @@ class SettingsManager:
                     'ascii': False,
                     'dynamic_ncols': True,
                 },
+                'fetch': {
+                    'max_workers': 16,
+                    'max_per_host': 4,
+                    'http_cache': True,
+                    'http_cache_max_mb': 256,
+                    'http_cache_max_age_sec': 604800,
+                    'connect_timeout': 5.0,
+                    'read_timeout': 20.0,
+                    'retries': 3,
+                    'backoff_factor': 0.5,
+                    'backoff_max': 30.0,
+                    'rate_per_host': 5.0,
+                    'burst_per_host': 10,
+                },
+                'cache': {
+                    'backend': "log",
+                    'compact_after': 256,
+                    'write_behind': True,
+                    'flush_interval_sec': 1.0,
+                    'format': "binary",
+                },
+                'data': {
+                    'columnar': False,
+                },
+                'ticker_cache': {
+                    'max_entries': 1000,
+                },
+                'parse': {
+                    'processes': 0,
+                },
+                'webview': {
+                    'enabled': True,
+                },
+                'scheduler': {
+                    'coalesce_window_sec': 5.0,
+                },
+                'stats': {
+                    'enabled': True,
+                },
                 'config_path': base_config if base_config else "",
                 'auto_save_on_exit': False, 
             },
@@ -902,6 +1069,7 @@ class SettingsManager:
             #=====================================================
             'stock' :{
                 'cache_update_period_sec': 300, 
+                'stock_update_period_sec': 300,
             },
 
             #=====================================================
@@ -1,11 +1,32 @@
-import atexit, argparse, re, webview, copy
+import atexit, argparse, re, copy, queue, threading
 from multiprocessing import Process, Queue
+from concurrent.futures import Future
 from .. import util
 
 __all__ = [
     'WebviewManager'
 ]
 
+def _import_webview():
+    # pywebview, and the GUI toolkit it loads, is only imported by the
+    # webview process
+    import webview
+    return webview
+
+class _reply_queue:
+    # Tags every reply put by a command callback with the id of the request
+    # that is being processed, and records that the request was answered
+    def __init__(self, queue):
+        self._queue      = queue
+        self.request_id  = None
+        self.answered    = False
+
+    def put(self, reply, *args, **kwargs):
+        reply = dict(reply, request_id=self.request_id)
+        self._queue.put(reply, *args, **kwargs)
+        self.answered = True
+
+
 class webview_ctx:
     class __webview_proxy:
         def __init__(self, parent, webview_id):
@@ -239,11 +260,11 @@ class webview_ctx:
 class WebviewProcess:
     def __init__(self, from_main, to_main):
         self._from_main = from_main
-        self._to_main   = to_main
+        self._to_main   = _reply_queue(to_main)
         self._window    = {}
         self._cmds      = {}
         self._debug     = False 
-        self._webview   = webview
+        self._webview   = _import_webview()
         self._running   = True
 
         # Get address of first window and update the internal dictionary
@@ -355,10 +376,18 @@ class WebviewProcess:
         
         return colour
 
+    @staticmethod
+    def _top_right_position(width):
+        # The position of a window without one: the top right corner of the
+        # screen. The screen size is only looked up when such a window is 
+        # created, as it needs a display.
+        screen_width, _ = util.screen.size()
+        return max(0, screen_width - width), 0
+
     def _generate_create_data(self, data):
         create_data = {}
         width, height     = data['size']
-        x, y              = data['position']
+        x, y              = data['position'] or self._top_right_position(width)
         url, html, js_api = self._get_webview_content(data)
         colour            = data["background_color"]
         colour            = self._format_background_colour(colour)
@@ -426,7 +455,7 @@ class WebviewProcess:
             frameless     = data['frameless']
             hidden        = data['hidden']
             size          = data['size']
-            position      = data['position']
+            position      = data['position'] or self._top_right_position(size[0])
 
             # Get window
             url, html, js_api = self._get_webview_content(data)
@@ -902,46 +931,66 @@ class WebviewProcess:
     # Main event loop
     #====================================================================
     def run(self):
+        # Every message from the main process is a list of requests, which
+        # are processed in order. Each request gets at least one reply, 
+        # tagged with its request id.
         while self._running:
             # Get data from Queue
-            webview_data = self._from_main.get()
+            message = self._from_main.get()
+            if type(message) is not list:
+                message = [message]
 
-            # Extract command and data
-            commands  = re.split('\W+', webview_data['command'])
-            window_id = webview_data.get('window_id', "no window")
-            data      = webview_data.get('data', None)
-            debug     = webview_data.get('debug', False)
+            for webview_data in message:
+                self._to_main.request_id = webview_data.get('request_id', None)
+                self._to_main.answered   = False
+                self._process_request(webview_data)
 
-            if debug:
-                print("COMMAND  : {}".format(commands))
-                print("WINDOW_ID: {}".format(window_id))
-                print("DATA     : {}".format(data))
+                if not self._to_main.answered:
+                    self._to_main.put( {'command': webview_data['command'], 'result': None} )
 
-            try:
-                for cmd in commands:
-                    cmd_callback = self._cmds.get(cmd, None)
-                    if cmd_callback:
-                        res = cmd_callback(window_id, data, debug)
+                if not self._running:
+                    break
 
-            except Exception as e:
-                if debug:
-                    print("WebviewProcess 'run' method ERROR: {}".format(e))
+    def _process_request(self, webview_data):
+        # Extract command and data
+        commands  = re.split('\W+', webview_data['command'])
+        window_id = webview_data.get('window_id', "no window")
+        data      = webview_data.get('data', None)
+        debug     = webview_data.get('debug', False)
+
+        if debug:
+            print("COMMAND  : {}".format(commands))
+            print("WINDOW_ID: {}".format(window_id))
+            print("DATA     : {}".format(data))
+
+        try:
+            for cmd in commands:
+                cmd_callback = self._cmds.get(cmd, None)
+                if cmd_callback:
+                    res = cmd_callback(window_id, data, debug)
+
+        except Exception as e:
+            if debug:
+                print("WebviewProcess 'run' method ERROR: {}".format(e))
 
 
 class WebviewManager:
     def __init__(self, settings_manager, debug=False):
-        self._smng = settings_manager,
+        self._smng = settings_manager
         self._debug = debug
-        self._to_wv   = Queue()
-        self._from_wv = Queue()
+        self._to_wv   = None
+        self._from_wv = None
         self._p = None
         self._process_running  = False
         self._window = {}
+        self._reader = None
+        self._reader_stop = threading.Event()
+        self._lock   = threading.Lock()
+        self._futures = {}
+        self._next_request_id = 0
 
+        # The webview process is started on the first webview command
         atexit.register(self.__del__)
-
-        if not self._process_running:
-            self.start()
     
     def __del__(self):
         if self._process_running:
@@ -955,9 +1004,19 @@ class WebviewManager:
     
     @staticmethod
     def _webview_bootstrap(from_main, to_main):
+        webview = _import_webview()
         window = webview.create_window('zero')
         webview.start(WebviewManager._webview_event_loop, (from_main, to_main) )
 
+    def enabled(self):
+        """ Return True if webviews are enabled in the settings and a display is available """
+        return self._smng.get_setting("global.webview.enabled") is not False and util.screen.display_available()
+
+    def _ensure_started(self):
+        if not self._process_running and self.enabled():
+            self.start()
+        return self._process_running
+
     def start(self):
         try:
             if self._process_running:
@@ -968,8 +1027,13 @@ class WebviewManager:
             if self._debug:
                 print("Starting webview process... ", end="")
             
+            self._to_wv   = Queue()
+            self._from_wv = Queue()
             self._p=Process(target=self._webview_bootstrap, args=(self._to_wv, self._from_wv))
             self._p.start()
+            self._reader_stop.clear()
+            self._reader = threading.Thread(target=self._read_replies, daemon=True)
+            self._reader.start()
             self._process_running = True
 
             if self._debug:
@@ -990,9 +1054,8 @@ class WebviewManager:
                     debug=self._debug,
                     data=None
                 )
-                self._to_wv.put( webview_data )
-                res = self._from_wv.get()
-                if res:
+                res = self.submit(webview_data).result(timeout=5)
+                if res and res.get('result'):
                     print("Successfully terminated event loop!")
                 else:
                     print("ERROR while terminating event loop!")
@@ -1006,6 +1069,7 @@ class WebviewManager:
                 self._p.join()
                 self._p.close()
                 self._process_running = False
+                self._stop_reader()
                 if self._debug:
                     print("OK")
             else:
@@ -1040,8 +1104,68 @@ class WebviewManager:
             
         return webview_data
 
+    #================================================================
+    # Command channel
+    #================================================================
+    # Requests are sent to the webview process as lists, so that several
+    # commands travel in one message, and each request carries an id. A
+    # reader thread resolves the future of each request when its reply 
+    # arrives. Callers can wait on the futures or ignore them, since the
+    # webview process handles the requests in the order they were sent.
+    def submit(self, webview_data):
+        """ Send one request to the webview process and return a Future for its reply """
+        futures = self.submit_many([webview_data])
+        return futures[0] if futures else None
+
+    def submit_many(self, webview_data_list):
+        """ Send several requests in one message and return a list of Futures for their replies """
+        webview_data_list = [webview_data for webview_data in webview_data_list if webview_data]
+        if not webview_data_list or not self._ensure_started():
+            return []
+
+        message = []
+        futures = []
+        with self._lock:
+            for webview_data in webview_data_list:
+                request_id = self._next_request_id
+                self._next_request_id += 1
+
+                future = Future()
+                self._futures[request_id] = future
+                futures.append(future)
+                message.append( dict(webview_data, request_id=request_id) )
+
+        self._to_wv.put( message )
+        return futures
+
+    def _read_replies(self):
+        # The queue is polled, so that the reader also stops when the webview
+        # process was terminated without replying
+        while not self._reader_stop.is_set():
+            try:
+                reply = self._from_wv.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                future = self._futures.pop(reply.get('request_id', None), None)
+
+            # A request may get more than one reply, only the first one counts
+            if future is not None:
+                future.set_result(reply)
+
+    def _stop_reader(self):
+        self._reader_stop.set()
+        self._reader.join()
+        self._reader = None
+
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(Exception("The webview process was stopped"))
+
     def __call__(self, command, cmd_data=None, window_id=None, debug=False, data=None):
-        if not self._process_running:
+        if not self._ensure_started():
             return False
         
         if type(command) is tuple and len(command) == 2:
@@ -1059,11 +1183,8 @@ class WebviewManager:
             data
         )
 
-        # Send command and data to webview process
-        self._to_wv.put( webview_data )
-
-        # Wait for result from webview process
-        result = self._from_wv.get()    
+        # Send command and data to webview process and wait for the result
+        result = self.submit(webview_data).result()
 
         ret_cmd = result.get("command", None)
         if not ret_cmd:
@@ -1073,9 +1194,8 @@ class WebviewManager:
         return result
 
     def process(self, webview_data):
-        if not self._process_running:
+        if not self._ensure_started():
             return False
 
-        # Send command and data to webview process
-        self._to_wv.put( webview_data, timeout=3 )
-        return self._from_wv.get(timeout=5)
+        # Send command and data to webview process and wait for the result
+        return self.submit(webview_data).result(timeout=5)
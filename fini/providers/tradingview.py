@@ -1,6 +1,5 @@
 from .. managers import provider
-from .. import util
-import re, webview
+import re
 
 __all__ = ['TradingViewProvider']
 __docformat__ = 'restructuredtext'
@@ -146,12 +145,10 @@ class TradingViewProvider(provider.ProviderBase):
 
     @staticmethod
     def generate_webview_ctx(wctx):
-        # Pre-calculate size and position of window_1
-        screen_width, screen_height = util.screen.size()
+        # Size of window_1. Without a position it is placed at the top right 
+        # corner of the screen once it is created.
         window_1_width  = 800
         window_1_height = 500 
-        window_1_pos_x = screen_width - window_1_width
-        window_1_pos_y = 0
 
         wctx.add_webview(
             window_id="window_1",
@@ -162,7 +159,7 @@ class TradingViewProvider(provider.ProviderBase):
             html_callback=TradingViewProvider.get_stock_chart_html,
             js_api=None,
             size=(window_1_width, window_1_height),
-            position=(window_1_pos_x, window_1_pos_y),
+            position=None,
             min_size=(200, 100),
             resizable=True,
             fullscreen=False,
@@ -5,6 +5,142 @@ import re
 __all__ = ['ZacksProvider']
 __docformat__ = 'restructuredtext'
 
+#====================================================
+# Converters
+#====================================================
+# Module level functions rather than lambdas, so that QUOTE_FIELDS can be
+# pickled and sent to parse worker processes.
+def _to_float(value):
+    return float(value.replace(",", "").replace("NA", "0"))
+
+def _to_int(value):
+    return int(value.replace(",", "").replace("NA", "0"))
+
+def _float_group(m):
+    return _to_float(m.group(1))
+
+def _int_group(m):
+    return _to_int(m.group(1))
+
+def _second_group(m):
+    return m.group(2)
+
+def _company(m):
+    return m.group(2).replace(',', '') # remove commas
+
+def _updated(m):
+    return m.group(1) + " ET"
+
+def _float_and_unit(m):
+    return _to_float(m.group(1)), m.group(2)
+
+def _dividend(m):
+    return _to_float(m.group(1)), float(m.group(2))
+
+def _trend(m):
+    return m.group(2).split(" ")[1]
+
+def _sector_rank(m):
+    return m.group(2) + " " + m.group(3)
+
+def _industry(m):
+    ind = m.group(2).split("-")
+    if len(ind) == 1:
+        return ind[0], None
+    if len(ind) == 2:
+        return ind[0].replace(" ", ""), ind[1].replace(" ", "")
+    return None
+
+def _net_change(m):
+    pr = m.group(1)
+    if pr[0] == "+":
+        return float(m.group(1).replace("+", "")), float(m.group(2).replace("+", ""))
+    elif pr[0] == "-":
+        return -1*float(m.group(1).replace("-", "")), -1*float(m.group(2).replace("-", ""))
+    return None
+
+def _next_earnings_date(m):
+    if not m.group(1):
+        return m.group(2)
+    return m.group(1).replace("*", "") + " " + m.group(2)
+
+#====================================================
+# Quote page fields
+#====================================================
+QUOTE_FIELDS = util.extract.FieldExtractor()
+
+# Overview
+QUOTE_FIELDS.add_field('overview.ticker', "<!--//www.zacks.com/stock/quote/", "<!--//www.zacks.com/stock/quote/(.*)\\?")
+# e.g. <h2>(Delayed Data from NSDQ)</h2>
+QUOTE_FIELDS.add_field('overview.exchange', "<h2>(Delayed Data from ", "<h2>\\(Delayed Data from (.*)\\)</h2>")
+QUOTE_FIELDS.add_field('overview.company', "<a href=\"/stock/quote/", "<a href=\"/stock/quote/(.*)\">(.*) \\((.*)\\)</a>", 
+    _company)
+# e.g <span id="timestamp">Nov 13, 2020 12:45 PM</span>
+QUOTE_FIELDS.add_field('overview.updated', "<span id=\"timestamp\">", "<span id=\"timestamp\">(.*)</span>", 
+    _updated)
+QUOTE_FIELDS.add_field('overview.sector', "<a href=\"https://www.zacks.com/stocks/industry-rank/sector/", 
+    "<a href=\"https://www.zacks.com/stocks/industry-rank/sector/(.*)\">(.*)</a><span", _second_group)
+QUOTE_FIELDS.add_field(['overview.industry', 'overview.sub_industry'], "</span><a href=\"https://www.zacks.com/stocks/industry-rank/industry/", 
+    "</span><a href=\"https://www.zacks.com/stocks/industry-rank/industry/(.*)\">(.*)</a>", _industry)
+
+# Stock activity
+QUOTE_FIELDS.add_field(['stock_activity.stock_price', 'stock_activity.stock_currency'], "<p class=\"last_price\">$", 
+    "<p class=\"last_price\">\\$(.*)<span> (.*)</span></p>", _float_and_unit)
+QUOTE_FIELDS.add_field('stock_activity.volume', "<div id=\"get_volume\" class=\"hide\">", 
+    "<div id=\"get_volume\" class=\"hide\">(.*)</div>", _int_group)
+QUOTE_FIELDS.add_field(['stock_activity.change_price', 'stock_activity.change_percent'], "id=\"net_change\"> ", 
+    "id=\"net_change\"> (.*) \\((.*)%\\)</p>", _net_change)
+QUOTE_FIELDS.add_field('stock_activity.stock_open', "<td class=\"alpha\">Open</td>", 
+    "<td class=\"alpha\">Open</td>\n                    <td>(.*)</td>", _float_group)
+QUOTE_FIELDS.add_field('stock_activity.stock_day_low', "<td class=\"alpha\">Day Low</td>", 
+    "<td class=\"alpha\">Day Low</td>\n                    <td>(.*)</td>", _float_group)
+QUOTE_FIELDS.add_field('stock_activity.stock_day_high', "<td class=\"alpha\">Day High</td>", 
+    "<td class=\"alpha\">Day High</td>\n                    <td>(.*)</td>", _float_group)
+QUOTE_FIELDS.add_field('stock_activity.stock_52_wk_low', "<td class=\"alpha\">52 Wk Low</td>", 
+    "<td class=\"alpha\">52 Wk Low</td>\n                    <td>(.*)</td>", _float_group)
+QUOTE_FIELDS.add_field('stock_activity.stock_52_wk_high', "<td class=\"alpha\">52 Wk High</td>", 
+    "<td class=\"alpha\">52 Wk High</td>\n                    <td>(.*)</td>", _float_group)
+QUOTE_FIELDS.add_field('stock_activity.avg_volume', "<td class=\"alpha\">Avg. Volume</td>", 
+    "<td class=\"alpha\">Avg. Volume</td>\n                    <td><span>(.*)</span></td>", _int_group)
+QUOTE_FIELDS.add_field(['stock_activity.market_cap', 'stock_activity.market_cap_unit'], "<td class=\"alpha\">Market Cap</td>", 
+    "<td class=\"alpha\">Market Cap</td>\n                    <td><span>(.*) (.*)</span></td>", _float_and_unit)
+
+# Financial
+QUOTE_FIELDS.add_field(['financial.dividend', 'financial.dividend_percent'], "Dividend</a></td>", 
+    "Dividend</a></td>\n                    <td><span>(.*) \\( (.*)%\\)</span>", _dividend)
+QUOTE_FIELDS.add_field('financial.next_earnings_date', "<td><sup class=\"spl_sup_text\">", 
+    "<td><sup class=\"spl_sup_text\">(.*)</sup>(.*)</td>", _next_earnings_date)
+
+# Technical
+QUOTE_FIELDS.add_field('technical.beta', "Beta</a></td>", "Beta</a></td>\n                    <td><span>(.*)</span>", _float_group)
+
+# Zacks ESP
+QUOTE_FIELDS.add_field('zacks_esp.earnings_esp', "<p class=\"premium\"><a href=\"//www.zacks.com/premium/esp-buy?", 
+    "<p class=\"premium\"><a href=\"//www.zacks.com/premium/esp-buy\\?adid=zp_esptooltip&icid=zpi_esptooltip\">See the Full List of Stocks To Beat Earnings</a></p><!--MSG:17305-->\n                        </div>\n                    </td>\n                    <td class=\"\">(.*)%</td>\n                </tr>\n                <tr>\n", 
+    _float_group)
+
+# Valuation
+QUOTE_FIELDS.add_field('valuation.forward_pe_f1', "Forward PE</a></td>", "Forward PE</a></td>\n                    <td>(.*)</td>", _float_group)
+QUOTE_FIELDS.add_field('valuation.peg_ratio', "PEG Ratio</a></td>", "PEG Ratio</a></td>\n                    <td>(.*)</td>", _float_group)
+
+# Zacks rank
+QUOTE_FIELDS.add_field('zacks_rank.zacks_rank', "<p class=\"rank_view\">", 
+    "<p class=\"rank_view\">\n                       (.*)<span class=\"sr-only\"> of 5</span>")
+QUOTE_FIELDS.add_field('zacks_rank.zacks_trend', "<img src=\"https://staticx.zacks.com/images/newzp_", 
+    "<img src=\"https://staticx.zacks.com/images/newzp_(.*).gif\" alt=\"(.*)\" border=\"0\" class=\"premium_resicon\"/>", 
+    _trend)
+QUOTE_FIELDS.add_field('zacks_rank.zacks_score_value', "\"composite_val\">", "\"composite_val\">(.)</span> Value <span")
+QUOTE_FIELDS.add_field('zacks_rank.zacks_score_growth', "\"composite_val\">", "\"composite_val\">(.)</span> Growth <span")
+QUOTE_FIELDS.add_field('zacks_rank.zacks_score_momentum', "\"composite_val\">", "\"composite_val\">(.)</span> Momentum <span")
+QUOTE_FIELDS.add_field('zacks_rank.zacks_score_total', "<span class=\"composite_val composite_val_vgm\">", 
+    "<span class=\"composite_val composite_val_vgm\">(.)</span> VGM</p>")
+QUOTE_FIELDS.add_field('zacks_rank.sector_rank', "<a href=\"/stocks/industry-rank/sector/", 
+    "<a href=\"/stocks/industry-rank/sector/(.*)\" ><span class=\"rank_direction\"> (.*)</span> (.*) </a>", 
+    _sector_rank)
+QUOTE_FIELDS.add_field('zacks_rank.industry_rank', "<p class=\"rank_view\">", 
+    "<p class=\"rank_view\">\n<a href=\"/stocks/industry-rank/industry/(.*)\" class=\"status\">(.*)</a>                </p>", 
+    _second_group)
+
 class ZacksProvider(provider.ProviderBase):
     def __init__(self, *args, **kwargs):
         # We need to call the superclass __init__ here.
@@ -18,7 +154,7 @@ class ZacksProvider(provider.ProviderBase):
 
     @staticmethod
     def generate_URL_ctx(uctx, provider):
-        uctx.add_url("https://www.zacks.com/stock/quote/{ticker}?q={ticker}", provider.data_parser_1)
+        uctx.add_url("https://www.zacks.com/stock/quote/{ticker}?q={ticker}", provider.data_parser_1, extractor=QUOTE_FIELDS)
         uctx.add_url("https://www.zacks.com/stock/quote/{ticker}/detailed-estimates", provider.data_parser_2)
         uctx.add_url("https://www.zacks.com/stock/research/{ticker}/brokerage-recommendations", provider.data_parser_3)
 
@@ -236,226 +372,28 @@ class ZacksProvider(provider.ProviderBase):
         dctx.view("big").add_panel("overview", [0, 0])
         dctx.view("big").add_panel("valuation", [85, 0])
         dctx.view("big").add_panel("url", [50, 22])
+
+    @staticmethod
+    def generate_webview_ctx(wctx):
+        # Zacks has no webviews
+        pass
     
     def data_parser_1(self, URL, data, data_ctx):
-        #====================================================
-        # Ticker Symbol
-        #====================================================
-        m = re.search("<!--//www.zacks.com/stock/quote/(.*)\\?", data)
-        if m:
-            data_ctx.set_data( 'overview.ticker', m.group(1) )
-
+        # The fields of the quote page are extracted by QUOTE_FIELDS before 
+        # this parser is called
         data_ctx.set_data( 'overview.url', URL )
-
-        #====================================================
-        # Exchange
-        #====================================================
-        # e.g. <h2>(Delayed Data from NSDQ)</h2>
-        m = re.search("<h2>\\(Delayed Data from (.*)\\)</h2>", data)
-        if m:
-            data_ctx.set_data( 'overview.exchange', m.group(1) )
-    
-        #====================================================
-        # Company
-        #====================================================
-        m = re.search("<a href=\"/stock/quote/(.*)\">(.*) \\((.*)\\)</a>", data)
-        if m:
-            data_ctx.set_data( 'overview.company', m.group(2).replace(',', '') ) # remove commas
-
-        #====================================================
-        # Updated
-        #====================================================
-        # e.g <span id="timestamp">Nov 13, 2020 12:45 PM</span>
-        m = re.search("<span id=\"timestamp\">(.*)</span>", data)
-        if m:
-            data_ctx.set_data( 'overview.updated', m.group(1) + " ET" )
-    
-        #====================================================
-        # Requested
-        #====================================================
         data_ctx.set_data( 'overview.requested', util.time.get_datetime_now_as_string() )
-
-        #====================================================
-        # Sector
-        #====================================================
-        m = re.search("<a href=\"https://www.zacks.com/stocks/industry-rank/sector/(.*)\">(.*)</a><span", data)
-        if m:
-            data_ctx.set_data( 'overview.sector', m.group(2) )
-
-        #====================================================
-        # Industry
-        #====================================================
-        m = re.search("</span><a href=\"https://www.zacks.com/stocks/industry-rank/industry/(.*)\">(.*)</a>", data)
-        if m:
-            ind = m.group(2).split("-")
-            if len(ind) == 1:
-                data_ctx.set_data( 'overview.industry', ind[0] )
-            if len(ind) == 2:
-                data_ctx.set_data( 'overview.industry', ind[0].replace(" ", "") )
-                data_ctx.set_data( 'overview.sub_industry', ind[1].replace(" ", "") )
-
-        #====================================================
-        # Country
-        #====================================================
-        m = re.search("<p class=\"last_price\">\$(.*)<span> (.*)</span></p>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.stock_price', float(m.group(1).replace(",", "").replace("NA", "0")) )
-            data_ctx.set_data( 'stock_activity.stock_currency', m.group(2) )
-
-        m = re.search("<div id=\"get_volume\" class=\"hide\">(.*)</div>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.volume', int(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("id=\"net_change\"> (.*) \((.*)%\)</p>", data)
-        if m:
-            pr = m.group(1)
-            if pr[0] == "+":
-                data_ctx.set_data( 'stock_activity.change_price', float(m.group(1).replace("+", "")) )
-                data_ctx.set_data( 'stock_activity.change_percent', float(m.group(2).replace("+", "")) )
-            elif pr[0] == "-":
-                data_ctx.set_data( 'stock_activity.change_price', -1*float(m.group(1).replace("-", "")) )
-                data_ctx.set_data( 'stock_activity.change_percent', -1*float(m.group(2).replace("-", "")) )
-
-        m = re.search("<td class=\"alpha\">Open</td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.stock_open', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<td class=\"alpha\">Day Low</td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.stock_day_low', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<td class=\"alpha\">Day High</td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.stock_day_high', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<td class=\"alpha\">52 Wk Low</td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.stock_52_wk_low', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<td class=\"alpha\">52 Wk High</td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.stock_52_wk_high', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<td class=\"alpha\">Avg. Volume</td>\n                    <td><span>(.*)</span></td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.avg_volume', int(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<td class=\"alpha\">Market Cap</td>\n                    <td><span>(.*) (.*)</span></td>", data)
-        if m:
-            data_ctx.set_data( 'stock_activity.market_cap', float(m.group(1).replace(",", "").replace("NA", "0")) )
-            data_ctx.set_data( 'stock_activity.market_cap_unit', m.group(2) )
-
-        m = re.search("Dividend</a></td>\n                    <td><span>(.*) \( (.*)%\)</span>", data)
-        if m:
-            data_ctx.set_data( 'financial.dividend', float(m.group(1).replace(",", "").replace("NA", "0")) )
-            data_ctx.set_data( 'financial.dividend_percent', float(m.group(2)) )
-
-        m = re.search("Beta</a></td>\n                    <td><span>(.*)</span>", data)
-        if m:
-            data_ctx.set_data( 'technical.beta', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("<p class=\"premium\"><a href=\"//www.zacks.com/premium/esp-buy?adid=zp_esptooltip&icid=zpi_esptooltip\">See the Full List of Stocks To Beat Earnings</a></p><!--MSG:17305-->\n                        </div>\n                    </td>\n                    <td class="">(.*)%</td>\n                </tr>\n                <tr>\n", data)
-        if m:
-            data_ctx.set_data( 'zacks_esp.earnings_esp', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        # m = re.search("Most Accurate Est</a></td>\n                    <td>(.*)</td>", data)
-        # if m:
-        #     data_ctx.set_data( 'most_accurate_est', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        # m = re.search("Current Qtr Est</a></td>\n                    <td>(.*)</td>", data)
-        # if m:
-        #     data_ctx.set_data('current_qtr_est', float(m.group(1).replace(",", "").replace("NA", "0"))
-
-        # m = re.search("Current Yr Est</a></td>\n                    <td>(.*)</td>", data)
-        # if m:
-        #     data_ctx.set_data('current_yr_est', float(m.group(1).replace(",", "").replace("NA", "0"))
-
-        m = re.search("<td><sup class=\"spl_sup_text\">(.*)</sup>(.*)</td>", data)
-        if m:
-            if not m.group(1):
-                data_ctx.set_data( 'financial.next_earnings_date', m.group(2) )
-            else:
-                data_ctx.set_data( 'financial.next_earnings_date', m.group(1).replace("*", "") + " " + m.group(2) )
-
-        # m = re.search("Prior Year EPS</td>\n                    <td>(.*)</td>", data)
-        # if m:
-        #     data_ctx.set_data('prior_year_eps', float(m.group(1).replace(",", "").replace("NA", "0"))
-
-        # m = re.search("Exp EPS Growth <span class=\"year\">\(3-5yr\)</span></a><p class=\"up float_right\">(.*)%</p></td>", data)
-        # if m:
-        #     data_ctx.set_data('exp_eps_growth_3_5_yr', float(m.group(1).replace(",", "").replace("NA", "0"))
-
-        m = re.search("Forward PE</a></td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'valuation.forward_pe_f1', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        m = re.search("PEG Ratio</a></td>\n                    <td>(.*)</td>", data)
-        if m:
-            data_ctx.set_data( 'valuation.peg_ratio', float(m.group(1).replace(",", "").replace("NA", "0")) )
-
-        #====================================================
-        # Zacks Rank
-        #====================================================
-        m = re.search("<p class=\"rank_view\">\n                       (.*)<span class=\"sr-only\"> of 5</span>", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.zacks_rank', m.group(1) )
-    
-        #====================================================
-        # Zacks Trend
-        #====================================================
-        m = re.search("<img src=\"https://staticx.zacks.com/images/newzp_(.*).gif\" alt=\"(.*)\" border=\"0\" class=\"premium_resicon\"/>", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.zacks_trend', m.group(2).split(" ")[1] )
-
-        #====================================================
-        # Zacks Score Value
-        #====================================================
-        m = re.search("\"composite_val\">(.)</span> Value <span", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.zacks_score_value', m.group(1) )
-
-        #====================================================
-        # Zacks Score Growth
-        #====================================================
-        m = re.search("\"composite_val\">(.)</span> Growth <span", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.zacks_score_growth', m.group(1) )
-
-        #====================================================
-        # Zacks Score Momentum
-        #====================================================
-        m = re.search("\"composite_val\">(.)</span> Momentum <span", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.zacks_score_momentum', m.group(1) )
-
-        #====================================================
-        # Zacks Score Total
-        #====================================================
-        m = re.search("<span class=\"composite_val composite_val_vgm\">(.)</span> VGM</p>", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.zacks_score_total', m.group(1) )
-
-        #====================================================
-        # Sector Rank
-        #====================================================
-        m = re.search("<a href=\"/stocks/industry-rank/sector/(.*)\" ><span class=\"rank_direction\"> (.*)</span> (.*) </a>", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.sector_rank', m.group(2) + " " + m.group(3) )
-
-        #====================================================
-        # Industry Rank
-        #====================================================
-        m = re.search("<p class=\"rank_view\">\n<a href=\"/stocks/industry-rank/industry/(.*)\" class=\"status\">(.*)</a>                </p>", data)
-        if m:
-            data_ctx.set_data( 'zacks_rank.industry_rank', m.group(2) )
+        return True
     
 
     def data_parser_2(self,  URL, website_data, data_ctx):
-        pass
+        # Nothing is parsed from this page yet
+        return None
     
 
     def data_parser_3(self,  URL, website_data, data_ctx):
-        pass
+        # Nothing is parsed from this page yet
+        return None
     
 
 
@@ -3,4 +3,7 @@ from . import web
 from . import screen
 from . import font
 from . import prompt
-from . import misc
\ No newline at end of file
+from . import misc
+from . import extract
+from . import stats
+from . import serial
\ No newline at end of file
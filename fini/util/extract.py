@@ -0,0 +1,178 @@
+import re
+
+__all__ = [
+    'FieldExtractor',
+]
+
+class _field:
+    def __init__(self, paths, anchor, pattern, converter, window):
+        self.paths     = paths
+        self.anchor    = anchor
+        self.regex     = re.compile(pattern)
+        self.converter = converter
+        self.window    = window
+
+class FieldExtractor:
+    """ Extract data fields from a page with precompiled patterns
+
+    Fields are declared once with 'add_field'. Every field has an anchor: the
+    literal text its pattern starts with. All anchors are located in a single
+    scan over the page, and each pattern is then only matched at the positions
+    of its anchor, within a window that extends 'window' characters past the
+    anchor and on to the end of that line. For a pattern that starts with its
+    anchor this gives the same match as re.search over the whole page, without
+    leading '(.*)' groups backtracking across the document.
+    """
+    def __init__(self, window=512):
+        self._window   = window
+        self._fields   = []
+        self._scanner  = None
+        self._prefixes = {}
+
+    def add_field(self, paths, anchor, pattern, converter=None, window=None):
+        """ Declare a field
+
+        'paths' is a data path or a list of data paths. 'converter' is called
+        with the match object and returns the value for each path (a tuple
+        when there are several paths). By default the pattern groups are
+        used as they are. A value of None is not stored, and a converter that
+        raises ValueError or IndexError skips the field.
+        """
+        if type(paths) is str:
+            paths = [paths]
+        self._fields.append( _field(paths, anchor, pattern, converter, window or self._window) )
+        self._scanner = None
+
+    def fields(self):
+        return [path for field in self._fields for path in field.paths]
+
+    def compile(self):
+        # The anchors are combined in one alternation, longest first. Since it 
+        # only contains literals, the regex engine skips ahead to the characters
+        # that can start an anchor. The shorter anchors that an anchor starts 
+        # with are recorded at the same position.
+        anchors = sorted( set(field.anchor for field in self._fields), key=len, reverse=True )
+        self._prefixes = { a: [p for p in anchors if a.startswith(p)] for a in anchors }
+        self._scanner  = re.compile( "|".join(re.escape(a) for a in anchors) )
+
+    def find_anchors(self, text, pos=0, endpos=None):
+        """ Return a dictionary of anchor: list of positions in text """
+        if self._scanner is None:
+            self.compile()
+
+        positions = { anchor: [] for anchor in self._prefixes }
+        endpos = len(text) if endpos is None else endpos
+        m = self._scanner.search(text, pos, endpos)
+        while m:
+            for anchor in self._prefixes[m.group(0)]:
+                positions[anchor].append(m.start())
+            # Continue right after the start of the match, so that anchors 
+            # overlapping this one are found as well
+            m = self._scanner.search(text, m.start() + 1, endpos)
+        return positions
+
+    def extract(self, text):
+        """ Return a list of (path, value) tuples for the fields found in text """
+        stream = self.stream()
+        stream.feed(text)
+        return stream.close()
+
+    def stream(self):
+        """ Return a field_stream to extract the fields from text that arrives in chunks """
+        if self._scanner is None:
+            self.compile()
+        return field_stream(self)
+
+    @staticmethod
+    def _convert(field, m):
+        try:
+            if field.converter:
+                values = field.converter(m)
+            else:
+                values = m.groups() if len(field.paths) > 1 else m.group(1)
+        except (ValueError, IndexError):
+            return []
+
+        if len(field.paths) == 1:
+            values = (values,)
+        elif values is None:
+            return []
+
+        return [ (path, value) for path, value in zip(field.paths, values) if value is not None ]
+
+
+class field_stream:
+    """ Incremental extraction of the fields of a FieldExtractor
+
+    Text is passed to 'feed' as it arrives. Anchors are located in the new
+    text only, and a field is matched as soon as the window after one of its
+    anchors is complete. 'done' is set once every field has been resolved, 
+    at which point the rest of the page is not needed. 'close' resolves the
+    remaining fields against the text received so far and returns the
+    (path, value) tuples, in the order the fields were declared.
+    """
+    def __init__(self, extractor):
+        self._extractor = extractor
+        self._fields    = extractor._fields
+        self._text      = ""
+        self._last      = -1
+        self._overlap   = max( [len(a) for a in extractor._prefixes] or [1] ) - 1
+        self._positions = { anchor: [] for anchor in extractor._prefixes }
+        self._next      = [0] * len(self._fields)
+        self._results   = [None] * len(self._fields)
+        self._pending   = list(range(len(self._fields)))
+        self.done       = not self._pending
+
+    def feed(self, text):
+        if self.done:
+            return
+        start = max(0, len(self._text) - self._overlap)
+        self._text += text
+        self._scan(start)
+        self._resolve(final=False)
+
+    def close(self):
+        self._resolve(final=True)
+        return [ item for result in self._results if result for item in result ]
+
+    def _scan(self, start):
+        # Anchors that end in the last few characters of the previous text
+        # are found again, so only positions after the last recorded one count
+        scanner  = self._extractor._scanner
+        prefixes = self._extractor._prefixes
+        m = scanner.search(self._text, start)
+        while m:
+            if m.start() > self._last:
+                for anchor in prefixes[m.group(0)]:
+                    self._positions[anchor].append(m.start())
+                self._last = m.start()
+            # Continue right after the start of the match, so that anchors 
+            # overlapping this one are found as well
+            m = scanner.search(self._text, m.start() + 1)
+
+    def _resolve(self, final):
+        # Match each pending field at its anchor positions in order. A field
+        # waits at a position whose window has not fully arrived yet, so the
+        # first match in the page is always the one that is used.
+        text = self._text
+        for idx in list(self._pending):
+            field     = self._fields[idx]
+            positions = self._positions[field.anchor]
+            while self._next[idx] < len(positions):
+                pos = positions[self._next[idx]]
+                end = text.find("\n", pos + field.window)
+                if end == -1:
+                    if not final:
+                        break
+                    end = len(text)
+
+                m = field.regex.match(text, pos, end)
+                if m:
+                    self._results[idx] = FieldExtractor._convert(field, m)
+                    self._pending.remove(idx)
+                    break
+                self._next[idx] += 1
+
+        if final:
+            self._pending = []
+        self.done = not self._pending
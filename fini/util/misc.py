@@ -80,6 +80,18 @@ class DictUtil:
                 else:
                     root[entries[0]] = value
 
+    @staticmethod
+    def get_leaf_paths(dictionary, parent=None):
+        """Return the dotted paths of all non-dictionary values in dictionary."""
+        paths = []
+        for key, value in dictionary.items():
+            path = parent + "." + key if parent else key
+            if type(value) is dict and value:
+                paths.extend(DictUtil.get_leaf_paths(value, path))
+            else:
+                paths.append(path)
+        return paths
+
     @staticmethod
     def get_max_key_length(dictionary, parent=None, max_length=0):
         
@@ -1,14 +1,24 @@
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.styles import Style as PPT_Style
-
 __all__ = [
-    'PromptSession', 'FileHistory', 'PPT_Style'
+    'PromptSession', 'FileHistory', 'PPT_Style',
     'get_prompt_style_from_settings',
     'get_prompt_message_from_settings',
 ]
 
+def __getattr__(name):
+    # prompt_toolkit is only imported when the interactive prompt is used
+    if name == "PromptSession":
+        from prompt_toolkit import PromptSession
+        return PromptSession
+    elif name == "FileHistory":
+        from prompt_toolkit.history import FileHistory
+        return FileHistory
+    elif name == "PPT_Style":
+        from prompt_toolkit.styles import Style as PPT_Style
+        return PPT_Style
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
 def get_prompt_style_from_settings(settings):
+    from prompt_toolkit.styles import Style as PPT_Style
     promt_settings = settings['global']['prompt']
     return PPT_Style.from_dict( {
         '': "#" + promt_settings['cmd_colour'],
@@ -1,5 +1,4 @@
 import os, sys, colorama
-import tkinter as tk
 from colorama import Fore, Back, Style, Cursor
 from .time import get_datetime_now_as_string
 from .. import fonts
@@ -8,7 +7,7 @@ from .. import version
 __all__ = [
     'pos', 'Fore', 'Back', 'Style', 'Cursor', 'app_welcome_message',
     'screen_size' ,'move_cursor', 'erase_screen', 'clear_screen',
-    'scroll_down', 'hide_cursor', 'show_cursor',
+    'scroll_down', 'hide_cursor', 'show_cursor', 'display_available',
 ]
 
 pos = lambda x, y: Cursor.POS(x, y)
@@ -27,7 +26,19 @@ def app_welcome_message():
     print("Local time: {}".format(get_datetime_now_as_string()))
     print("")
 
+def display_available():
+    # Without a display server there is no screen to measure or draw windows on
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
 def size():
+    # tkinter is only imported here, so that the terminal application never
+    # loads GUI libraries unless the screen size is actually needed. Without
+    # a display the size is (0, 0).
+    if not display_available():
+        return 0, 0
+    import tkinter as tk
     os.environ["TK_SILENCE_DEPRECATION"] = "1"
     root   = tk.Tk()
     width  = root.winfo_screenwidth()
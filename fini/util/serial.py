@@ -0,0 +1,125 @@
+import json, struct
+
+__all__ = [
+    'dumps', 'loads', 'pack', 'unpack', 'dumps_fbin', 'loads_fbin', 'backends', 'FBIN_MAGIC',
+]
+
+#================================================================
+# Optional backends
+#================================================================
+# orjson is used for JSON and msgpack for the binary format when they are
+# installed. Both are imported on first use. None means not imported yet and
+# False means not installed.
+orjson  = None
+msgpack = None
+
+def _import_orjson():
+    global orjson
+    if orjson is None:
+        try:
+            import orjson as _orjson
+            orjson = _orjson
+        except ImportError:
+            orjson = False
+    return orjson
+
+def _import_msgpack():
+    global msgpack
+    if msgpack is None:
+        try:
+            import msgpack as _msgpack
+            msgpack = _msgpack
+        except ImportError:
+            msgpack = False
+    return msgpack
+
+def backends():
+    """ Return the names of the libraries used for JSON and for the binary format """
+    return {
+        "json": "orjson" if _import_orjson() else "json",
+        "binary": "msgpack" if _import_msgpack() else "json",
+    }
+
+#================================================================
+# JSON
+#================================================================
+def dumps(obj, indent=None):
+    """ Return obj as UTF-8 encoded JSON
+
+    orjson only indents by 2 spaces, so any other 'indent' is handled by the
+    json module. Values orjson does not support (e.g. integers wider than 64
+    bits) fall back to the json module as well.
+    """
+    if _import_orjson() and indent in (None, 2):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=indent).encode("utf-8")
+
+def loads(data):
+    """ Return the object encoded as JSON in data (bytes or str) """
+    if _import_orjson():
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # e.g. escaped lone surrogates, which the json module accepts
+            pass
+    return json.loads(data)
+
+#================================================================
+# Binary
+#================================================================
+# 'pack' uses msgpack when it is installed and JSON otherwise. 'unpack' reads
+# either: JSON documents written by this application always start with '{' or
+# '[', which msgpack never uses as the first byte of a map or an array.
+def pack(obj):
+    if _import_msgpack():
+        return msgpack.packb(obj, use_bin_type=True)
+    return dumps(obj)
+
+def unpack(data):
+    if type(data) is str or data[:1] in (b"{", b"["):
+        return loads(data)
+    if not _import_msgpack():
+        raise Exception("Data packed with msgpack cannot be read, since msgpack is not installed")
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+#================================================================
+# .fbin files
+#================================================================
+# A .fbin file is a 6 byte header followed by the packed data:
+#
+#   b"FBIN"    magic
+#   version    1 byte, currently 1
+#   codec      1 byte, 1 for JSON and 2 for msgpack
+FBIN_MAGIC   = b"FBIN"
+_FBIN_HEADER = struct.Struct(">4sBB")
+_FBIN_VERSION = 1
+_CODEC_JSON    = 1
+_CODEC_MSGPACK = 2
+
+def dumps_fbin(obj):
+    if _import_msgpack():
+        return _FBIN_HEADER.pack(FBIN_MAGIC, _FBIN_VERSION, _CODEC_MSGPACK) + msgpack.packb(obj, use_bin_type=True)
+    return _FBIN_HEADER.pack(FBIN_MAGIC, _FBIN_VERSION, _CODEC_JSON) + dumps(obj)
+
+def loads_fbin(data):
+    if len(data) < _FBIN_HEADER.size:
+        raise Exception("Not a .fbin file: the data is too short")
+
+    magic, version, codec = _FBIN_HEADER.unpack_from(data)
+    if magic != FBIN_MAGIC:
+        raise Exception("Not a .fbin file: bad magic {}".format(magic))
+    if version > _FBIN_VERSION:
+        raise Exception(".fbin version {} is newer than the supported version {}".format(version, _FBIN_VERSION))
+
+    payload = memoryview(data)[_FBIN_HEADER.size:]
+    if codec == _CODEC_JSON:
+        return loads(bytes(payload))
+    elif codec == _CODEC_MSGPACK:
+        if not _import_msgpack():
+            raise Exception("The .fbin data is packed with msgpack, which is not installed")
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    else:
+        raise Exception("Unknown .fbin codec {}".format(codec))
@@ -0,0 +1,217 @@
+import math, json, time, threading
+
+__all__ = [
+    'histogram', 'stats_collector', 'collector',
+]
+
+#================================================================
+# Histograms
+#================================================================
+class histogram:
+    """ Log-linear histogram of positive values (e.g. durations in seconds)
+
+    Every power of two is split into 'SUB_BUCKETS' buckets, so percentiles are
+    within about 1/SUB_BUCKETS of the true value. Adding a value costs a frexp
+    and a dictionary update, whatever the number of values.
+    """
+    SUB_BUCKETS = 16
+
+    def __init__(self):
+        self._buckets = {}
+        self.count    = 0
+        self.total    = 0.0
+        self.min      = None
+        self.max      = None
+
+    def add(self, value):
+        if value > 0:
+            mantissa, exponent = math.frexp(value)
+            idx = exponent * self.SUB_BUCKETS + int((mantissa - 0.5) * 2 * self.SUB_BUCKETS)
+        else:
+            idx = None
+        self._buckets[idx] = self._buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for idx, count in other._buckets.items():
+            self._buckets[idx] = self._buckets.get(idx, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def _bucket_value(self, idx):
+        # Middle of the bucket
+        if idx is None:
+            return 0.0
+        exponent, sub = divmod(idx, self.SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.SUB_BUCKETS), exponent)
+
+    def percentile(self, p):
+        """ Return the p-th percentile (0 to 100), or None if there are no values """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100.0))
+        seen = 0
+        for idx in sorted(self._buckets, key=lambda i: -math.inf if i is None else i):
+            seen += self._buckets[idx]
+            if seen >= rank:
+                return min(self.max, max(self.min, self._bucket_value(idx)))
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean(),
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+#================================================================
+# Collector
+#================================================================
+class _stage_timer:
+    # Context manager that records the time spent in its block
+    __slots__ = ("_collector", "_key", "_t0")
+
+    def __init__(self, collector, key):
+        self._collector = collector
+        self._key       = key
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._collector._record(self._key, time.perf_counter() - self._t0)
+        return False
+
+
+class stats_collector:
+    """ Timings and counters of the processing stages
+
+    Timings are kept in one histogram per (stage, provider_id, template) and
+    counters are summed per (name, provider_id, template). 'template' is the
+    URL template of a request, or the name of a view; provider_id and
+    template may be None. All methods are thread safe. While 'enabled' is
+    False nothing is recorded.
+    """
+    def __init__(self, enabled=True):
+        self.enabled   = enabled
+        self._lock     = threading.Lock()
+        self._timings  = {}
+        self._counters = {}
+        self._since    = time.time()
+
+    def timer(self, stage, provider_id=None, template=None):
+        """ Return a context manager that records the time spent in its block """
+        return _stage_timer(self, (stage, provider_id, template))
+
+    def record(self, stage, elapsed, provider_id=None, template=None):
+        """ Record a duration in seconds """
+        self._record((stage, provider_id, template), elapsed)
+
+    def count(self, name, value=1, provider_id=None, template=None):
+        if not self.enabled:
+            return
+        key = (name, provider_id, template)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _record(self, key, elapsed):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self._timings.get(key, None)
+            if hist is None:
+                hist = self._timings[key] = histogram()
+            hist.add(elapsed)
+
+    def reset(self):
+        with self._lock:
+            self._timings  = {}
+            self._counters = {}
+            self._since    = time.time()
+
+    def stage_totals(self):
+        """ Return a dictionary of stage: histogram over all providers and templates """
+        totals = {}
+        with self._lock:
+            for (stage, _, _), hist in self._timings.items():
+                totals.setdefault(stage, histogram()).merge(hist)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            timings  = sorted(self._timings.items(), key=lambda item: tuple(str(k) for k in item[0]))
+            counters = sorted(self._counters.items(), key=lambda item: tuple(str(k) for k in item[0]))
+            since    = self._since
+
+        return {
+            "since": since,
+            "until": time.time(),
+            "stages": { stage: hist.to_dict() for stage, hist in sorted(self.stage_totals().items()) },
+            "timings": [
+                dict(stage=stage, provider=provider_id, template=template, **hist.to_dict())
+                for (stage, provider_id, template), hist in timings
+            ],
+            "counters": [
+                dict(name=name, provider=provider_id, template=template, value=value)
+                for (name, provider_id, template), value in counters
+            ],
+        }
+
+    def export(self, file_path):
+        """ Write the statistics to file_path as JSON """
+        with open(file_path, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=4)
+        return file_path
+
+    def report(self):
+        """ Return the statistics as a printable table, with times in milliseconds """
+        data = self.to_dict()
+        if not data["timings"] and not data["counters"]:
+            return "No statistics have been collected"
+
+        header = "{:<12} {:<14} {:<48} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}".format(
+            "stage", "provider", "template", "count", "total", "p50", "p95", "p99", "max")
+        lines = [header, "-" * len(header)]
+
+        def row(stage, provider_id, template, stats):
+            return "{:<12} {:<14} {:<48} {:>7} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                stage, provider_id or "", _shorten(template or "", 48), stats["count"], 1000 * stats["total"],
+                1000 * stats["p50"], 1000 * stats["p95"], 1000 * stats["p99"], 1000 * stats["max"])
+
+        for stage, stats in data["stages"].items():
+            lines.append( row(stage, "all", "", stats) )
+        lines.append("")
+        for stats in data["timings"]:
+            lines.append( row(stats["stage"], stats["provider"], stats["template"], stats) )
+
+        if data["counters"]:
+            lines.append("")
+            for counter in data["counters"]:
+                lines.append( "{:<12} {:<14} {:<48} {:>18}".format(
+                    counter["name"], counter["provider"] or "", _shorten(counter["template"] or "", 48), counter["value"]) )
+        return "\n".join(lines)
+
+
+def _shorten(text, width):
+    return text if len(text) <= width else "..." + text[-(width - 3):]
+
+# Shared by the whole application
+collector = stats_collector()
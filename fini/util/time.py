@@ -2,7 +2,7 @@ import os, time, datetime, pytz
 
 __all__ = [
     'get_local_timezone_as_string', 'get_datetime_now_as_string', 'get_datetime_from_string',
-    'datetime_diff_from_strings',
+    'datetime_diff_from_strings', 'startup_timer', 'startup',
 ]
 
 def get_local_timezone_as_string():
@@ -31,3 +31,40 @@ def datetime_diff_from_strings(datetime_t0, datetime_t1,
     return t1 - t0    
 
 
+#================================================================
+# Startup timing
+#================================================================
+class startup_timer:
+    """ Record the time taken by each phase of the application startup
+
+    'mark' closes the current phase under the given name. The first phase
+    starts at the time passed to 'start', which can be taken before the
+    package is imported, or else when this module was imported.
+    """
+    def __init__(self):
+        self._t0    = time.perf_counter()
+        self._last  = self._t0
+        self._marks = []
+
+    def start(self, t0=None):
+        self._t0    = t0 if t0 is not None else time.perf_counter()
+        self._last  = self._t0
+        self._marks = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._marks.append( (phase, now - self._last) )
+        self._last = now
+
+    def phases(self):
+        return list(self._marks)
+
+    def total(self):
+        return self._last - self._t0
+
+    def report(self):
+        lines = [ "{:<24} {:>8.1f} ms".format(phase, 1000 * elapsed) for phase, elapsed in self._marks ]
+        lines.append( "{:<24} {:>8.1f} ms".format("total", 1000 * self.total()) )
+        return "\n".join(lines)
+
+startup = startup_timer()
@@ -1,21 +1,598 @@
-import urllib3
+import os, re, time, codecs, random, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import stats, serial
 
 __all__ = [
-    'get_URL_data'
+    'get_URL_data', 'get_URL_response', 'get_URL_host', 'create_pool_manager',
+    'url_response', 'HTTPCache', 'HostRateLimiter', 'RetryPolicy', 'fetch_job', 'URLFetcher',
+    'set_transport', 'get_transport',
 ]
 
-http = urllib3.PoolManager()
+# urllib3 is only imported once it is needed, i.e. by the first request, so
+# that importing fini does not pay for it
+urllib3 = None
+
+def _import_urllib3():
+    global urllib3
+    if urllib3 is None:
+        import urllib3 as _urllib3
+        urllib3 = _urllib3
+    return urllib3
+
+def create_pool_manager(maxsize=4, connect_timeout=5.0, read_timeout=20.0):
+    """ Return a PoolManager keeping up to 'maxsize' connections per host.
+
+    Retries of failed requests are left to RetryPolicy, the pool itself only
+    follows redirects.
+    """
+    _import_urllib3()
+    return urllib3.PoolManager(
+        maxsize=maxsize,
+        timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+        retries=urllib3.Retry(connect=0, read=0, redirect=5),
+    )
+
+# Used by the requests that are not given a pool manager. Created by the 
+# first of them.
+http = None
+
+def _default_pool_manager():
+    global http
+    if http is None:
+        http = create_pool_manager()
+    return http
+
+# When set, the transport is used for every request in place of the given 
+# pool managers. A transport is any object with the 'request' method of a 
+# urllib3 PoolManager, e.g. one that records the responses of the real pool
+# or replays recorded ones (see benchmarks/replay.py).
+_transport = None
+
+def set_transport(transport=None):
+    """ Send all requests through 'transport', or through the pool managers
+    again if it is None. Returns the previous transport.
+    """
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
+
+def get_transport():
+    return _transport
+
+# 'gzip,deflate' plus 'br' when brotli support is available to urllib3. Set
+# by the first request.
+ACCEPT_ENCODING = None
+
+def _accept_encoding():
+    global ACCEPT_ENCODING
+    if ACCEPT_ENCODING is None:
+        ACCEPT_ENCODING = _import_urllib3().util.make_headers(accept_encoding=True)['accept-encoding']
+    return ACCEPT_ENCODING
+
+class url_response:
+    """ Decoded body of a GET request along with some cache information.
+
+    'not_modified' is True when the body was served from an HTTPCache, either
+    because the stored copy was still fresh or because the server answered 
+    304 (Not Modified). 'validator' is the ETag or Last-Modified value the 
+    body is identified by, if any. 'wait_time' is the time in seconds until
+    the response headers arrived (including rate limiting and retries) and 
+    'read_time' the time taken to download and decode the body.
+    """
+    def __init__(self, URL, data, status=200, not_modified=False, validator=None, wait_time=0.0, read_time=0.0):
+        self.URL          = URL
+        self.data         = data
+        self.status       = status
+        self.not_modified = not_modified
+        self.validator    = validator
+        self.wait_time    = wait_time
+        self.read_time    = read_time
+
+
+class HTTPCache:
+    """ On-disk cache of HTTP responses keyed by URL.
+
+    Each entry keeps the decoded body together with the ETag, Last-Modified 
+    and Cache-Control headers of the response. These are used to send 
+    conditional requests (If-None-Match/If-Modified-Since) when the URL is 
+    fetched again, and to skip the request altogether while the stored copy 
+    is still fresh according to its max-age. Responses that have neither a 
+    validator nor a max-age are not stored.
+
+    Entries that have not been stored or refreshed for 'max_age' seconds are
+    evicted, and then the least recently stored ones until the entries take
+    at most 'max_bytes' bytes. 0 means no limit.
+    """
+    def __init__(self, directory, max_bytes=0, max_age=0):
+        self._directory = directory
+        self._lock      = threading.Lock()
+        self._max_bytes = max_bytes
+        self._max_age   = max_age
+        os.makedirs(self._directory, mode=0o755, exist_ok=True)
+        self.evict()
+
+    def evict(self):
+        """ Remove the entries over the age and size limits. Returns the number of removed entries. """
+        if not self._max_bytes and not self._max_age:
+            return 0
+
+        entries = []
+        with os.scandir(self._directory) as it:
+            for dir_entry in it:
+                if dir_entry.name.endswith(".json"):
+                    try:
+                        stat = dir_entry.stat()
+                    except OSError:
+                        continue
+                    entries.append( (stat.st_mtime, stat.st_size, dir_entry.path) )
+        entries.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, abs_path in entries:
+            too_old = self._max_age and now - mtime > self._max_age
+            too_big = self._max_bytes and total > self._max_bytes
+            if not too_old and not too_big:
+                break
+            try:
+                os.remove(abs_path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def _path(self, URL):
+        return os.path.join(self._directory, hashlib.sha1(URL.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, URL):
+        try:
+            with open(self._path(URL), 'rb') as json_file:
+                entry = serial.loads(json_file.read())
+        except (OSError, ValueError):
+            return None
+        
+        return entry if entry.get("url", None) == URL else None
+
+    def put(self, URL, headers, data, entry=None):
+        # Refresh the validators of an existing entry (e.g. on a 304 answer) 
+        # or store a brand new body.
+        cache_control = headers.get("Cache-Control", None)
+        if cache_control and "no-store" in cache_control.lower():
+            return None
+
+        if entry is None:
+            if not HTTPCache.is_storable(headers):
+                # Any earlier entry for this URL is stale now
+                self.remove(URL)
+                return None
+            entry = { "url": URL, "data": data }
+
+        for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified"), ("cache_control", "Cache-Control")):
+            value = headers.get(header, None)
+            if value is not None:
+                entry[key] = value
+        entry["stored_at"] = time.time()
+
+        # Write to a temporary file first, so that a reader never sees a
+        # partially written entry
+        abs_path = self._path(URL)
+        tmp_path = "{}.{}.tmp".format(abs_path, threading.get_ident())
+        with open(tmp_path, 'wb') as json_file:
+            json_file.write(serial.dumps(entry))
+        os.replace(tmp_path, abs_path)
+
+        return entry
+
+    def remove(self, URL):
+        try:
+            os.remove(self._path(URL))
+        except OSError:
+            pass
+
+    @staticmethod
+    def is_storable(headers):
+        # Only a response with a validator can be revalidated, and only one 
+        # with a max-age can be served without a request
+        if headers.get("ETag", None) or headers.get("Last-Modified", None):
+            return True
+        m = re.search("max-age=(\\d+)", (headers.get("Cache-Control", None) or "").lower())
+        return m is not None and int(m.group(1)) > 0
+
+    @staticmethod
+    def is_fresh(entry):
+        cache_control = (entry.get("cache_control", None) or "").lower()
+        if not cache_control or "no-cache" in cache_control:
+            return False
+        
+        m = re.search("max-age=(\\d+)", cache_control)
+        if not m:
+            return False
+
+        return time.time() - entry.get("stored_at", 0) < int(m.group(1))
+
+    @staticmethod
+    def validator(entry):
+        return entry.get("etag", None) or entry.get("last_modified", None)
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag", None):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified", None):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+class HostRateLimiter:
+    """ Token bucket rate limiter with one bucket per host.
+
+    Each host may be sent 'rate' requests per second on average, with bursts 
+    of up to 'burst' requests. A rate of zero disables rate limiting.
+    """
+    def __init__(self, rate=0.0, burst=1):
+        self._lock    = threading.Lock()
+        self._buckets = {}
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst):
+        with self._lock:
+            self._rate  = float(rate or 0.0)
+            self._burst = max(1.0, float(burst or 1))
+
+    def acquire(self, host):
+        while True:
+            with self._lock:
+                if self._rate <= 0:
+                    return
+
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self._burst, now))
+                tokens = min(self._burst, tokens + (now - last) * self._rate)
+                if tokens >= 1.0:
+                    self._buckets[host] = (tokens - 1.0, now)
+                    return
+
+                self._buckets[host] = (tokens, now)
+                delay = (1.0 - tokens) / self._rate
+
+            time.sleep(delay)
+
+
+class RetryPolicy:
+    """ Retry failed requests with jittered exponential backoff.
+
+    Requests are retried up to 'retries' times on connection errors, timeouts
+    and on any status in 'statuses' (429 and 5xx by default). The n-th retry 
+    waits about backoff_factor * 2**n seconds (randomised by +/-50% so that 
+    parallel requests do not retry in lockstep) and never longer than 
+    'backoff_max'. A Retry-After header sent by the server takes precedence.
+    """
+    def __init__(self, retries=3, backoff_factor=0.5, backoff_max=30.0, statuses=(429, 500, 502, 503, 504)):
+        self.retries        = max(0, int(retries))
+        self.backoff_factor = float(backoff_factor)
+        self.backoff_max    = float(backoff_max)
+        self.statuses       = frozenset(statuses)
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        delay = self.backoff_factor * (2 ** attempt) * random.uniform(0.5, 1.5)
+        return min(self.backoff_max, delay)
+
+
+def _read_body(res, end_marker=None, max_bytes=None, consumer=None, chunk_size=16384):
+    # Read and decode the (possibly compressed) body of res chunk by chunk. 
+    # Reading stops early once 'max_bytes' bytes have been received, once 
+    # 'end_marker' has appeared in the decoded text or once the consumer is
+    # done. Returns the decoded text and whether the transfer was cut short.
+    decoder  = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts    = []
+    tail     = ""
+    received = 0
+    stopped  = False
+
+    for chunk in res.stream(chunk_size, decode_content=True):
+        if max_bytes is not None and received + len(chunk) >= max_bytes:
+            chunk   = chunk[:max_bytes - received]
+            stopped = True
+        received += len(chunk)
+
+        text = decoder.decode(chunk)
+        parts.append(text)
+
+        if consumer is not None:
+            consumer.feed(text)
+            if consumer.done:
+                stopped = True
+
+        if end_marker:
+            # Only search the newly arrived text (plus enough of the previous 
+            # text to catch a marker that spans two chunks)
+            window = tail + text
+            if end_marker in window:
+                stopped = True
+            tail = window[-(len(end_marker) - 1):] if len(end_marker) > 1 else ""
+
+        if stopped:
+            break
+
+    parts.append(decoder.decode(b"", final=True))
+    if consumer is not None and parts[-1]:
+        consumer.feed(parts[-1])
+    return "".join(parts), stopped
+
+def get_URL_response(
+    URL,
+    http_pool_manager=None,
+    headers={'User-Agent': 'Mozilla/5.0'},
+    http_cache=None,
+    end_marker=None,
+    max_bytes=None,
+    rate_limiter=None,
+    retry_policy=None,
+    consumer=None,
+    verbose=False):
+    """ Return a url_response with the data from URL
+
+    The body is requested compressed (gzip/deflate, plus brotli when the 
+    brotli package is installed) and decoded incrementally as it arrives. 
+    The download stops early once 'max_bytes' (decompressed) bytes have been 
+    read or once 'end_marker' has been seen.
+
+    'consumer' is an optional object with a 'feed(text)' method and a 'done'
+    attribute (e.g. a util.extract.field_stream). It is fed the decoded text
+    as it arrives, and the download stops once it is done.
+
+    When an HTTPCache is given, a fresh cached copy is returned without 
+    contacting the server, otherwise a conditional request is made and the 
+    cached copy is returned if the server answers 304 (Not Modified).
+
+    Requests wait for the 'rate_limiter' (a HostRateLimiter) and are retried
+    according to 'retry_policy' (a RetryPolicy). Any other status than 200 
+    (or 304) raises urllib3.exceptions.ResponseError.
+    """
+    headers = dict(headers, **{'Accept-Encoding': _accept_encoding()})
+
+    entry = http_cache.get(URL) if http_cache else None
+    if entry is not None:
+        if HTTPCache.is_fresh(entry):
+            if consumer is not None:
+                consumer.feed(entry["data"])
+            return url_response(URL, entry["data"], 200, True, HTTPCache.validator(entry))
+        headers.update(HTTPCache.conditional_headers(entry))
+
+    t0  = time.perf_counter()
+    res = _request_with_retries(http_pool_manager, URL, headers, rate_limiter, retry_policy)
+    t1  = time.perf_counter()
+    try:
+        if res.status==304 and entry is not None:
+            entry = http_cache.put(URL, res.headers, None, entry) or entry
+            if consumer is not None:
+                consumer.feed(entry["data"])
+            return url_response(URL, entry["data"], 200, True, HTTPCache.validator(entry), t1 - t0)
+        elif res.status==200:
+            data, stopped = _read_body(res, end_marker, max_bytes, consumer)
+            if stopped:
+                # The rest of the body is never read, so the connection
+                # cannot be reused
+                res.close()
+            t2 = time.perf_counter()
+
+            # A body that was not read to the end is not cached, as its
+            # validators are those of the whole page. Any earlier entry for 
+            # this URL is stale now.
+            validator = None
+            if http_cache and stopped:
+                http_cache.remove(URL)
+            elif http_cache:
+                entry = http_cache.put(URL, res.headers, data)
+                if entry is not None:
+                    validator = HTTPCache.validator(entry)
+            return url_response(URL, data, res.status, False, validator, t1 - t0, t2 - t1)
+        else:
+            raise urllib3.exceptions.ResponseError("GET {} returned status {}".format(URL, res.status))
+    finally:
+        res.release_conn()
+
+def _request_with_retries(http_pool_manager, URL, headers, rate_limiter=None, retry_policy=None):
+    host    = get_URL_host(URL)
+    retries = retry_policy.retries if retry_policy else 0
+    _import_urllib3()
+    if _transport is not None:
+        http_pool_manager = _transport
+    elif http_pool_manager is None:
+        http_pool_manager = _default_pool_manager()
+
+    attempt = 0
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire(host)
+
+        try:
+            res = http_pool_manager.request('GET', URL, headers=headers, preload_content=False)
+        except urllib3.exceptions.HTTPError:
+            if attempt >= retries:
+                raise
+            time.sleep(retry_policy.delay(attempt))
+        else:
+            if attempt >= retries or res.status not in retry_policy.statuses:
+                return res
+            retry_after = res.headers.get("Retry-After", None)
+            res.drain_conn()
+            res.release_conn()
+            time.sleep(retry_policy.delay(attempt, retry_after))
+
+        attempt += 1
 
 def get_URL_data(
     URL,
-    http_pool_manager=http,
+    http_pool_manager=None,
     headers={'User-Agent': 'Mozilla/5.0'},
+    http_cache=None,
+    end_marker=None,
+    max_bytes=None,
+    rate_limiter=None,
+    retry_policy=None,
     verbose=False):
     """ Return data from URL
     """
-    res = http_pool_manager.request('GET', URL, headers=headers)
+    return get_URL_response(
+        URL, 
+        http_pool_manager=http_pool_manager, 
+        headers=headers, 
+        http_cache=http_cache, 
+        end_marker=end_marker, 
+        max_bytes=max_bytes, 
+        rate_limiter=rate_limiter,
+        retry_policy=retry_policy,
+        verbose=verbose
+    ).data
+
+def get_URL_host(URL):
+    """ Return the host part of URL (used to group requests per site)
+    """
+    return _import_urllib3().util.parse_url(URL).host or ""
+
+
+class fetch_job:
+    """ A single URL request handled by URLFetcher.
+
+    'key' is any user supplied value that identifies the job (e.g. a
+    (ticker, URL, parser) tuple) and is handed back untouched once the
+    request completes. 'group' is an optional name (e.g. a provider id)
+    used to apply a separate concurrency limit to a set of jobs. 
+    'end_marker', 'max_bytes' and 'consumer' are passed on to get_URL_response.
+    'template' is the URL before the ticker symbol was filled in, under which
+    the timings of the request are recorded in stats.collector. Once the job
+    has completed, 'response' holds the url_response of the request.
+    """
+    def __init__(self, URL, key=None, group=None, end_marker=None, max_bytes=None, consumer=None, template=None):
+        self.URL        = URL
+        self.key        = key
+        self.group      = group
+        self.end_marker = end_marker
+        self.max_bytes  = max_bytes
+        self.consumer   = consumer
+        self.template   = template
+        self.host     = get_URL_host(URL)
+        self.response = None
+
+
+class URLFetcher:
+    """ Bounded-concurrency fetch stage on top of get_URL_data.
+
+    Jobs are run on a thread pool of 'max_workers' threads while at most
+    'max_per_host' requests are in flight against the same host at any time.
+    Jobs that belong to a group listed in 'group_limits' are further limited 
+    to that many requests in flight for the whole group, and use the pool 
+    manager given for their group in 'group_pools' if any. Results are 
+    yielded in completion order.
+    """
+    def __init__(
+        self, 
+        max_workers=16, 
+        max_per_host=4, 
+        group_limits=None, 
+        http_pool_manager=None, 
+        group_pools=None,
+        http_cache=None,
+        rate_limiter=None,
+        retry_policy=None):
+        self._max_workers  = max(1, int(max_workers))
+        self._max_per_host = max(1, int(max_per_host))
+        self._group_limits = { g: max(1, int(l)) for g, l in (group_limits or {}).items() if l }
+        self._http         = http_pool_manager
+        self._group_pools  = group_pools or {}
+        self._http_cache   = http_cache
+        self._rate_limiter = rate_limiter
+        self._retry_policy = retry_policy
+
+    def _run(self, job):
+        job.response = get_URL_response(
+            job.URL, 
+            http_pool_manager=self._group_pools.get(job.group, self._http), 
+            http_cache=self._http_cache,
+            end_marker=job.end_marker,
+            max_bytes=job.max_bytes,
+            rate_limiter=self._rate_limiter,
+            retry_policy=self._retry_policy,
+            consumer=job.consumer,
+        )
+        _record_stats(job)
+        return job.response.data
+
+    def _can_start(self, job, host_count, group_count):
+        if host_count.get(job.host, 0) >= self._max_per_host:
+            return False
+        limit = self._group_limits.get(job.group, None)
+        if limit is not None and group_count.get(job.group, 0) >= limit:
+            return False
+        return True
+
+    def fetch(self, jobs):
+        """ Fetch all jobs and yield (job, data, error) tuples as they complete.
+
+        'error' is None on success, otherwise it holds the raised exception
+        and 'data' is None.
+        """
+        waiting = list(jobs)
+        if not waiting:
+            return
+
+        host_count  = {}
+        group_count = {}
+        running     = {}
+
+        with ThreadPoolExecutor(max_workers=min(self._max_workers, len(waiting))) as executor:
+            try:
+                while waiting or running:
+                    # Start as many waiting jobs as the host and group limits allow.
+                    # Jobs are only handed to the pool when they can run straight
+                    # away, so a busy host never holds up worker threads.
+                    idx = 0
+                    while idx < len(waiting) and len(running) < self._max_workers:
+                        job = waiting[idx]
+                        if self._can_start(job, host_count, group_count):
+                            del waiting[idx]
+                            host_count[job.host]   = host_count.get(job.host, 0) + 1
+                            group_count[job.group] = group_count.get(job.group, 0) + 1
+                            running[executor.submit(self._run, job)] = job
+                        else:
+                            idx += 1
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        host_count[job.host]   -= 1
+                        group_count[job.group] -= 1
+                        try:
+                            data = future.result()
+                        except Exception as e:
+                            stats.collector.count("errors", 1, job.group, job.template or job.URL)
+                            yield job, None, e
+                        else:
+                            yield job, data, None
+            finally:
+                # If the consumer stops early, do not wait for requests that
+                # have not started yet.
+                for future in running:
+                    future.cancel()
 
-    if res.status==200:
-        return res.data.decode("utf-8")
+def _record_stats(job):
+    # Record the timings of a completed job under its group (provider id) 
+    # and URL template
+    response = job.response
+    template = job.template or job.URL
+    if response.wait_time:
+        stats.collector.record("http_wait", response.wait_time, job.group, template)
+    if response.not_modified:
+        stats.collector.count("not_modified", 1, job.group, template)
     else:
-        raise urllib3.exceptions.ResponseError
\ No newline at end of file
+        stats.collector.record("download", response.read_time, job.group, template)
+        stats.collector.count("chars", len(response.data), job.group, template)
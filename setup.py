@@ -44,6 +44,12 @@ setup_ = setuptools.setup(
     test_suite="nose.collector",
     tests_require=["nose"],
     install_requires= ["colorama", "appdirs", "urllib3", "prompt_toolkit", "pytz", "tqdm"],
+    extras_require={
+        "brotli": ["brotli"],
+        "numpy": ["numpy"],
+        "orjson": ["orjson"],
+        "msgpack": ["msgpack"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,60 @@
+import io, json, shutil, tempfile, unittest
+from fini import batch
+from benchmarks import replay, scenarios
+
+QUOTE_URL = "https://www.zacks.com/stock/quote/{ticker}?q={ticker}"
+
+def _set_price(store, price, updated):
+    # Serve the quote page recorded in the benchmark fixtures with another
+    # last price and update time
+    fixture = replay.fixture_store().find(QUOTE_URL.format(ticker="AAPL"))
+    body = fixture["body"].decode("utf-8").replace(
+        "<p class=\"last_price\">$119.26", "<p class=\"last_price\">${:.2f}".format(price)).replace(
+        "<span id=\"timestamp\">Nov 13, 2020 12:45 PM", "<span id=\"timestamp\">" + updated)
+    store.save(QUOTE_URL, "AAPL", 200, fixture["headers"], body)
+
+
+class BatchOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.fixtures_path = tempfile.mkdtemp(prefix="fini-test-")
+        shutil.copytree(replay.FIXTURES_PATH, self.fixtures_path, dirs_exist_ok=True)
+        self.store = replay.fixture_store(self.fixtures_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.fixtures_path, ignore_errors=True)
+
+    def _run(self, env, output_format):
+        out = io.StringIO()
+        writer = batch._create_writer(output_format, out)
+        for provider_id, ticker, data_ctx in env.pmng.process_all(["AAPL"], ["zacks"], progress=False):
+            writer.write( provider_id, ticker, batch.flatten_data(data_ctx.data_ref()) )
+        return out.getvalue()
+
+    def test_latest_value_is_written(self):
+        with scenarios.benchmark_env(replay.ReplayTransport(self.store), ["zacks"]) as env:
+            _set_price(self.store, 101.5, "Nov 16, 2020 10:00 AM")
+            first = json.loads( self._run(env, "jsonl") )
+            _set_price(self.store, 202.25, "Nov 17, 2020 11:30 AM")
+            second = json.loads( self._run(env, "jsonl") )
+            csv_rows = self._run(env, "csv").splitlines()
+
+        self.assertEqual(first["stock_activity.stock_price"], 101.5)
+        self.assertEqual(second["stock_activity.stock_price"], 202.25)
+        # This list starts with an empty value, so it holds one value more 
+        # than there are records
+        self.assertEqual(second["overview.updated"], "Nov 17, 2020 11:30 AM ET")
+        self.assertIn("zacks,AAPL,stock_activity.stock_price,202.25", csv_rows)
+
+    def test_record_counter_advances(self):
+        with scenarios.benchmark_env(replay.ReplayTransport(self.store), ["zacks"]) as env:
+            for _ in range(3):
+                for _, _, data_ctx in env.pmng.process_all(["AAPL"], ["zacks"], progress=False):
+                    data = data_ctx.data_ref()
+
+        self.assertEqual(data["num_records"], 3)
+        self.assertEqual(data["active_record"], 2)
+        self.assertEqual(len(data["stock_activity"]["stock_price"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
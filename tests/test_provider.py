@@ -0,0 +1,40 @@
+import io, shutil, tempfile, unittest, contextlib
+from benchmarks import replay, scenarios
+from test_batch import QUOTE_URL
+
+
+class MissingFieldTest(unittest.TestCase):
+    def setUp(self):
+        self.fixtures_path = tempfile.mkdtemp(prefix="fini-test-")
+        shutil.copytree(replay.FIXTURES_PATH, self.fixtures_path, dirs_exist_ok=True)
+        self.store = replay.fixture_store(self.fixtures_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.fixtures_path, ignore_errors=True)
+
+    def _remove_beta(self):
+        # Serve the quote page without the anchor of the Beta field
+        fixture = replay.fixture_store().find(QUOTE_URL.format(ticker="AAPL"))
+        body = fixture["body"].decode("utf-8").replace("Beta</a></td>", "</a></td>")
+        self.store.save(QUOTE_URL, "AAPL", 200, fixture["headers"], body)
+
+    def test_lists_stay_aligned_with_records(self):
+        with scenarios.benchmark_env(replay.ReplayTransport(self.store), ["zacks"]) as env:
+            for refresh in range(2):
+                if refresh:
+                    self._remove_beta()
+                for _, _, data_ctx in env.pmng.process_all(["AAPL"], ["zacks"], progress=False):
+                    data = data_ctx.data_ref()
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                env.providers["zacks"].draw_view(pos_x=1, pos_y=1, ticker="AAPL")
+
+        self.assertEqual(data["num_records"], 2)
+        self.assertEqual(len(data["technical"]["beta"]), 2)
+        self.assertIsNotNone(data["technical"]["beta"][0])
+        self.assertIsNone(data["technical"]["beta"][1])
+        self.assertEqual(len(data["stock_activity"]["stock_price"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
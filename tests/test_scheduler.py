@@ -0,0 +1,42 @@
+import shutil, tempfile, unittest
+from fini import batch, managers
+from benchmarks import replay, scenarios
+from test_batch import _set_price
+
+
+class RefreshSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.fixtures_path = tempfile.mkdtemp(prefix="fini-test-")
+        shutil.copytree(replay.FIXTURES_PATH, self.fixtures_path, dirs_exist_ok=True)
+        self.store = replay.fixture_store(self.fixtures_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.fixtures_path, ignore_errors=True)
+
+    def test_refresh_hands_out_latest_values(self):
+        # Flattened as by run_watch
+        refreshed = []
+        def on_refresh(provider_id, ticker, data_ctx):
+            refreshed.append( (provider_id, ticker, batch.flatten_data(data_ctx.data_ref())) )
+
+        with scenarios.benchmark_env(replay.ReplayTransport(self.store), ["zacks"]) as env:
+            # The next refresh is due within the coalesce window, so
+            # refresh_due runs it straight away
+            env.smng.set_setting("stock.stock_update_period_sec", 1)
+            scheduler = managers.RefreshScheduler(env.smng, env.pmng, on_refresh=on_refresh)
+
+            _set_price(self.store, 101.5, "Nov 16, 2020 10:00 AM")
+            scheduler.add(["AAPL"], ["zacks"])
+            self.assertEqual(scheduler.refresh_due(), [("AAPL", "zacks")])
+
+            _set_price(self.store, 202.25, "Nov 17, 2020 11:30 AM")
+            self.assertEqual(scheduler.refresh_due(), [("AAPL", "zacks")])
+
+        self.assertEqual([ (p, t) for p, t, _ in refreshed ], [("zacks", "AAPL"), ("zacks", "AAPL")])
+        self.assertEqual(refreshed[0][2]["stock_activity.stock_price"], 101.5)
+        self.assertEqual(refreshed[1][2]["stock_activity.stock_price"], 202.25)
+        self.assertEqual(refreshed[1][2]["overview.updated"], "Nov 17, 2020 11:30 AM ET")
+
+
+if __name__ == "__main__":
+    unittest.main()